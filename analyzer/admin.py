@@ -1,6 +1,12 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import City, Apartment, MarketOffer, AnalysisReport
+
+from utils.site_stats import site_stats
+
+from .models import (
+    City, Building, Apartment, MarketOffer, ArchivedMarketOffer, OfferPriceHistory, MarketOverview, GeocodingTask,
+    GeocodeCacheEntry, AnalysisReport
+)
 
 
 @admin.register(City)
@@ -16,6 +22,14 @@ class CityAdmin(admin.ModelAdmin):
     apartments_count.short_description = 'Количество квартир'
 
 
+@admin.register(Building)
+class BuildingAdmin(admin.ModelAdmin):
+    list_display = ('address', 'city', 'latitude', 'longitude', 'location_precision', 'location_source', 'updated_at')
+    list_filter = ('city', 'location_precision', 'location_source')
+    search_fields = ('address', 'key')
+    readonly_fields = ('key', 'created_at', 'updated_at')
+
+
 @admin.register(Apartment)
 class ApartmentAdmin(admin.ModelAdmin):
     list_display = (
@@ -50,14 +64,73 @@ class MarketOfferAdmin(admin.ModelAdmin):
     list_filter = ('city', 'source', 'is_active', 'rooms')
     search_fields = ('address', 'external_id')
     readonly_fields = ('parsed_date',)
+    raw_id_fields = ('duplicate_of', 'building')
     list_editable = ('is_active',)
 
+    # Сигналов для предложений нет (см. analyzer.signals): счетчики сайта сбрасываем здесь
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        site_stats.invalidate()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        site_stats.invalidate()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        site_stats.invalidate()
+
     def price_per_sqm_display(self, obj):
         return f"{obj.price_per_sqm()} руб./м²"
 
     price_per_sqm_display.short_description = 'Цена за м²'
 
 
+@admin.register(ArchivedMarketOffer)
+class ArchivedMarketOfferAdmin(admin.ModelAdmin):
+    list_display = ('address', 'city', 'area', 'rooms', 'price', 'source', 'parsed_date', 'archived_at')
+    list_filter = ('city', 'source', 'rooms')
+    search_fields = ('address', 'external_id')
+    readonly_fields = ('archived_at',)
+
+
+@admin.register(OfferPriceHistory)
+class OfferPriceHistoryAdmin(admin.ModelAdmin):
+    list_display = ('offer_id', 'city', 'rooms', 'price', 'recorded_at')
+    list_filter = ('city', 'rooms')
+    search_fields = ('=offer_id',)
+
+
+@admin.register(MarketOverview)
+class MarketOverviewAdmin(admin.ModelAdmin):
+    list_display = (
+        'city', 'rooms', 'data_version', 'offers_count',
+        'avg_price', 'median_price', 'min_price', 'max_price', 'created_at'
+    )
+    list_filter = ('city', 'rooms')
+    readonly_fields = ('created_at',)
+    exclude = ('chart_image_base64',)
+
+
+@admin.register(GeocodingTask)
+class GeocodingTaskAdmin(admin.ModelAdmin):
+    list_display = ('address', 'city', 'kind', 'object_id', 'status', 'attempts', 'last_error', 'next_attempt_at', 'updated_at')
+    list_filter = ('status', 'kind', 'city')
+    search_fields = ('address',)
+    readonly_fields = ('created_at', 'updated_at')
+
+
+@admin.register(GeocodeCacheEntry)
+class GeocodeCacheEntryAdmin(admin.ModelAdmin):
+    list_display = (
+        'address_key', 'city_key', 'latitude', 'longitude', 'precision', 'source',
+        'failure_reason', 'failures', 'retry_after', 'updated_at'
+    )
+    list_filter = ('precision', 'source', 'failure_reason', 'city_key')
+    search_fields = ('address_key', 'display_name')
+    readonly_fields = ('created_at', 'updated_at')
+
+
 @admin.register(AnalysisReport)
 class AnalysisReportAdmin(admin.ModelAdmin):
     list_display = (
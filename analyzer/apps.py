@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AnalyzerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'analyzer'
+
+    def ready(self):
+        # Сброс кэша счетчиков сайта при изменении данных
+        from . import signals  # noqa: F401
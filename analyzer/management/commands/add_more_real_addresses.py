@@ -221,7 +221,7 @@ class Command(BaseCommand):
                 pass
 
         self.stdout.write(f"\n📌 ДЛЯ ОБНОВЛЕНИЯ КООРДИНАТ:")
-        self.stdout.write(f"   python manage.py update_coords_batch --delay 2.0 --skip-existing")
+        self.stdout.write(f"   python manage.py geocode_addresses")
         self.stdout.write(f"\n💡 Совет: запустите обновление координат для новых адресов!")
 
     def _get_price_multiplier(self, city_name, district):
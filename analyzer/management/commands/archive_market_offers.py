@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+from analyzer.models import City
+from utils.offer_archive import offer_archiver
+import time
+
+
+class Command(BaseCommand):
+    help = ('Перенос предложений, неактивных дольше срока хранения, в архив. '
+            'Рассчитан на запуск по расписанию (cron), например раз в сутки')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days',
+            type=int,
+            default=None,
+            help='Срок хранения неактивных предложений (по умолчанию OFFER_ARCHIVE_RETENTION_DAYS)'
+        )
+        parser.add_argument(
+            '--city',
+            type=str,
+            help='Название конкретного города'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество предложений в одной транзакции'
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            default=0,
+            help='Максимальное количество пакетов за запуск (0 = все)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, сколько предложений будет перенесено'
+        )
+
+    def handle(self, *args, **options):
+        retention_days = options['retention_days']
+        if retention_days is None:
+            retention_days = offer_archiver.retention_days()
+
+        city = None
+        if options['city']:
+            city = City.objects.filter(name__icontains=options['city']).first()
+            if city is None:
+                self.stdout.write(self.style.ERROR(f"Город не найден: {options['city']}"))
+                return
+
+        pending = offer_archiver.archivable(retention_days, city).count()
+        self.stdout.write(f"Неактивны дольше {retention_days} дней: {pending} предложений")
+        if options['dry_run'] or not pending:
+            return
+
+        started = time.monotonic()
+        stats = offer_archiver.archive(
+            retention_days, city,
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Перенесено в архив {stats['archived']} предложений ({stats['batches']} пакетов) "
+            f"за {time.monotonic() - started:.1f} сек"
+        ))
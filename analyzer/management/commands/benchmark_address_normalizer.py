@@ -0,0 +1,102 @@
+from django.core.management.base import BaseCommand
+from utils.address_normalizer import AddressNormalizer
+from utils.fake_sources import CITY_CENTERS, STREETS
+import random
+import time
+
+# Написания адреса, которые встречаются у источников и в ручном вводе
+SPELLINGS = (
+    'ул. {street}, {house}',
+    'улица {street} {house}',
+    '{street} ул., д. {house}',
+    '{city}, ул. {street}, д. {house}, кв. {flat}',
+    'пр. {street}, {house} к{building}',
+    '{street} проспект, {house}',
+    'пр-кт {street}, д. {house} корп. {building}',
+    '{rooms}-к квартира, {area} м², ул. {street}, {house}',
+    'Россия, г. {city}, {street} улица, {house}/{building}',
+    'пер. {street}, {house}',
+)
+
+
+def legacy_normalize(text):
+    """Прежний ключ кэша: цепочка замен по словам"""
+    abbreviations = {
+        'улица': 'ул', 'проспект': 'пр', 'просп': 'пр', 'пр-кт': 'пр', 'переулок': 'пер',
+        'набережная': 'наб', 'площадь': 'пл', 'шоссе': 'ш', 'бульвар': 'б-р', 'бул': 'б-р',
+        'аллея': 'ал', 'проезд': 'пр-д', 'дом': 'д', 'корпус': 'к', 'корп': 'к', 'строение': 'стр',
+    }
+    text = (text or '').lower().replace('ё', 'е')
+    for separator in '.,;':
+        text = text.replace(separator, ' ')
+    return ' '.join(abbreviations.get(word, word) for word in text.split())
+
+
+class Command(BaseCommand):
+    help = 'Замер нормализации адресов: прежние замены, разбор без запоминания и с LRU-кэшем'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=200000,
+            help='Адресов в потоке'
+        )
+        parser.add_argument(
+            '--unique',
+            type=int,
+            default=20000,
+            help='Различных адресов в потоке (повторы — как у парсеров и очереди геокодирования)'
+        )
+        parser.add_argument(
+            '--cache-size',
+            type=int,
+            default=65536,
+            help='Размер LRU-кэша нормализатора'
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        corpus = [self._address(rng) for _ in range(options['unique'])]
+        stream = [rng.choice(corpus) for _ in range(options['count'])]
+        self.stdout.write(f"Адресов {len(stream)}, различных {len(set(stream))}")
+
+        normalizer = AddressNormalizer(cache_size=options['cache_size'])
+        cases = (
+            ('прежние замены', legacy_normalize),
+            ('разбор без кэша', normalizer._key),
+            ('разбор + LRU', normalizer.key),
+        )
+        for name, normalize in cases:
+            started = time.perf_counter()
+            for address in stream:
+                normalize(address)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"  {name:<16} {elapsed:7.3f} сек  {len(stream) / elapsed:>10,.0f} адр./сек".replace(',', ' ')
+            )
+
+        info = normalizer.key.cache_info()
+        self.stdout.write(self.style.SUCCESS(
+            f"LRU: попаданий {info.hits}, промахов {info.misses} "
+            f"({info.hits / (info.hits + info.misses):.0%}), записей {info.currsize}"
+        ))
+
+        merged = len({normalizer.key(address) for address in corpus})
+        legacy = len({legacy_normalize(address) for address in corpus})
+        self.stdout.write(
+            f"Различных ключей: {merged} (прежних {legacy}) — одинаковые адреса "
+            f"в разных написаниях теперь дают один ключ"
+        )
+
+    @staticmethod
+    def _address(rng):
+        return rng.choice(SPELLINGS).format(
+            city=rng.choice(list(CITY_CENTERS)),
+            street=rng.choice(STREETS),
+            house=rng.randint(1, 150),
+            building=rng.randint(1, 5),
+            flat=rng.randint(1, 300),
+            rooms=rng.randint(1, 4),
+            area=round(rng.uniform(25, 90), 1),
+        )
@@ -0,0 +1,183 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from utils.reliable_yandex_parser import reliable_parser
+from utils.fake_sources import generate_page
+from pathlib import Path
+import json
+import random
+import re
+import time
+import tracemalloc
+
+
+def legacy_parse_html(html, city_name, limit):
+    """Прежний разбор страницы целиком (DOTALL-регулярки + json.loads всего состояния)"""
+    offers = []
+
+    script_pattern = r'<script[^>]*>window\.__INITIAL_STATE__\s*=\s*({.*?})</script>'
+    match = re.search(script_pattern, html, re.DOTALL)
+
+    if match:
+        def search_in_dict(obj):
+            if isinstance(obj, dict):
+                if all(key in obj for key in ['price', 'area', 'rooms']):
+                    offer = reliable_parser._extract_offer_data(obj, city_name)
+                    if offer:
+                        offers.append(offer)
+                for value in obj.values():
+                    search_in_dict(value)
+            elif isinstance(obj, list):
+                for item in obj:
+                    search_in_dict(item)
+
+        search_in_dict(json.loads(match.group(1)))
+        offers = offers[:limit]
+
+    if not offers:
+        offer_pattern = r'data-testid="offer-card"[^>]*>.*?<a[^>]*href="([^"]*)"[^>]*>.*?<span[^>]*data-testid="offer-card__title"[^>]*>([^<]*)</span>.*?<span[^>]*data-testid="offer-card__price"[^>]*>([^<]*)</span>'
+        for url, title, price_text in re.findall(offer_pattern, html, re.DOTALL)[:limit]:
+            offer = reliable_parser._parse_html_card(url, title, price_text, city_name)
+            if offer:
+                offers.append(offer)
+
+    return offers
+
+
+class Command(BaseCommand):
+    help = 'Замер потокового извлечения предложений из HTML против прежних регулярок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fixtures',
+            type=str,
+            default=str(Path(settings.BASE_DIR) / 'fixtures' / 'yandex_pages'),
+            help='Каталог с сохраненными страницами (*.html)'
+        )
+        parser.add_argument(
+            '--generate',
+            type=int,
+            default=0,
+            help='Сгенерировать столько синтетических страниц в каталог фикстур'
+        )
+        parser.add_argument(
+            '--offers',
+            type=int,
+            default=300,
+            help='Предложений на синтетической странице'
+        )
+        parser.add_argument(
+            '--padding-kb',
+            type=int,
+            default=1024,
+            help='Объем шумовой разметки на синтетической странице (КБ)'
+        )
+        parser.add_argument(
+            '--from-cache',
+            action='store_true',
+            help='Скопировать страницы Яндекс.Недвижимости из HTTP-кэша в каталог фикстур'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=20,
+            help='Лимит предложений при разборе (как у парсера по умолчанию)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Количество повторов замера'
+        )
+
+    def handle(self, *args, **options):
+        fixtures_dir = Path(options['fixtures'])
+        fixtures_dir.mkdir(parents=True, exist_ok=True)
+
+        if options['generate']:
+            random.seed(42)
+            variants = ('state', 'cards', 'changed')
+            for i in range(options['generate']):
+                # Чередуем варианты, чтобы проверить и разбор карточек
+                page = generate_page(options['offers'], variants[i % len(variants)], options['padding_kb'])
+                (fixtures_dir / f"synthetic_{i + 1}.html").write_text(page, encoding='utf-8')
+            self.stdout.write(f"Сгенерировано страниц: {options['generate']}")
+
+        if options['from_cache']:
+            self._copy_from_cache(fixtures_dir)
+
+        pages = sorted(fixtures_dir.glob('*.html'))
+        if not pages:
+            self.stdout.write(self.style.WARNING(
+                f"В {fixtures_dir} нет страниц. Используйте --generate или --from-cache"
+            ))
+            return
+
+        limit = options['limit']
+        totals = {'legacy': 0.0, 'stream': 0.0}
+
+        for page in pages:
+            html = page.read_text(encoding='utf-8')
+            self.stdout.write(f"\n{page.name} ({len(html) / 1024 / 1024:.1f} МБ)")
+
+            results = {}
+            for name, parse in (
+                ('legacy', lambda: legacy_parse_html(html, 'Москва', limit)),
+                ('stream', lambda: reliable_parser._parse_html_response(html, 'Москва', limit)),
+            ):
+                seconds, peak, offers = self._measure(parse, options['repeat'])
+                totals[name] += seconds
+                results[name] = offers
+                self.stdout.write(
+                    f"  {name:<7} {seconds * 1000:8.1f} мс  пик памяти {peak / 1024 / 1024:6.1f} МБ  "
+                    f"предложений {len(offers)}"
+                )
+
+            same = [self._key(offer) for offer in results['legacy']] == [self._key(offer) for offer in results['stream']]
+            if same:
+                self.stdout.write(self.style.SUCCESS("  результаты совпадают"))
+            else:
+                self.stdout.write(self.style.WARNING("  результаты различаются"))
+
+        speedup = totals['legacy'] / totals['stream'] if totals['stream'] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"\nИтого: прежний разбор {totals['legacy'] * 1000:.1f} мс, "
+            f"потоковый {totals['stream'] * 1000:.1f} мс (x{speedup:.1f})"
+        ))
+
+    def _measure(self, parse, repeat):
+        """Лучшее время из repeat прогонов и пик памяти отдельного прогона"""
+        best = None
+        offers = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            offers = parse()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+
+        tracemalloc.start()
+        parse()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return best, peak, offers
+
+    @staticmethod
+    def _key(offer):
+        return offer['address'], offer['price'], offer['area'], offer['rooms']
+
+    def _copy_from_cache(self, fixtures_dir):
+        from utils.http_client import http_client
+
+        copied = 0
+        for meta_path in http_client.cache.directory.glob('*.json'):
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+            if 'realty.yandex.ru' not in meta.get('url', ''):
+                continue
+            if 'html' not in meta.get('headers', {}).get('Content-Type', ''):
+                continue
+
+            body = meta_path.with_suffix('.body').read_bytes()
+            html = body.decode(meta.get('encoding') or 'utf-8', errors='replace')
+            (fixtures_dir / f"cached_{meta_path.stem[:16]}.html").write_text(html, encoding='utf-8')
+            copied += 1
+
+        self.stdout.write(f"Скопировано страниц из HTTP-кэша: {copied}")
@@ -0,0 +1,271 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from analyzer.models import City
+from utils.fake_sources import FakeSourceServer, CITY_CENTERS, write_gazetteer
+from utils.gazetteer import Gazetteer
+from utils.geocoding_service import GazetteerBackend, geocoding_service
+from utils.http_client import http_client
+from utils.http_cache import HttpResponseCache
+from utils.rate_limiter import source_rate_limiter
+from utils.real_estate_api import data_collector
+from utils.reliable_yandex_parser import reliable_parser
+from utils.geocoding_queue import geocoding_queue
+from contextlib import contextmanager
+from decimal import Decimal
+from pathlib import Path
+import tempfile
+import time
+
+
+class Command(BaseCommand):
+    help = ('Замер сбора рыночных данных (update_market_data) и геокодирования '
+            'на локальном тестовом сервере источников. Замер идет во временной базе: '
+            'рабочие предложения, очередь и кэш геокодирования не затрагиваются')
+
+    # Средняя цена м² для городов временной базы
+    BENCHMARK_AVG_PRICE_PER_SQM = Decimal('1000')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--cities',
+            nargs='*',
+            help='Города для обновления (по умолчанию все города тестового сервера)'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=50,
+            help='Количество предложений на город и источник'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Количество городов, обновляемых параллельно'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=2,
+            help='Количество прогонов (со второго ответы перепроверяются по ETag)'
+        )
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0.05,
+            help='Задержка ответа тестового сервера (сек)'
+        )
+        parser.add_argument(
+            '--jitter',
+            type=float,
+            default=0.0,
+            help='Случайная добавка к задержке (сек)'
+        )
+        parser.add_argument(
+            '--error-rate',
+            type=float,
+            default=0.0,
+            help='Доля ответов 5xx'
+        )
+        parser.add_argument(
+            '--server-rate-limit',
+            type=float,
+            default=0.0,
+            help='Запросов в секунду на маршрут, сверх — 429 (0 = без лимита)'
+        )
+        parser.add_argument(
+            '--offers-per-page',
+            type=int,
+            default=50,
+            help='Предложений на странице тестового сервера'
+        )
+        parser.add_argument(
+            '--no-client-rate-limit',
+            action='store_true',
+            help='Отключить собственный лимит частоты запросов к источникам (SOURCE_RATE_LIMITS)'
+        )
+        parser.add_argument(
+            '--geocode',
+            type=int,
+            default=0,
+            help='После сбора обработать столько заданий очереди геокодирования'
+        )
+        parser.add_argument(
+            '--gazetteer',
+            type=float,
+            default=None,
+            help='Геокодировать через тестовый газеттир с такой долей известных домов (0..1)'
+        )
+        parser.add_argument(
+            '--serve',
+            action='store_true',
+            help='Только запустить тестовый сервер (до Ctrl+C) и вывести HTTP_HOST_OVERRIDES'
+        )
+        parser.add_argument(
+            '--port',
+            type=int,
+            default=0,
+            help='Порт тестового сервера (0 = любой свободный)'
+        )
+
+    def handle(self, *args, **options):
+        server = FakeSourceServer(
+            port=options['port'],
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            rate_limit=options['server_rate_limit'],
+            offers_per_page=options['offers_per_page'],
+        )
+
+        if options['serve']:
+            self._serve(server)
+            return
+
+        city_names = options['cities'] or list(CITY_CENTERS)
+        unknown = [name for name in city_names if name not in CITY_CENTERS]
+        if unknown:
+            raise CommandError(
+                f"Города неизвестны тестовому серверу: {', '.join(unknown)} (доступны: {', '.join(CITY_CENTERS)})"
+            )
+
+        sources = {'yandex_real': reliable_parser}
+        try:
+            from utils.avito_api import avito_parser
+            sources['avito'] = avito_parser
+        except ImportError:
+            self.stdout.write(self.style.WARNING("Avito пропущен: не установлен beautifulsoup4"))
+
+        # Подменяем источники, хосты, кэш и лимиты только на время замера
+        saved = (data_collector.sources, http_client.host_overrides, http_client.cache, dict(source_rate_limiter.rates),
+                 list(geocoding_service.backends))
+        with server, tempfile.TemporaryDirectory(prefix='rent-bench-cache-') as cache_dir, \
+                self._benchmark_database(Path(cache_dir)):
+            cities = self._create_cities(city_names)
+            data_collector.sources = sources
+            http_client.host_overrides = server.host_overrides()
+            http_client.cache = HttpResponseCache(cache_dir, ttl=0)
+            if options['no_client_rate_limit']:
+                source_rate_limiter.rates = {source: 0 for source in ('yandex_real', 'avito', 'nominatim')}
+            if options['gazetteer'] is not None:
+                path = Path(cache_dir) / 'gazetteer.csv'
+                houses = write_gazetteer(path, coverage=options['gazetteer'])
+                geocoding_service.register(GazetteerBackend(Gazetteer(path)), first=True)
+                self.stdout.write(f"Тестовый газеттир: {houses} домов")
+            try:
+                self.stdout.write(
+                    f"Тестовый сервер {server.url}: задержка {server.latency * 1000:.0f} мс, "
+                    f"ошибок {server.error_rate:.0%}, лимит {server.rate_limit or 'нет'} запр./сек. "
+                    f"Городов {len(cities)}, источников {len(sources)}"
+                )
+                for run in range(1, options['repeat'] + 1):
+                    self._run_refresh(run, cities, options['limit'], options['workers'], server)
+                if options['geocode']:
+                    self._run_geocoding(options['geocode'], server)
+            finally:
+                (data_collector.sources, http_client.host_overrides,
+                 http_client.cache, source_rate_limiter.rates, geocoding_service.backends) = saved
+
+    @contextmanager
+    def _benchmark_database(self, directory: Path):
+        """
+        Временная база на время замера (как у тестов Django): предложения с
+        именами настоящих источников, сводки рынка, задания очереди и кэш
+        геокодирования с координатами тестового Nominatim не попадают в рабочую базу
+        """
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        old_test_name = test_settings.get('NAME')
+        if connection.vendor == 'sqlite':
+            # Файл, а не база в памяти: сбор идет в нескольких потоках
+            test_settings['NAME'] = str(directory / 'benchmark.sqlite3')
+        old_name = connection.settings_dict['NAME']
+        test_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        self.stdout.write(f"Временная база замера: {test_name}")
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            test_settings['NAME'] = old_test_name
+
+    def _create_cities(self, names):
+        return [
+            City.objects.create(
+                name=name,
+                latitude=Decimal(str(CITY_CENTERS[name][0])),
+                longitude=Decimal(str(CITY_CENTERS[name][1])),
+                avg_price_per_sqm=self.BENCHMARK_AVG_PRICE_PER_SQM,
+            )
+            for name in names
+        ]
+
+    def _run_refresh(self, run, cities, limit, workers, server):
+        server.requests.clear()
+        server.statuses.clear()
+
+        started = time.monotonic()
+        results = data_collector.update_all_cities(cities, limit, max_workers=workers)
+        elapsed = time.monotonic() - started
+
+        offers = 0
+        stages = {}
+        errors = 0
+        for result in results:
+            if result['error']:
+                errors += 1
+                self.stdout.write(self.style.ERROR(f"  ✗ {result['city'].name}: {result['error']}"))
+                continue
+            stats = result['stats']
+            offers += stats['inserted'] + stats['updated'] + stats['unchanged']
+            for stage in stats['stages']:
+                total = stages.setdefault(stage['name'], {'items': 0, 'busy': 0.0, 'blocked': 0.0})
+                total['items'] += stage['items_in']
+                total['busy'] += stage['busy_seconds']
+                total['blocked'] += stage['blocked_seconds']
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\nПрогон {run}: {offers} предложений за {elapsed:.2f} сек "
+            f"({offers / elapsed if elapsed else 0:.0f} предл./сек), ошибок городов {errors}"
+        ))
+        for name, total in stages.items():
+            self.stdout.write(
+                f"  {name:<10} {total['items']:>7} шт  занят {total['busy']:7.2f} сек  "
+                f"ожидание очереди {total['blocked']:6.2f} сек"
+            )
+        self._write_server_stats(server)
+
+    def _run_geocoding(self, limit, server):
+        server.requests.clear()
+        server.statuses.clear()
+
+        totals = {'processed': 0, 'geocoded': 0, 'requests': 0, 'failed': 0}
+        started = time.monotonic()
+        while totals['processed'] < limit:
+            stats = geocoding_queue.process_batch(batch_size=min(50, limit - totals['processed']), delay=0)
+            if not stats['processed']:
+                break
+            for key in totals:
+                totals[key] += stats[key]
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\nГеокодирование: заданий {totals['processed']}, запросов {totals['requests']}, "
+            f"геокодировано {totals['geocoded']}, не удалось {totals['failed']} за {elapsed:.2f} сек "
+            f"({totals['processed'] / elapsed if elapsed else 0:.0f} заданий/сек)"
+        ))
+        self._write_server_stats(server)
+
+    def _write_server_stats(self, server):
+        requests_line = ', '.join(f"{route} {count}" for route, count in sorted(server.requests.items()))
+        statuses_line = ', '.join(f"{status}: {count}" for status, count in sorted(server.statuses.items()))
+        self.stdout.write(f"  запросы: {requests_line or 'нет'}")
+        self.stdout.write(f"  статусы: {statuses_line or 'нет'}")
+
+    def _serve(self, server):
+        with server:
+            self.stdout.write(f"Тестовый сервер источников запущен на {server.url}")
+            self.stdout.write(f"Для settings.py:\nHTTP_HOST_OVERRIDES = {server.host_overrides()!r}")
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                self.stdout.write("\nОстановлен")
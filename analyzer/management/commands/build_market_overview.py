@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from analyzer.models import City
+from utils.market_overview import market_overview_builder
+
+
+class Command(BaseCommand):
+    help = 'Предрассчет сводных графиков и статистики рынка по городам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--city',
+            type=str,
+            help='Название конкретного города'
+        )
+
+    def handle(self, *args, **options):
+        city_name = options['city']
+
+        if city_name:
+            cities = City.objects.filter(name__icontains=city_name)
+        else:
+            cities = City.objects.all()
+
+        for city in cities:
+            try:
+                # Пересчитываем сводки для текущей версии данных без обновления предложений
+                overviews = market_overview_builder.build_for_city(city)
+                self.stdout.write(self.style.SUCCESS(
+                    f"  ✓ {city.name} (v{city.market_data_version}): {len(overviews)} сегментов"
+                ))
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"  ✗ {city.name}: ошибка - {e}"))
+
+        self.stdout.write(self.style.SUCCESS("Сводки рынка рассчитаны!"))
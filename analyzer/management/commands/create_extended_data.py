@@ -360,4 +360,4 @@ class Command(BaseCommand):
         self.stdout.write(f"      {total_apartments} квартир пользователей")
         self.stdout.write(f"\nТестовый пользователь: {user.username} (пароль: testpass123)")
         self.stdout.write(f"\nДЛЯ ОБНОВЛЕНИЯ КООРДИНАТ:")
-        self.stdout.write(f"python manage.py update_all_coords --delay 2.0")
\ No newline at end of file
+        self.stdout.write(f"python manage.py geocode_addresses")
\ No newline at end of file
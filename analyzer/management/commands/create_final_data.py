@@ -163,4 +163,4 @@ class Command(BaseCommand):
         self.stdout.write(f"\nТестовый пользователь: {user.username}")
         self.stdout.write(f"Пароль: testpass123")
         self.stdout.write(f"\nДля обновления координат запустите:")
-        self.stdout.write(f"python manage.py update_coords_simple")
\ No newline at end of file
+        self.stdout.write(f"python manage.py geocode_addresses")
\ No newline at end of file
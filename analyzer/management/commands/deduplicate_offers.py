@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from analyzer.models import City
+from utils.offer_dedup import offer_deduplicator
+from utils.market_overview import market_overview_builder
+import time
+
+
+class Command(BaseCommand):
+    help = 'Поиск дублей предложений из разных источников и пересчет сводок рынка'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--city',
+            type=str,
+            help='Название конкретного города'
+        )
+        parser.add_argument(
+            '--skip-overview',
+            action='store_true',
+            help='Не пересчитывать сводки рынка'
+        )
+
+    def handle(self, *args, **options):
+        if options['city']:
+            cities = City.objects.filter(name__icontains=options['city'])
+        else:
+            cities = City.objects.all()
+
+        totals = {'offers': 0, 'clusters': 0, 'duplicates': 0}
+        started = time.monotonic()
+
+        for city in cities:
+            city_started = time.monotonic()
+            stats = offer_deduplicator.cluster_city(city)
+            for key in totals:
+                totals[key] += stats[key]
+
+            if not options['skip_overview']:
+                data_version = market_overview_builder.bump_data_version(city)
+                market_overview_builder.build_for_city(city, data_version)
+
+            self.stdout.write(
+                f"  {city.name}: предложений {stats['offers']}, кластеров {stats['clusters']}, "
+                f"дублей {stats['duplicates']} ({time.monotonic() - city_started:.1f} сек)"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\nГотово за {time.monotonic() - started:.1f} сек! Предложений {totals['offers']}, "
+            f"кластеров {totals['clusters']}, дублей {totals['duplicates']}"
+        ))
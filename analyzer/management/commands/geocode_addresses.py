@@ -0,0 +1,112 @@
+from django.core.management.base import BaseCommand
+from analyzer.models import City, GeocodingTask
+from utils.bulk_geocoder import BulkGeocoder
+
+
+class Command(BaseCommand):
+    help = ('Массовое геокодирование домов, предложений и квартир: уникальные адреса, общий кэш, '
+            'параллельные запросы на пределе лимита и продолжение прерванного запуска')
+
+    # Дома первыми: их координаты сразу получают все предложения и квартиры дома
+    KINDS = {
+        'buildings': [GeocodingTask.KIND_BUILDING],
+        'offers': [GeocodingTask.KIND_MARKET_OFFER],
+        'apartments': [GeocodingTask.KIND_APARTMENT],
+        'all': [GeocodingTask.KIND_BUILDING, GeocodingTask.KIND_MARKET_OFFER, GeocodingTask.KIND_APARTMENT],
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--type',
+            choices=list(self.KINDS),
+            default='all',
+            help='Тип объектов'
+        )
+        parser.add_argument(
+            '--city',
+            type=str,
+            help='Название конкретного города'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Перегеокодировать и объекты, у которых уже есть координаты'
+        )
+        parser.add_argument(
+            '--refresh-cache',
+            action='store_true',
+            help='Не брать из кэша геокодирования координаты и паузы после неудач, а запросить заново'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Параллельных запросов (по умолчанию GEOCODING_BULK_WORKERS)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Объектов в пакете (после каждого пакета сохраняется контрольная точка)'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=0,
+            help='Обработать не больше стольких объектов за запуск (0 = все)'
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Начать заново, не продолжая с контрольной точки'
+        )
+
+    def handle(self, *args, **options):
+        city = None
+        if options['city']:
+            city = City.objects.filter(name__icontains=options['city']).first()
+            if city is None:
+                self.stdout.write(self.style.ERROR(f"Город не найден: {options['city']}"))
+                return
+
+        geocoder = BulkGeocoder(
+            kinds=self.KINDS[options['type']],
+            city=city,
+            only_missing=not options['all'],
+            refresh_cache=options['refresh_cache'],
+            workers=options['workers'],
+            chunk_size=options['chunk_size'],
+        )
+
+        if options['restart']:
+            geocoder.clear_checkpoint()
+        elif geocoder.load_checkpoint():
+            self.stdout.write(
+                f"Продолжаем с контрольной точки: уже обработано {geocoder.stats['objects']} объектов"
+            )
+
+        self.stdout.write(f"Осталось обработать: {geocoder.pending_count()} объектов")
+
+        stats = geocoder.run(limit=options['limit'], progress=self._write_progress)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\nОбъектов {stats['objects']}, уникальных адресов {stats['addresses']} "
+            f"(из газеттира {stats['local_hits']}, из кэша {stats['cache_hits']}, запросов {stats['requests']}, {stats['rate']:.2f} запр./сек)"
+        ))
+        if stats['backoff']:
+            self.stdout.write(
+                f"Пропущено адресов на паузе после прежних неудач: {stats['backoff']} "
+                f"(--refresh-cache запросит их сейчас)"
+            )
+        self.stdout.write(
+            f"Геокодировано адресов {stats['geocoded']}, не найдено {stats['failed']}, "
+            f"обновлено объектов {stats['updated']} за {stats['seconds']:.1f} сек"
+        )
+        if not stats['completed']:
+            self.stdout.write("Обработаны не все объекты: повторный запуск продолжит с контрольной точки")
+
+    def _write_progress(self, kind, stats):
+        self.stdout.write(
+            f"  {kind}: объектов {stats['objects']}, адресов {stats['addresses']}, "
+            f"запросов {stats['requests']}, обновлено {stats['updated']}"
+        )
@@ -0,0 +1,146 @@
+from django.core.management.base import BaseCommand, CommandError
+from analyzer.models import City
+from utils.offer_loader import offer_file_loader
+from utils.real_estate_api import data_collector
+from utils.market_overview import market_overview_builder
+from utils.geocoding_queue import geocoding_queue
+from utils.site_stats import site_stats
+from pathlib import Path
+import time
+
+
+class Command(BaseCommand):
+    help = 'Потоковая загрузка предложений из файла (CSV, JSONL, Parquet)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            type=str,
+            help='Файл выгрузки (CSV и JSONL могут быть сжаты gzip)'
+        )
+        parser.add_argument(
+            '--format',
+            choices=offer_file_loader.FORMATS,
+            help='Формат файла (по умолчанию по расширению)'
+        )
+        parser.add_argument(
+            '--city',
+            type=str,
+            help='Город для строк без колонки city'
+        )
+        parser.add_argument(
+            '--source',
+            type=str,
+            default='import',
+            help='Источник для строк без колонки source'
+        )
+        parser.add_argument(
+            '--delimiter',
+            type=str,
+            default=',',
+            help='Разделитель CSV'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Количество строк в одном пакете записи'
+        )
+        parser.add_argument(
+            '--max-errors',
+            type=int,
+            default=0,
+            help='Прервать загрузку после стольких некорректных строк (0 = без ограничения)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только проверить строки, ничего не записывая'
+        )
+        parser.add_argument(
+            '--skip-overview',
+            action='store_true',
+            help='Не пересчитывать сводки рынка затронутых городов'
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.is_file():
+            raise CommandError(f"Файл не найден: {path}")
+
+        try:
+            file_format = options['format'] or offer_file_loader.detect_format(path)
+        except ValueError as e:
+            raise CommandError(str(e))
+        if file_format == 'parquet' and not offer_file_loader.parquet_available:
+            raise CommandError("Для загрузки Parquet установите pyarrow: pip install pyarrow")
+
+        default_city = None
+        if options['city']:
+            default_city = City.objects.filter(name__icontains=options['city']).first()
+            if default_city is None:
+                raise CommandError(f"Город не найден: {options['city']}")
+
+        chunk_size = max(1, options['chunk_size'])
+        max_errors = options['max_errors']
+        dry_run = options['dry_run']
+
+        self.stdout.write(
+            f"Загрузка {path.name} ({file_format}), пакет {chunk_size} строк"
+            + (" — проверка без записи" if dry_run else "")
+        )
+
+        totals = {'rows': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'invalid': 0}
+        city_ids = set()
+        shown_errors = 0
+        started = time.monotonic()
+        last_report = started
+
+        rows = offer_file_loader.iter_rows(path, file_format, options['delimiter'], chunk_size)
+        for chunk in offer_file_loader.iter_chunks(rows, chunk_size):
+            stats = offer_file_loader.load_chunk(
+                data_collector, chunk, default_city, options['source'], dry_run=dry_run
+            )
+            for key in totals:
+                totals[key] += stats[key]
+            city_ids |= stats['city_ids']
+
+            # Первые ошибки показываем, остальные только считаем
+            for line_number, error in stats['errors']:
+                if shown_errors < 20:
+                    self.stdout.write(self.style.WARNING(f"  строка {line_number}: {error}"))
+                shown_errors += 1
+
+            if max_errors and totals['invalid'] >= max_errors:
+                raise CommandError(
+                    f"Слишком много некорректных строк ({totals['invalid']}), загрузка прервана. "
+                    f"Уже записанные пакеты сохранены"
+                )
+
+            now = time.monotonic()
+            if now - last_report >= 5:
+                last_report = now
+                self.stdout.write(
+                    f"  {totals['rows']} строк, {totals['rows'] / (now - started):.0f} строк/сек"
+                )
+
+        elapsed = time.monotonic() - started
+
+        # Пакетная запись не вызывает сигналов моделей: счетчики сайта сбрасываем один раз
+        if totals['inserted'] or totals['updated']:
+            site_stats.invalidate()
+
+        if city_ids and not dry_run and not options['skip_overview']:
+            for city in City.objects.filter(id__in=city_ids):
+                data_version = market_overview_builder.bump_data_version(city)
+                market_overview_builder.build_for_city(city, data_version)
+            self.stdout.write(f"Сводки рынка пересчитаны для городов: {len(city_ids)}")
+
+        rate = totals['rows'] / elapsed if elapsed > 0 else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"\nГотово за {elapsed:.1f} сек ({rate:.0f} строк/сек)! Строк {totals['rows']}, "
+            f"добавлено {totals['inserted']}, обновлено {totals['updated']}, "
+            f"без изменений {totals['unchanged']}, некорректных {totals['invalid']}"
+        ))
+        if not dry_run:
+            self.stdout.write(f"Заданий в очереди геокодирования: {geocoding_queue.pending_count()}")
@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand
+from utils.geocoding_queue import geocoding_queue
+import time
+
+
+class Command(BaseCommand):
+    help = 'Обработка очереди отложенного геокодирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Количество заданий в одном пакете'
+        )
+        parser.add_argument(
+            '--delay',
+            type=float,
+            default=0.0,
+            help='Дополнительная пауза между запросами к геокодеру (сек); '
+                 'частоту запросов ограничивает общий лимит SOURCE_RATE_LIMITS["nominatim"]'
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            default=0,
+            help='Максимальное количество пакетов (0 = пока очередь не опустеет)'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Не завершаться на пустой очереди, а ждать новые задания'
+        )
+        parser.add_argument(
+            '--idle-sleep',
+            type=float,
+            default=10.0,
+            help='Пауза при пустой очереди в режиме --loop (сек)'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        delay = options['delay']
+        max_batches = options['max_batches']
+
+        self.stdout.write(
+            f"Заданий в очереди: {geocoding_queue.pending_count()} "
+            f"(готовы к обработке {geocoding_queue.due_count()}, остальные ждут паузы после неудачи)"
+        )
+
+        totals = {'processed': 0, 'geocoded': 0, 'requests': 0, 'deferred': 0, 'failed': 0}
+        batch_number = 0
+
+        while not max_batches or batch_number < max_batches:
+            stats = geocoding_queue.process_batch(batch_size=batch_size, delay=delay)
+
+            if not stats['processed']:
+                if options['loop']:
+                    time.sleep(options['idle_sleep'])
+                    continue
+                break
+
+            batch_number += 1
+            for key in totals:
+                totals[key] += stats[key]
+
+            self.stdout.write(
+                f"  Пакет #{batch_number}: заданий {stats['processed']}, запросов {stats['requests']}, "
+                f"геокодировано {stats['geocoded']}, отложено {stats['deferred']}, не удалось {stats['failed']}"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\nГотово! Заданий {totals['processed']}, запросов {totals['requests']}, "
+            f"геокодировано {totals['geocoded']}, отложено {totals['deferred']}, не удалось {totals['failed']}"
+        ))
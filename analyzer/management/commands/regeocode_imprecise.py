@@ -0,0 +1,123 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+from analyzer.models import City, GeocodingTask
+from utils.bulk_geocoder import BulkGeocoder
+
+
+class Command(BaseCommand):
+    help = ('Перегеокодирование объектов с приблизительными координатами (улица, район, центр города): '
+            'сначала города, где больше всего квартир пользователей и предложений')
+
+    # Дома первыми: уточненные координаты сразу получают все предложения и квартиры дома
+    KINDS = {
+        'buildings': [GeocodingTask.KIND_BUILDING],
+        'offers': [GeocodingTask.KIND_MARKET_OFFER],
+        'apartments': [GeocodingTask.KIND_APARTMENT],
+        'all': [GeocodingTask.KIND_BUILDING, GeocodingTask.KIND_APARTMENT, GeocodingTask.KIND_MARKET_OFFER],
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--precision',
+            choices=['house', 'street', 'district'],
+            default='house',
+            help='Уточнять координаты грубее этой точности'
+        )
+        parser.add_argument(
+            '--type',
+            choices=list(self.KINDS),
+            default='all',
+            help='Тип объектов'
+        )
+        parser.add_argument(
+            '--city',
+            type=str,
+            help='Название конкретного города'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=0,
+            help='Обработать не больше стольких объектов за запуск (0 = все)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Параллельных запросов (по умолчанию GEOCODING_BULK_WORKERS)'
+        )
+        parser.add_argument(
+            '--refresh-cache',
+            action='store_true',
+            help='Запросить заново и адреса, для которых в кэше уже есть (приблизительный) ответ геокодера'
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Начать заново, не продолжая с контрольных точек'
+        )
+
+    def handle(self, *args, **options):
+        cities = self._cities_by_demand(options['city'])
+        if not cities:
+            self.stdout.write(self.style.ERROR("Города не найдены"))
+            return
+
+        limit = options['limit']
+        processed = 0
+        totals = {'objects': 0, 'requests': 0, 'updated': 0}
+
+        for city in cities:
+            if limit and processed >= limit:
+                self.stdout.write("Достигнут лимит объектов: повторный запуск продолжит с контрольной точки")
+                break
+
+            geocoder = BulkGeocoder(
+                kinds=self.KINDS[options['type']],
+                city=city,
+                refresh_cache=options['refresh_cache'],
+                workers=options['workers'],
+                precision_below=options['precision'],
+            )
+            if options['restart']:
+                geocoder.clear_checkpoint()
+            else:
+                geocoder.load_checkpoint()
+
+            pending = geocoder.pending_count()
+            if not pending:
+                continue
+            self.stdout.write(
+                f"{city.name} (квартир {city.apartments_count}, предложений {city.active_offers}): "
+                f"приблизительных координат {pending}"
+            )
+
+            objects_before, requests_before, updated_before = (
+                geocoder.stats['objects'], geocoder.stats['requests'], geocoder.stats['updated']
+            )
+            stats = geocoder.run(limit=limit - processed if limit else 0)
+            processed += stats['objects'] - objects_before
+            totals['objects'] += stats['objects'] - objects_before
+            totals['requests'] += stats['requests'] - requests_before
+            totals['updated'] += stats['updated'] - updated_before
+
+            self.stdout.write(
+                f"  уточнено {stats['updated'] - updated_before} из {stats['objects'] - objects_before}, "
+                f"запросов {stats['requests'] - requests_before} (из кэша {stats['cache_hits']}, "
+                f"из газеттира {stats['local_hits']}, на паузе {stats['backoff']})"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\nГотово! Объектов {totals['objects']}, запросов {totals['requests']}, "
+            f"уточнено координат {totals['updated']}"
+        ))
+
+    def _cities_by_demand(self, name=None):
+        """Города по спросу: квартиры пользователей (анализы), затем активные предложения"""
+        cities = City.objects.annotate(
+            apartments_count=Count('apartments', distinct=True),
+            active_offers=Count('market_offers', filter=Q(market_offers__is_active=True), distinct=True),
+        )
+        if name:
+            cities = cities.filter(name__icontains=name)
+        return list(cities.order_by('-apartments_count', '-active_offers', 'name'))
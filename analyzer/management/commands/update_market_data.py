@@ -2,7 +2,9 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from analyzer.models import City
 from utils.real_estate_api import data_collector
+from utils.http_client import http_client
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +24,17 @@ class Command(BaseCommand):
             default=50,
             help='Количество предложений для каждого города'
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Количество городов, обновляемых параллельно (по умолчанию MARKET_REFRESH_MAX_WORKERS)'
+        )
+        parser.add_argument(
+            '--offline',
+            action='store_true',
+            help='Брать ответы источников только из HTTP-кэша, без запросов в сеть'
+        )
 
     def handle(self, *args, **options):
         city_name = options['city']
@@ -32,23 +45,49 @@ class Command(BaseCommand):
         else:
             cities = City.objects.all()
 
-        total_saved = 0
+        if options['offline']:
+            http_client.cache.offline = True
+            self.stdout.write("Режим offline: ответы источников берутся из HTTP-кэша")
+
+        totals = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        started = time.monotonic()
+
+        results = data_collector.update_all_cities(cities, limit, max_workers=options['workers'])
 
-        for city in cities:
-            self.stdout.write(f"Обновление данных для {city.name}...")
-            try:
-                saved = data_collector.update_market_data(city, limit)
-                total_saved += saved
+        for result in results:
+            city = result['city']
+            if result['error']:
                 self.stdout.write(
-                    self.style.SUCCESS(f"  ✓ {city.name}: добавлено {saved} предложений")
+                    self.style.ERROR(f"  ✗ {city.name}: ошибка - {result['error']}")
                 )
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f"  ✗ {city.name}: ошибка - {str(e)}")
+                continue
+
+            stats = result['stats']
+            for key in totals:
+                totals[key] += stats[key]
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"  ✓ {city.name}: добавлено {stats['inserted']}, обновлено {stats['updated']}, "
+                    f"без изменений {stats['unchanged']} "
+                    f"(получение {result['fetch_seconds']:.1f} сек, сохранение {result['store_seconds']:.1f} сек, "
+                    f"всего {result['total_seconds']:.1f} сек)"
                 )
+            )
+            if options['verbosity'] >= 2:
+                self._write_stages(stats['stages'])
 
         self.stdout.write(
             self.style.SUCCESS(
-                f"\nОбновление завершено! Всего добавлено {total_saved} предложений"
+                f"\nОбновление завершено за {time.monotonic() - started:.1f} сек! Всего добавлено {totals['inserted']}, "
+                f"обновлено {totals['updated']}, без изменений {totals['unchanged']} предложений"
+            )
+        )
+
+    def _write_stages(self, stages):
+        """Статистика этапов конвейера загрузки"""
+        for stage in stages:
+            self.stdout.write(
+                f"      {stage['name']:<10} {stage['items_in']:>7} шт  {stage['busy_seconds']:7.2f} сек  "
+                f"{stage['throughput']:9.0f} шт/сек  пакет {stage['avg_batch_ms']:7.1f} мс "
+                f"(макс. {stage['max_batch_ms']:.1f})  ожидание очереди {stage['blocked_seconds']:.2f} сек"
             )
-        )
\ No newline at end of file
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.4 on 2026-10-19 03:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0009_remove_analysisreport_chart_image_data_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='city',
+            name='market_data_version',
+            field=models.PositiveIntegerField(default=0, help_text='Увеличивается после каждого обновления рыночных предложений', verbose_name='Версия рыночных данных'),
+        ),
+        migrations.CreateModel(
+            name='MarketOverview',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rooms', models.IntegerField(default=0, help_text='0 — сводка по всем квартирам города', verbose_name='Количество комнат')),
+                ('data_version', models.PositiveIntegerField(help_text='Версия данных города, по которой построена сводка', verbose_name='Версия рыночных данных')),
+                ('offers_count', models.IntegerField(default=0, verbose_name='Количество предложений')),
+                ('avg_price', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Средняя цена')),
+                ('median_price', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Медианная цена')),
+                ('min_price', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Минимальная цена')),
+                ('max_price', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Максимальная цена')),
+                ('avg_price_per_sqm', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Средняя цена за м²')),
+                ('chart_image_base64', models.TextField(blank=True, null=True, verbose_name='График распределения цен в формате base64')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата расчета')),
+                ('city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='market_overviews', to='analyzer.city', verbose_name='Город')),
+            ],
+            options={
+                'verbose_name': 'Сводка рынка',
+                'verbose_name_plural': 'Сводки рынка',
+                'ordering': ['city', 'rooms'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='marketoverview',
+            constraint=models.UniqueConstraint(fields=('city', 'rooms', 'data_version'), name='unique_market_overview_version'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.4 on 2026-10-19 03:04
+
+from django.db import migrations, models
+
+
+def fill_and_dedupe_external_ids(apps, schema_editor):
+    """Заполняем пустые external_id и разводим дубликаты перед созданием уникального ключа"""
+    MarketOffer = apps.get_model('analyzer', 'MarketOffer')
+
+    for offer in MarketOffer.objects.filter(external_id='').only('id', 'source'):
+        MarketOffer.objects.filter(pk=offer.pk).update(external_id=f"{offer.source}_{offer.pk}")
+
+    seen = set()
+    # Самая свежая запись сохраняет исходный ключ, остальные получают суффикс
+    for offer in MarketOffer.objects.order_by('-id').only('id', 'source', 'external_id').iterator():
+        key = (offer.source, offer.external_id)
+        if key in seen:
+            MarketOffer.objects.filter(pk=offer.pk).update(
+                external_id=f"{offer.external_id}_dup{offer.pk}"[:100]
+            )
+        else:
+            seen.add(key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0010_city_market_data_version_marketoverview'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_and_dedupe_external_ids, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='marketoffer',
+            constraint=models.UniqueConstraint(fields=('source', 'external_id'), name='unique_market_offer_source_external_id'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.4 on 2026-10-19 03:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0011_marketoffer_unique_source_external_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodingTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('market_offer', 'Рыночное предложение'), ('apartment', 'Квартира')], max_length=20, verbose_name='Тип объекта')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='ID объекта')),
+                ('address', models.CharField(max_length=255, verbose_name='Адрес')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('done', 'Выполнено'), ('failed', 'Не удалось')], default='pending', max_length=10, verbose_name='Статус')),
+                ('attempts', models.IntegerField(default=0, verbose_name='Количество попыток')),
+                ('last_error', models.CharField(blank=True, max_length=255, verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата постановки')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='geocoding_tasks', to='analyzer.city', verbose_name='Город')),
+            ],
+            options={
+                'verbose_name': 'Задание геокодирования',
+                'verbose_name_plural': 'Очередь геокодирования',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='analyzer_ge_status_836e47_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='geocodingtask',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_geocoding_task_object'),
+        ),
+    ]
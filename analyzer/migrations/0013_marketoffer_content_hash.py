@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-19 03:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0012_geocodingtask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marketoffer',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, help_text='Хэш полей, обновляемых при повторной загрузке (пустой — неизвестен)', max_length=32, verbose_name='Хэш содержимого'),
+        ),
+    ]
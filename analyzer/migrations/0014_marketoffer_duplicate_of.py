@@ -0,0 +1,19 @@
+# Generated by Django 5.0.4 on 2026-10-19 03:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0013_marketoffer_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marketoffer',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, help_text='Основное предложение кластера дублей из разных источников (пусто — основное или без дублей)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='analyzer.marketoffer', verbose_name='Дубликат предложения'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.4 on 2026-10-19 03:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0014_marketoffer_duplicate_of'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedMarketOffer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('offer_id', models.PositiveBigIntegerField(unique=True, verbose_name='ID предложения')),
+                ('source', models.CharField(max_length=20, verbose_name='Источник данных')),
+                ('external_id', models.CharField(max_length=100, verbose_name='Внешний ID')),
+                ('address', models.CharField(max_length=255, verbose_name='Адрес')),
+                ('area', models.DecimalField(decimal_places=2, max_digits=6, verbose_name='Площадь (м²)')),
+                ('rooms', models.IntegerField(verbose_name='Количество комнат')),
+                ('floor', models.IntegerField(blank=True, null=True, verbose_name='Этаж')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена аренды (руб./мес.)')),
+                ('latitude', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True, verbose_name='Широта')),
+                ('longitude', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True, verbose_name='Долгота')),
+                ('parsed_date', models.DateTimeField(verbose_name='Дата последнего получения')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата архивации')),
+                ('city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_offers', to='analyzer.city', verbose_name='Город')),
+            ],
+            options={
+                'verbose_name': 'Архивное предложение',
+                'verbose_name_plural': 'Архив предложений',
+                'ordering': ['-parsed_date'],
+                'indexes': [models.Index(fields=['city', 'rooms', 'parsed_date'], name='analyzer_ar_city_id_0d19f5_idx'), models.Index(fields=['source', 'external_id'], name='analyzer_ar_source_45bb8c_idx')],
+            },
+        ),
+    ]
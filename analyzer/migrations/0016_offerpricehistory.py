@@ -0,0 +1,50 @@
+# Generated by Django 5.0.4 on 2026-10-19 03:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def seed_current_prices(apps, schema_editor):
+    """Текущая цена существующих предложений — начальная точка истории"""
+    MarketOffer = apps.get_model('analyzer', 'MarketOffer')
+    OfferPriceHistory = apps.get_model('analyzer', 'OfferPriceHistory')
+
+    batch = []
+    rows = MarketOffer.objects.values_list('id', 'city_id', 'rooms', 'price', 'parsed_date')
+    for offer_id, city_id, rooms, price, parsed_date in rows.iterator(chunk_size=2000):
+        batch.append(OfferPriceHistory(
+            offer_id=offer_id, city_id=city_id, rooms=rooms, price=price, recorded_at=parsed_date
+        ))
+        if len(batch) >= 2000:
+            OfferPriceHistory.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        OfferPriceHistory.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0015_archivedmarketoffer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OfferPriceHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('offer_id', models.PositiveBigIntegerField(verbose_name='ID предложения')),
+                ('rooms', models.PositiveSmallIntegerField(verbose_name='Количество комнат')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена аренды (руб./мес.)')),
+                ('recorded_at', models.DateTimeField(verbose_name='Дата')),
+                ('city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_history', to='analyzer.city', verbose_name='Город')),
+            ],
+            options={
+                'verbose_name': 'Изменение цены',
+                'verbose_name_plural': 'История цен',
+                'ordering': ['offer_id', 'recorded_at'],
+                'indexes': [models.Index(fields=['offer_id', 'recorded_at'], name='analyzer_of_offer_i_983bcf_idx'), models.Index(fields=['city', 'rooms', 'recorded_at'], name='analyzer_of_city_id_af058b_idx')],
+            },
+        ),
+        migrations.RunPython(seed_current_prices, migrations.RunPython.noop),
+    ]
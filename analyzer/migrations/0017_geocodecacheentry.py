@@ -0,0 +1,37 @@
+# Generated by Django 5.0.4 on 2026-10-19 03:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0016_offerpricehistory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address_key', models.CharField(max_length=255, verbose_name='Адрес (нормализованный)')),
+                ('city_key', models.CharField(blank=True, max_length=100, verbose_name='Город (нормализованный)')),
+                ('latitude', models.DecimalField(decimal_places=6, max_digits=9, verbose_name='Широта')),
+                ('longitude', models.DecimalField(decimal_places=6, max_digits=9, verbose_name='Долгота')),
+                ('precision', models.CharField(choices=[('house', 'Дом'), ('street', 'Улица'), ('district', 'Район'), ('city', 'Город'), ('unknown', 'Неизвестно')], default='unknown', max_length=10, verbose_name='Точность')),
+                ('source', models.CharField(max_length=30, verbose_name='Источник')),
+                ('display_name', models.CharField(blank=True, max_length=255, verbose_name='Найденный адрес')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Кэш геокодирования',
+                'verbose_name_plural': 'Кэш геокодирования',
+                'ordering': ['city_key', 'address_key'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='geocodecacheentry',
+            constraint=models.UniqueConstraint(fields=('address_key', 'city_key'), name='unique_geocode_cache_key'),
+        ),
+    ]
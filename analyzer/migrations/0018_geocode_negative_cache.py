@@ -0,0 +1,43 @@
+# Generated by Django 5.0.4 on 2026-10-19 04:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0017_geocodecacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='geocodecacheentry',
+            name='failure_reason',
+            field=models.CharField(blank=True, choices=[('not_found', 'Адрес не найден'), ('rate_limited', 'Превышен лимит запросов'), ('http_error', 'Ошибка HTTP'), ('network', 'Сетевая ошибка'), ('error', 'Ошибка геокодера')], max_length=20, verbose_name='Причина неудачи'),
+        ),
+        migrations.AddField(
+            model_name='geocodecacheentry',
+            name='failures',
+            field=models.IntegerField(default=0, verbose_name='Неудач подряд'),
+        ),
+        migrations.AddField(
+            model_name='geocodecacheentry',
+            name='retry_after',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Повторить после'),
+        ),
+        migrations.AddField(
+            model_name='geocodingtask',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Следующая попытка'),
+        ),
+        migrations.AlterField(
+            model_name='geocodecacheentry',
+            name='latitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True, verbose_name='Широта'),
+        ),
+        migrations.AlterField(
+            model_name='geocodecacheentry',
+            name='longitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True, verbose_name='Долгота'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.4 on 2026-10-19 04:16
+
+from django.db import migrations, models
+
+
+def mark_existing_coordinates(apps, schema_editor):
+    """Точность уже сохраненных координат неизвестна: их перепроверит regeocode_imprecise"""
+    for model_name in ('Apartment', 'MarketOffer'):
+        model = apps.get_model('analyzer', model_name)
+        model.objects.filter(latitude__isnull=False, longitude__isnull=False).update(location_precision='unknown')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0018_geocode_negative_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apartment',
+            name='location_precision',
+            field=models.CharField(blank=True, choices=[('house', 'Дом'), ('street', 'Улица'), ('district', 'Район'), ('city', 'Город'), ('unknown', 'Неизвестно')], help_text='Пусто — координат нет', max_length=10, verbose_name='Точность координат'),
+        ),
+        migrations.AddField(
+            model_name='apartment',
+            name='location_source',
+            field=models.CharField(blank=True, help_text='Геокодер (nominatim, gazetteer) или источник объявления', max_length=30, verbose_name='Источник координат'),
+        ),
+        migrations.AddField(
+            model_name='marketoffer',
+            name='location_precision',
+            field=models.CharField(blank=True, choices=[('house', 'Дом'), ('street', 'Улица'), ('district', 'Район'), ('city', 'Город'), ('unknown', 'Неизвестно')], help_text='Пусто — координат нет', max_length=10, verbose_name='Точность координат'),
+        ),
+        migrations.AddField(
+            model_name='marketoffer',
+            name='location_source',
+            field=models.CharField(blank=True, help_text='Геокодер (nominatim, gazetteer), listing — координаты из объявления, import — из файла', max_length=30, verbose_name='Источник координат'),
+        ),
+        migrations.RunPython(mark_existing_coordinates, migrations.RunPython.noop),
+    ]
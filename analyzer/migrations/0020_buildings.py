@@ -0,0 +1,312 @@
+# Generated by Django 5.0.4 on 2026-10-19 04:20
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+LOCATION_FIELDS = ('latitude', 'longitude', 'location_precision', 'location_source')
+PRECISION_RANK = {'house': 4, 'street': 3, 'district': 2, 'city': 1, 'unknown': 0}
+CHUNK_SIZE = 2000
+
+# Замороженная копия utils.address_normalizer на момент миграции: ключи домов
+# должны совпадать с ключами, которые строил код этой версии, а не текущий
+STREET_TYPES = {
+    'ул': ('ул', 'улица'), 'улица': ('ул', 'улица'),
+    'пр': ('пр', 'проспект'), 'пр-т': ('пр', 'проспект'), 'пр-кт': ('пр', 'проспект'),
+    'просп': ('пр', 'проспект'), 'проспект': ('пр', 'проспект'),
+    'пер': ('пер', 'переулок'), 'переулок': ('пер', 'переулок'),
+    'наб': ('наб', 'набережная'), 'набережная': ('наб', 'набережная'),
+    'пл': ('пл', 'площадь'), 'площадь': ('пл', 'площадь'),
+    'ш': ('ш', 'шоссе'), 'шоссе': ('ш', 'шоссе'),
+    'б-р': ('б-р', 'бульвар'), 'бул': ('б-р', 'бульвар'), 'бульвар': ('б-р', 'бульвар'),
+    'ал': ('ал', 'аллея'), 'аллея': ('ал', 'аллея'),
+    'пр-д': ('пр-д', 'проезд'), 'проезд': ('пр-д', 'проезд'),
+    'туп': ('туп', 'тупик'), 'тупик': ('туп', 'тупик'),
+}
+WORD_KINDS = {
+    **{word: ('type', key) for word, (key, _) in STREET_TYPES.items()},
+    'д': ('marker', 'д'), 'дом': ('marker', 'д'),
+    'к': ('building', 'к'), 'корп': ('building', 'к'), 'корпус': ('building', 'к'),
+    'стр': ('building', 'стр'), 'строение': ('building', 'стр'),
+    **{word: ('apartment', word) for word in ('кв', 'квартира', 'оф', 'офис')},
+}
+TOKEN = re.compile(
+    r'(?P<word>[^\W\d_]+(?:-[^\W\d_]+)*)'
+    r'|(?P<sep>[,;])'
+    r'|(?=\d)(?:'
+    r'(?P<noise>\d+\s*-\s*к\w*(?:\s+квартира)?|\d+[.,]?\d*\s*м²|\d+\s*/\s*\d+\s*эт\w*\.?|\d+\s*комн\w*)'
+    r'|(?P<ordinal>\d+-[а-яa-z]{1,2}(?![а-яa-z]))'
+    r'|(?P<number>\d+(?:[а-яa-z](?![а-яa-z\d]))?(?:\s*/\s*\d+[а-яa-z]?)?))'
+)
+POSTCODE = re.compile(r'\d{6}')
+REGION_WORDS = frozenset({'россия', 'рф', 'г', 'город'})
+
+
+def _scan(text):
+    """Токены адреса без шума объявлений: (вид, ключ, текст)"""
+    lowered = text.lower().replace('ё', 'е')
+    original = text if len(lowered) == len(text) else lowered
+    tokens = []
+    pending = None
+    for match in TOKEN.finditer(lowered):
+        kind = match.lastgroup
+        if kind == 'noise':
+            continue
+        value = match.group()
+        raw = original[match.start():match.end()]
+        if kind == 'word':
+            kind, value = WORD_KINDS.get(value, ('word', value))
+        elif kind == 'number':
+            value = value.replace(' ', '')
+        elif kind == 'ordinal':
+            kind = 'word'
+        # Маркер — только перед номером, иначе это обычное слово
+        if pending is not None and kind != 'number':
+            tokens[pending] = ('word', tokens[pending][2].lower().replace('ё', 'е'), tokens[pending][2])
+        pending = len(tokens) if kind in ('marker', 'building', 'apartment') else None
+        tokens.append((kind, value, raw))
+    if pending is not None:
+        tokens[pending] = ('word', tokens[pending][2].lower().replace('ё', 'е'), tokens[pending][2])
+    return tokens
+
+
+def _segments(text):
+    """Части адреса между запятыми без номеров квартир"""
+    segments, segment, skip_number = [], [], False
+    for token in _scan(text):
+        kind = token[0]
+        if kind == 'sep':
+            if segment:
+                segments.append(segment)
+                segment = []
+        elif kind == 'apartment':
+            skip_number = True
+        elif skip_number and kind == 'number':
+            skip_number = False
+        else:
+            segment.append(token)
+    if segment:
+        segments.append(segment)
+    return segments
+
+
+def _join_house(tokens):
+    """[д] номер [буква] [корпус номер] [строение номер] → «5а», «12к1», «7стр2»"""
+    if tokens and tokens[0][0] == 'marker':
+        tokens = tokens[1:]
+    if not tokens or tokens[0][0] != 'number':
+        return None
+    house = tokens[0][1]
+    rest = tokens[1:]
+    if rest and rest[0][0] == 'word' and len(rest[0][1]) == 1 and not house[-1].isalpha():
+        house += rest[0][1]
+        rest = rest[1:]
+    while len(rest) >= 2 and rest[0][0] == 'building' and rest[1][0] == 'number':
+        house += rest[0][1] + rest[1][1]
+        rest = rest[2:]
+    return None if rest else house
+
+
+def _split_street(tokens):
+    street_type = next((key for kind, key, _ in tokens if kind == 'type'), '')
+    name = ' '.join(key for kind, key, _ in tokens if kind != 'type')
+    return name, street_type
+
+
+def _parse(text, city):
+    """(улица, тип улицы, номер дома или None) или None (AddressNormalizer.parse)"""
+    city_key = ' '.join(key for _, key, _ in _scan(city))
+    parts = []
+    for segment in _segments(text):
+        if segment[0][1] in REGION_WORDS:
+            continue
+        if len(segment) == 1 and segment[0][0] == 'number' and POSTCODE.fullmatch(segment[0][1]):
+            continue
+        if ' '.join(key for _, key, _ in segment) == city_key:
+            continue
+        parts.append(segment)
+
+    for index in range(len(parts) - 1, -1, -1):
+        segment = parts[index]
+        house = _join_house(segment)
+        if house is not None:
+            if index == 0:
+                continue
+            name, street_type = _split_street(parts[index - 1])
+            return (name, street_type, house) if name else None
+        for start in range(1, len(segment)):
+            if segment[start][0] in ('number', 'marker'):
+                house = _join_house(segment[start:])
+                if house is not None:
+                    name, street_type = _split_street(segment[:start])
+                    return (name, street_type, house) if name else None
+                break
+
+    for segment in reversed(parts):
+        name, street_type = _split_street(segment)
+        if name and street_type:
+            return name, street_type, None
+    return None
+
+
+def _key(text, city):
+    """Ключ дома (BuildingRegistry.key): улица, тип и номер, иначе нормализованный адрес"""
+    parsed = _parse(text, city)
+    if parsed is None:
+        return ' '.join(key for segment in _segments(text) for kind, key, _ in segment if kind != 'marker')[:255]
+    name, street_type, house = parsed
+    return ' '.join(part for part in (street_type, name, house) if part)[:255]
+
+
+def _display_address(text):
+    """Адрес дома (AddressNormalizer.query), иначе исходный адрес"""
+    parts = []
+    for segment in _segments(text):
+        words = []
+        glue = False
+        for kind, key, raw in segment:
+            if kind == 'marker':
+                continue
+            if kind == 'building':
+                words[-1:] = [''.join(words[-1:]) + key]
+                glue = True
+            elif glue:
+                words[-1] += raw
+                glue = False
+            elif kind == 'type':
+                words.append(STREET_TYPES[key][1])
+            else:
+                words.append(raw)
+        if not words:
+            continue
+        words = ' '.join(words)
+        if parts and segment[0][0] in ('number', 'marker'):
+            parts[-1] = f"{parts[-1]} {words}"
+        else:
+            parts.append(words)
+    return (', '.join(parts) or text).strip()[:255]
+
+
+def _rank(location):
+    """Ранг точности координат; без координат — -1"""
+    if location.latitude is None or location.longitude is None:
+        return -1
+    return PRECISION_RANK.get(location.location_precision, 0)
+
+
+def _chunks(model):
+    """Записи с адресом порциями по CHUNK_SIZE в порядке id"""
+    queryset = model.objects.exclude(address='').only('id', 'city_id', 'address', *LOCATION_FIELDS).order_by('id')
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(id__gt=last_id)[:CHUNK_SIZE])
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1].id
+
+
+def create_buildings(apps, schema_editor):
+    """
+    Дома по улицам и номерам домов существующих предложений и квартир
+
+    Дом получает самые точные координаты своих записей, записи без координат
+    (или с менее точными) — координаты дома. Записи читаются порциями дважды:
+    сначала собираются дома, затем записи связываются с ними; сохраняются
+    только записи с ключом дома.
+    """
+    Building = apps.get_model('analyzer', 'Building')
+    record_models = [apps.get_model('analyzer', name) for name in ('MarketOffer', 'Apartment')]
+    city_names = dict(apps.get_model('analyzer', 'City').objects.values_list('id', 'name'))
+
+    buildings = {}
+    for model in record_models:
+        for chunk in _chunks(model):
+            for obj in chunk:
+                key = _key(obj.address, city_names.get(obj.city_id, ''))
+                if not key:
+                    continue
+                building = buildings.get((obj.city_id, key))
+                if building is None:
+                    building = buildings[(obj.city_id, key)] = Building(
+                        city_id=obj.city_id, key=key, address=_display_address(obj.address)
+                    )
+                if _rank(obj) > _rank(building):
+                    for field in LOCATION_FIELDS:
+                        setattr(building, field, getattr(obj, field))
+
+    Building.objects.bulk_create(buildings.values(), batch_size=500)
+    ids = {(city_id, key): pk for pk, city_id, key in Building.objects.values_list('id', 'city_id', 'key')}
+
+    for model in record_models:
+        for chunk in _chunks(model):
+            linked, relocated = [], []
+            for obj in chunk:
+                building_key = (obj.city_id, _key(obj.address, city_names.get(obj.city_id, '')))
+                if building_key not in ids:
+                    continue
+                obj.building_id = ids[building_key]
+                building = buildings[building_key]
+                if _rank(building) > _rank(obj):
+                    for field in LOCATION_FIELDS:
+                        setattr(obj, field, getattr(building, field))
+                    relocated.append(obj)
+                else:
+                    linked.append(obj)
+            model.objects.bulk_update(linked, ['building'], batch_size=500)
+            model.objects.bulk_update(relocated, ['building', *LOCATION_FIELDS], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0019_location_precision'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='geocodingtask',
+            name='kind',
+            field=models.CharField(choices=[('building', 'Дом'), ('market_offer', 'Рыночное предложение'), ('apartment', 'Квартира')], max_length=20, verbose_name='Тип объекта'),
+        ),
+        migrations.CreateModel(
+            name='Building',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, verbose_name='Адрес (нормализованный)')),
+                ('address', models.CharField(max_length=255, verbose_name='Адрес')),
+                ('latitude', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True, verbose_name='Широта')),
+                ('longitude', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True, verbose_name='Долгота')),
+                ('location_precision', models.CharField(blank=True, choices=[('house', 'Дом'), ('street', 'Улица'), ('district', 'Район'), ('city', 'Город'), ('unknown', 'Неизвестно')], help_text='Пусто — координат нет', max_length=10, verbose_name='Точность координат')),
+                ('location_source', models.CharField(blank=True, max_length=30, verbose_name='Источник координат')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='buildings', to='analyzer.city', verbose_name='Город')),
+            ],
+            options={
+                'verbose_name': 'Дом',
+                'verbose_name_plural': 'Дома',
+                'ordering': ['city', 'key'],
+            },
+        ),
+        migrations.AddField(
+            model_name='apartment',
+            name='building',
+            field=models.ForeignKey(blank=True, help_text='Заполняется автоматически по адресу', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='apartments', to='analyzer.building', verbose_name='Дом'),
+        ),
+        migrations.AddField(
+            model_name='marketoffer',
+            name='building',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='market_offers', to='analyzer.building', verbose_name='Дом'),
+        ),
+        migrations.AddIndex(
+            model_name='building',
+            index=models.Index(fields=['city', 'latitude', 'longitude'], name='analyzer_bu_city_id_7b1109_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='building',
+            constraint=models.UniqueConstraint(fields=('city', 'key'), name='unique_building_city_key'),
+        ),
+        migrations.RunPython(create_buildings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.4 on 2026-10-19 04:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0020_buildings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='geocodingtask',
+            name='claim_token',
+            field=models.CharField(blank=True, editable=False, max_length=32, verbose_name='Метка обработчика'),
+        ),
+        migrations.AlterField(
+            model_name='geocodingtask',
+            name='status',
+            field=models.CharField(choices=[('pending', 'В очереди'), ('processing', 'Обрабатывается'), ('done', 'Выполнено'), ('failed', 'Не удалось')], default='pending', max_length=10, verbose_name='Статус'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-19 04:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0021_geocoding_task_claim'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='offerpricehistory',
+            name='rooms',
+            field=models.IntegerField(verbose_name='Количество комнат'),
+        ),
+    ]
@@ -1,4 +1,7 @@
+import json
+import hashlib
 import logging
+from decimal import Decimal
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils.text import slugify
@@ -6,6 +9,15 @@ from django.urls import reverse
 import uuid
 logger = logging.getLogger(__name__)
 
+# Точность координат (кэш геокодирования, предложения и квартиры), от точной к грубой
+LOCATION_PRECISION_CHOICES = [
+    ('house', 'Дом'),
+    ('street', 'Улица'),
+    ('district', 'Район'),
+    ('city', 'Город'),
+    ('unknown', 'Неизвестно'),
+]
+
 class City(models.Model):
     """Модель для хранения городов"""
     name = models.CharField(
@@ -54,6 +66,11 @@ class City(models.Model):
         blank=True,
         help_text='Краткое описание города, районов, инфраструктуры'
     )
+    market_data_version = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Версия рыночных данных',
+        help_text='Увеличивается после каждого обновления рыночных предложений'
+    )
 
     class Meta:
         verbose_name = 'Город'
@@ -70,6 +87,51 @@ class City(models.Model):
         return f"{self.name} (ср. цена: {self.avg_price_per_sqm} руб./м²)"
 
 
+class Building(models.Model):
+    """
+    Дом: нормализованный адрес, общий для предложений и квартир (см. utils.buildings)
+
+    Адрес геокодируется один раз на дом; координаты предложений и квартир —
+    копии координат дома, по которым работают фильтры и расчет расстояний.
+    """
+
+    city = models.ForeignKey(
+        City,
+        on_delete=models.CASCADE,
+        verbose_name='Город',
+        related_name='buildings'
+    )
+    # Улица и номер дома (см. BuildingRegistry.key)
+    key = models.CharField(max_length=255, verbose_name='Адрес (нормализованный)')
+    address = models.CharField(max_length=255, verbose_name='Адрес')
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True, verbose_name='Широта')
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True, verbose_name='Долгота')
+    location_precision = models.CharField(
+        max_length=10,
+        choices=LOCATION_PRECISION_CHOICES,
+        blank=True,
+        verbose_name='Точность координат',
+        help_text='Пусто — координат нет'
+    )
+    location_source = models.CharField(max_length=30, blank=True, verbose_name='Источник координат')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+
+    class Meta:
+        verbose_name = 'Дом'
+        verbose_name_plural = 'Дома'
+        ordering = ['city', 'key']
+        indexes = [
+            models.Index(fields=['city', 'latitude', 'longitude']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['city', 'key'], name='unique_building_city_key'),
+        ]
+
+    def __str__(self):
+        return self.address
+
+
 class Apartment(models.Model):
     """Модель квартиры пользователя для анализа"""
 
@@ -98,6 +160,15 @@ class Apartment(models.Model):
         verbose_name='Адрес',
         help_text='Улица, дом, корпус'
     )
+    building = models.ForeignKey(
+        Building,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='apartments',
+        verbose_name='Дом',
+        help_text='Заполняется автоматически по адресу'
+    )
     area = models.DecimalField(
         max_digits=6,
         decimal_places=2,
@@ -175,10 +246,27 @@ class Apartment(models.Model):
         null=True,
         help_text='Географическая долгота (автоматически заполняется)'
     )
+    location_precision = models.CharField(
+        max_length=10,
+        choices=LOCATION_PRECISION_CHOICES,
+        blank=True,
+        verbose_name='Точность координат',
+        help_text='Пусто — координат нет'
+    )
+    location_source = models.CharField(
+        max_length=30,
+        blank=True,
+        verbose_name='Источник координат',
+        help_text='Геокодер (nominatim, gazetteer) или источник объявления'
+    )
 
     def save(self, *args, **kwargs):
-        """Автоматическое геокодирование с реалистичным геокодером"""
-        from utils.geocoder_simple_working import geocoder
+        """Сохранение с привязкой к дому и постановкой адреса в очередь геокодирования"""
+        from utils.buildings import building_registry
+        from utils.geocoding_queue import geocoding_queue
+
+        # Координаты дома, если его адрес уже геокодирован (см. utils.buildings)
+        building_registry.attach(self)
 
         needs_geocoding = (
                 self.address and
@@ -186,26 +274,14 @@ class Apartment(models.Model):
                 self.city
         )
 
+        super().save(*args, **kwargs)
+
+        # Геокодирование выполняет воркер process_geocoding_queue, а не запрос пользователя
         if needs_geocoding:
             try:
-                logger.info(f"Геокодирование: {self.address}")
-
-                result = geocoder.geocode(self.address, self.city.name)
-
-                if result:
-                    self.latitude = result['lat']
-                    self.longitude = result['lon']
-                    logger.info(f"Координаты установлены: {self.latitude:.6f}, {self.longitude:.6f}")
-                else:
-                    logger.warning(f"Не удалось геокодировать, используем координаты города")
-                    if self.city.latitude and self.city.longitude:
-                        self.latitude = self.city.latitude
-                        self.longitude = self.city.longitude
-
+                geocoding_queue.enqueue(self)
             except Exception as e:
-                logger.error(f"Ошибка геокодирования: {str(e)}")
-
-        super().save(*args, **kwargs)
+                logger.error(f"Ошибка постановки в очередь геокодирования: {str(e)}")
 
 
 class MarketOffer(models.Model):
@@ -240,6 +316,14 @@ class MarketOffer(models.Model):
         max_length=255,
         verbose_name='Адрес'
     )
+    building = models.ForeignKey(
+        Building,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='market_offers',
+        verbose_name='Дом'
+    )
     area = models.DecimalField(
         max_digits=6,
         decimal_places=2,
@@ -296,10 +380,72 @@ class MarketOffer(models.Model):
         null=True,
         help_text='Географическая долгота'
     )
+    location_precision = models.CharField(
+        max_length=10,
+        choices=LOCATION_PRECISION_CHOICES,
+        blank=True,
+        verbose_name='Точность координат',
+        help_text='Пусто — координат нет'
+    )
+    location_source = models.CharField(
+        max_length=30,
+        blank=True,
+        verbose_name='Источник координат',
+        help_text='Геокодер (nominatim, gazetteer), listing — координаты из объявления, import — из файла'
+    )
+    content_hash = models.CharField(
+        max_length=32,
+        blank=True,
+        editable=False,
+        verbose_name='Хэш содержимого',
+        help_text='Хэш полей, обновляемых при повторной загрузке (пустой — неизвестен)'
+    )
+
+    duplicate_of = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='duplicates',
+        verbose_name='Дубликат предложения',
+        help_text='Основное предложение кластера дублей из разных источников (пусто — основное или без дублей)'
+    )
+
+    # Поля, по которым определяется, изменилось ли предложение в источнике
+    CONTENT_HASH_FIELDS = ('price', 'area', 'is_active', 'additional_info')
+    # Аналитика additional_info, пересчитываемая по всему городу при каждом обновлении
+    # (RealEstateDataCollector._enrich_with_analytics): в хэш не входит, иначе изменение
+    # одной цены меняло бы хэш всех предложений города
+    DERIVED_INFO_KEYS = frozenset({
+        'market_avg_price', 'market_avg_price_per_sqm', 'price_deviation_percent',
+        'attractiveness_score', 'data_quality',
+    })
+
+    def compute_content_hash(self) -> str:
+        """Хэш содержимого предложения для пропуска неизменившихся записей при загрузке"""
+        payload = json.dumps(
+            [
+                f"{Decimal(str(self.price)):.2f}",
+                f"{Decimal(str(self.area)):.2f}",
+                bool(self.is_active),
+                {
+                    key: value for key, value in (self.additional_info or {}).items()
+                    if key not in self.DERIVED_INFO_KEYS
+                },
+            ],
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
 
     def save(self, *args, **kwargs):
-        """Автоматическое геокодирование с реалистичным геокодером"""
-        from utils.geocoder_simple_working import geocoder
+        """Сохранение с привязкой к дому и постановкой адреса в очередь геокодирования"""
+        from utils.buildings import building_registry
+        from utils.geocoding_queue import geocoding_queue
+
+        # Координаты дома, если его адрес уже геокодирован (см. utils.buildings)
+        building_registry.attach(self)
 
         needs_geocoding = (
                 self.address and
@@ -307,26 +453,20 @@ class MarketOffer(models.Model):
                 self.city
         )
 
-        if needs_geocoding:
-            try:
-                logger.info(f"Геокодирование: {self.address}")
+        # Ключ (source, external_id) уникален, поэтому пустой ID заменяем сгенерированным
+        if not self.external_id:
+            self.external_id = f"{self.source}_{uuid.uuid4().hex}"
 
-                result = geocoder.geocode(self.address, self.city.name)
+        self.content_hash = self.compute_content_hash()
 
-                if result:
-                    self.latitude = result['lat']
-                    self.longitude = result['lon']
-                    logger.info(f"Координаты установлены: {self.latitude:.6f}, {self.longitude:.6f}")
-                else:
-                    logger.warning(f"Не удалось геокодировать, используем координаты города")
-                    if self.city.latitude and self.city.longitude:
-                        self.latitude = self.city.latitude
-                        self.longitude = self.city.longitude
+        super().save(*args, **kwargs)
 
+        # Геокодирование выполняет воркер process_geocoding_queue, а не сохранение
+        if needs_geocoding:
+            try:
+                geocoding_queue.enqueue(self)
             except Exception as e:
-                logger.error(f"Ошибка геокодирования: {str(e)}")
-
-        super().save(*args, **kwargs)
+                logger.error(f"Ошибка постановки в очередь геокодирования: {str(e)}")
 
     class Meta:
         verbose_name = 'Рыночное предложение'
@@ -337,6 +477,12 @@ class MarketOffer(models.Model):
             models.Index(fields=['price']),
             models.Index(fields=['is_active']),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['source', 'external_id'],
+                name='unique_market_offer_source_external_id'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.rooms}-к., {self.area} м² - {self.price} руб. ({self.get_source_display()})"
@@ -348,6 +494,250 @@ class MarketOffer(models.Model):
         return 0
 
 
+class ArchivedMarketOffer(models.Model):
+    """Архив предложений, неактивных дольше срока хранения (см. utils.offer_archive)"""
+
+    offer_id = models.PositiveBigIntegerField(unique=True, verbose_name='ID предложения')
+    city = models.ForeignKey(
+        City,
+        on_delete=models.CASCADE,
+        verbose_name='Город',
+        related_name='archived_offers'
+    )
+    source = models.CharField(max_length=20, verbose_name='Источник данных')
+    external_id = models.CharField(max_length=100, verbose_name='Внешний ID')
+    address = models.CharField(max_length=255, verbose_name='Адрес')
+    area = models.DecimalField(max_digits=6, decimal_places=2, verbose_name='Площадь (м²)')
+    rooms = models.IntegerField(verbose_name='Количество комнат')
+    floor = models.IntegerField(blank=True, null=True, verbose_name='Этаж')
+    price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Цена аренды (руб./мес.)')
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True, verbose_name='Широта')
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True, verbose_name='Долгота')
+    parsed_date = models.DateTimeField(verbose_name='Дата последнего получения')
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата архивации')
+
+    class Meta:
+        verbose_name = 'Архивное предложение'
+        verbose_name_plural = 'Архив предложений'
+        ordering = ['-parsed_date']
+        indexes = [
+            models.Index(fields=['city', 'rooms', 'parsed_date']),
+            models.Index(fields=['source', 'external_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.rooms}-к., {self.area} м² - {self.price} руб. (архив, {self.source})"
+
+
+class OfferPriceHistory(models.Model):
+    """
+    Журнал цен предложений: запись добавляется при первой загрузке
+    и при каждом изменении цены (см. utils.price_history)
+    """
+
+    # Не внешний ключ: история сохраняется и после переноса предложения в архив
+    offer_id = models.PositiveBigIntegerField(verbose_name='ID предложения')
+    city = models.ForeignKey(
+        City,
+        on_delete=models.CASCADE,
+        verbose_name='Город',
+        related_name='price_history'
+    )
+    rooms = models.IntegerField(verbose_name='Количество комнат')
+    price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Цена аренды (руб./мес.)')
+    recorded_at = models.DateTimeField(verbose_name='Дата')
+
+    class Meta:
+        verbose_name = 'Изменение цены'
+        verbose_name_plural = 'История цен'
+        ordering = ['offer_id', 'recorded_at']
+        indexes = [
+            models.Index(fields=['offer_id', 'recorded_at']),
+            models.Index(fields=['city', 'rooms', 'recorded_at']),
+        ]
+
+    def __str__(self):
+        return f"#{self.offer_id}: {self.price} руб. ({self.recorded_at:%d.%m.%Y})"
+
+
+class MarketOverview(models.Model):
+    """Предрассчитанная сводка рынка по городу и количеству комнат"""
+
+    city = models.ForeignKey(
+        City,
+        on_delete=models.CASCADE,
+        verbose_name='Город',
+        related_name='market_overviews'
+    )
+    rooms = models.IntegerField(
+        default=0,
+        verbose_name='Количество комнат',
+        help_text='0 — сводка по всем квартирам города'
+    )
+    data_version = models.PositiveIntegerField(
+        verbose_name='Версия рыночных данных',
+        help_text='Версия данных города, по которой построена сводка'
+    )
+    offers_count = models.IntegerField(default=0, verbose_name='Количество предложений')
+    avg_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Средняя цена', default=0)
+    median_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Медианная цена', default=0)
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Минимальная цена', default=0)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Максимальная цена', default=0)
+    avg_price_per_sqm = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Средняя цена за м²',
+                                            default=0)
+    chart_image_base64 = models.TextField(
+        blank=True,
+        null=True,
+        verbose_name='График распределения цен в формате base64'
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата расчета')
+
+    class Meta:
+        verbose_name = 'Сводка рынка'
+        verbose_name_plural = 'Сводки рынка'
+        ordering = ['city', 'rooms']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['city', 'rooms', 'data_version'],
+                name='unique_market_overview_version'
+            ),
+        ]
+
+    def __str__(self):
+        rooms_display = f"{self.rooms}-к." if self.rooms else "все квартиры"
+        return f"{self.city.name}, {rooms_display} (v{self.data_version}): {self.offers_count} предложений"
+
+
+class GeocodingTask(models.Model):
+    """Задание очереди отложенного геокодирования адреса дома, предложения или квартиры"""
+
+    KIND_BUILDING = 'building'
+    KIND_MARKET_OFFER = 'market_offer'
+    KIND_APARTMENT = 'apartment'
+    KIND_CHOICES = [
+        (KIND_BUILDING, 'Дом'),
+        (KIND_MARKET_OFFER, 'Рыночное предложение'),
+        (KIND_APARTMENT, 'Квартира'),
+    ]
+
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_PROCESSING, 'Обрабатывается'),
+        (STATUS_DONE, 'Выполнено'),
+        (STATUS_FAILED, 'Не удалось'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name='Тип объекта')
+    object_id = models.PositiveBigIntegerField(verbose_name='ID объекта')
+    city = models.ForeignKey(
+        City,
+        on_delete=models.CASCADE,
+        verbose_name='Город',
+        related_name='geocoding_tasks'
+    )
+    address = models.CharField(max_length=255, verbose_name='Адрес')
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        verbose_name='Статус'
+    )
+    attempts = models.IntegerField(default=0, verbose_name='Количество попыток')
+    last_error = models.CharField(max_length=255, blank=True, verbose_name='Последняя ошибка')
+    # Адрес в отрицательном кэше геокодирования: задание ждет окончания паузы
+    next_attempt_at = models.DateTimeField(null=True, blank=True, verbose_name='Следующая попытка')
+    # Метка процесса, забравшего задание в обработку (см. GeocodingQueue._claim)
+    claim_token = models.CharField(max_length=32, blank=True, editable=False, verbose_name='Метка обработчика')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата постановки')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+
+    class Meta:
+        verbose_name = 'Задание геокодирования'
+        verbose_name_plural = 'Очередь геокодирования'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_geocoding_task_object'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.object_id}: {self.address} ({self.get_status_display()})"
+
+
+class GeocodeCacheEntry(models.Model):
+    """
+    Результат геокодирования адреса, общий для всех геокодеров и процессов
+    (см. utils.geocode_cache)
+
+    Запись без координат — отрицательная: адрес не удалось геокодировать,
+    и до retry_after он повторно не запрашивается.
+    """
+
+    PRECISION_HOUSE = 'house'
+    PRECISION_STREET = 'street'
+    PRECISION_DISTRICT = 'district'
+    PRECISION_CITY = 'city'
+    PRECISION_UNKNOWN = 'unknown'
+    PRECISION_CHOICES = LOCATION_PRECISION_CHOICES
+
+    # Причина неудачи отрицательной записи
+    FAILURE_NOT_FOUND = 'not_found'
+    FAILURE_RATE_LIMITED = 'rate_limited'
+    FAILURE_HTTP_ERROR = 'http_error'
+    FAILURE_NETWORK = 'network'
+    FAILURE_ERROR = 'error'
+    FAILURE_CHOICES = [
+        (FAILURE_NOT_FOUND, 'Адрес не найден'),
+        (FAILURE_RATE_LIMITED, 'Превышен лимит запросов'),
+        (FAILURE_HTTP_ERROR, 'Ошибка HTTP'),
+        (FAILURE_NETWORK, 'Сетевая ошибка'),
+        (FAILURE_ERROR, 'Ошибка геокодера'),
+    ]
+
+    # Нормализованные адрес и город (см. GeocodeCache.make_key)
+    address_key = models.CharField(max_length=255, verbose_name='Адрес (нормализованный)')
+    city_key = models.CharField(max_length=100, blank=True, verbose_name='Город (нормализованный)')
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True, verbose_name='Широта')
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True, verbose_name='Долгота')
+    precision = models.CharField(
+        max_length=10,
+        choices=PRECISION_CHOICES,
+        default=PRECISION_UNKNOWN,
+        verbose_name='Точность'
+    )
+    source = models.CharField(max_length=30, verbose_name='Источник')
+    display_name = models.CharField(max_length=255, blank=True, verbose_name='Найденный адрес')
+    failure_reason = models.CharField(
+        max_length=20,
+        choices=FAILURE_CHOICES,
+        blank=True,
+        verbose_name='Причина неудачи'
+    )
+    failures = models.IntegerField(default=0, verbose_name='Неудач подряд')
+    retry_after = models.DateTimeField(null=True, blank=True, verbose_name='Повторить после')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+
+    class Meta:
+        verbose_name = 'Кэш геокодирования'
+        verbose_name_plural = 'Кэш геокодирования'
+        ordering = ['city_key', 'address_key']
+        constraints = [
+            models.UniqueConstraint(fields=['address_key', 'city_key'], name='unique_geocode_cache_key'),
+        ]
+
+    def __str__(self):
+        if self.latitude is None:
+            return f"{self.address_key} ({self.city_key}): {self.get_failure_reason_display()}"
+        return f"{self.address_key} ({self.city_key}): {self.latitude}, {self.longitude}"
+
+
 class AnalysisReport(models.Model):
     apartment = models.OneToOneField(Apartment, on_delete=models.CASCADE, related_name='analysis_report')
     fair_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Справедливая цена')
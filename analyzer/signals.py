@@ -0,0 +1,22 @@
+"""
+Сброс кэшированных счетчиков сайта (utils.site_stats) при изменении
+городов и квартир через ORM
+
+Предложения пишутся пакетами (upsert сборщика, деактивация, архивация,
+загрузка из файлов), которые сигналов не вызывают и сбрасывают счетчики
+сами; правки предложений в админке — MarketOfferAdmin. Обработчик
+post_delete для MarketOffer отключил бы быстрое удаление QuerySet.delete()
+и сбрасывал бы кэш на каждую строку.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Apartment, City
+
+
+@receiver([post_save, post_delete], sender=City)
+@receiver([post_save, post_delete], sender=Apartment)
+def invalidate_site_stats(sender, **kwargs):
+    from utils.site_stats import site_stats
+
+    site_stats.invalidate()
@@ -1,3 +1,934 @@
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from utils.address_normalizer import address_normalizer
+from utils.buildings import building_registry
+from utils.market_overview import market_overview_builder
+from utils.site_stats import site_stats
+
+from .models import (
+    AnalysisReport, Apartment, ArchivedMarketOffer, Building, City, GeocodingTask, MarketOffer, OfferPriceHistory,
+)
+
+
+class QueryBudgetTestCase(TestCase):
+    """Общие данные для проверок количества запросов страниц"""
+
+    def setUp(self):
+        cache.clear()
+        self.city = City.objects.create(name='Москва', avg_price_per_sqm=Decimal('1500'))
+        self.user = User.objects.create_user(username='tester', password='secret')
+
+    def add_apartments(self, count, with_reports=True):
+        for index in range(count):
+            apartment = Apartment.objects.create(
+                user=self.user, city=self.city, address=f'ул. Ленина, д. {index + 1}',
+                area=Decimal('40'), rooms=1, floor=2, total_floors=9, desired_price=Decimal('30000'),
+            )
+            if with_reports:
+                AnalysisReport.objects.create(
+                    apartment=apartment, fair_price=Decimal('31000'), price_difference=Decimal('3.3'),
+                    similar_offers_count=index, recommendation='Цена соответствует рынку',
+                )
+
+    def add_offers(self, count, is_active=True):
+        for index in range(count):
+            MarketOffer.objects.create(
+                city=self.city, source='mock', address=f'ул. Садовая, д. {index + 1}',
+                area=Decimal('40'), rooms=1, price=Decimal('30000'), is_active=is_active,
+            )
+
+
+class HomeViewTests(QueryBudgetTestCase):
+    # Города, счетчики сайта (одним запросом), сводки рынка
+    COLD_CACHE_QUERIES = 3
+    WARM_CACHE_QUERIES = 2
+
+    def setUp(self):
+        super().setUp()
+        self.add_apartments(2, with_reports=False)
+        self.add_offers(3)
+        self.add_offers(1, is_active=False)
+        cache.clear()
+
+    def test_counters(self):
+        response = self.client.get(reverse('analyzer:home'))
+        self.assertEqual(response.context['total_cities'], 1)
+        self.assertEqual(response.context['total_apartments'], 2)
+        self.assertEqual(response.context['total_offers'], 3)
+
+    def test_query_budget(self):
+        with self.assertNumQueries(self.COLD_CACHE_QUERIES):
+            self.client.get(reverse('analyzer:home'))
+        with self.assertNumQueries(self.WARM_CACHE_QUERIES):
+            self.client.get(reverse('analyzer:home'))
+
+    def test_query_budget_does_not_grow_with_data(self):
+        self.add_offers(20)
+        cache.clear()
+        with self.assertNumQueries(self.COLD_CACHE_QUERIES):
+            self.client.get(reverse('analyzer:home'))
+
+
+class SiteStatsTests(QueryBudgetTestCase):
+
+    def test_counted_in_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(site_stats.get(), {'cities': 1, 'apartments': 0, 'active_offers': 0})
+        with self.assertNumQueries(0):
+            site_stats.get()
+
+    def test_invalidated_on_apartment_save_and_delete(self):
+        site_stats.get()
+        self.add_apartments(2, with_reports=False)
+        self.assertEqual(site_stats.get()['apartments'], 2)
+
+        Apartment.objects.first().delete()
+        self.assertEqual(site_stats.get()['apartments'], 1)
+
+    def test_invalidated_by_bulk_offer_writes(self):
+        from utils.offer_archive import offer_archiver
+        from utils.real_estate_api import data_collector
+
+        site_stats.get()
+        data_collector.save_offers_to_db([
+            {'source': 'avito', 'external_id': str(index), 'address': 'ул. Садовая, д. 1',
+             'area': 40, 'rooms': 1, 'price': 30000}
+            for index in range(2)
+        ], self.city)
+        self.assertEqual(site_stats.get()['active_offers'], 2)
+
+        MarketOffer.objects.update(is_active=False, parsed_date=timezone.now() - timedelta(days=365))
+        site_stats.get()
+        self.assertEqual(offer_archiver.archive(retention_days=30)['archived'], 2)
+        self.assertIsNone(cache.get(site_stats.CACHE_KEY))
+
+    def test_offer_queryset_delete_sends_no_signals(self):
+        # Пакетное удаление сбрасывает счетчики явно (см. analyzer.signals)
+        self.add_offers(2)
+        site_stats.get()
+        MarketOffer.objects.all().delete()
+        self.assertEqual(site_stats.get()['active_offers'], 2)
+
+
+class DashboardViewTests(QueryBudgetTestCase):
+    # Сессия и пользователь, квартиры, отчеты, агрегат статистики
+    QUERIES = 5
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def test_counters(self):
+        self.add_apartments(4)
+        response = self.client.get(reverse('analyzer:dashboard'))
+        self.assertEqual(response.context['apartments_count'], 4)
+        self.assertEqual(response.context['total_analyses'], 4)
+        # similar_offers_count = 0, 1, 2, 3: успешный анализ — от трех похожих предложений
+        self.assertEqual(response.context['successful_analyses'], 1)
+        self.assertEqual(response.context['last_analysis_at'], response.context['reports'][0].created_at)
+
+    def test_empty(self):
+        response = self.client.get(reverse('analyzer:dashboard'))
+        self.assertEqual(response.context['total_analyses'], 0)
+        self.assertIsNone(response.context['last_analysis_at'])
+
+    def test_query_budget_does_not_grow_with_data(self):
+        self.add_apartments(2)
+        with self.assertNumQueries(self.QUERIES):
+            self.client.get(reverse('analyzer:dashboard'))
+
+        self.add_apartments(10)
+        with self.assertNumQueries(self.QUERIES):
+            self.client.get(reverse('analyzer:dashboard'))
+
+
+class MarketOffersListViewTests(QueryBudgetTestCase):
+    # Статистика с количеством (одним агрегатом), страница предложений с городами, список городов
+    QUERIES = 3
+
+    def add_priced_offers(self, prices, rooms=1):
+        for price in prices:
+            MarketOffer.objects.create(
+                city=self.city, source='mock', address='ул. Садовая, д. 1',
+                area=Decimal('40'), rooms=rooms, price=Decimal(price),
+            )
+
+    def test_stats(self):
+        self.add_priced_offers(['20000', '30000', '40000'])
+        self.add_priced_offers(['90000'], rooms=3)
+        self.add_offers(1, is_active=False)
+
+        response = self.client.get(reverse('analyzer:market_offers'), {'rooms': '1'})
+        self.assertEqual(response.context['total_offers'], 3)
+        self.assertEqual(response.context['avg_price'], Decimal('30000'))
+        self.assertEqual(response.context['min_price'], Decimal('20000'))
+        self.assertEqual(response.context['max_price'], Decimal('40000'))
+        self.assertEqual(response.context['paginator'].count, 3)
+
+    def test_empty(self):
+        response = self.client.get(reverse('analyzer:market_offers'))
+        self.assertEqual(response.context['total_offers'], 0)
+        self.assertEqual(response.context['avg_price'], 0)
+
+    def test_query_budget_does_not_grow_with_data(self):
+        self.add_offers(5)
+        with self.assertNumQueries(self.QUERIES):
+            self.client.get(reverse('analyzer:market_offers'))
+
+        self.add_offers(50)
+        with self.assertNumQueries(self.QUERIES):
+            response = self.client.get(reverse('analyzer:market_offers'), {'page': 2})
+        self.assertEqual(response.context['paginator'].count, 55)
+
+
+class MarketOverviewBuilderTests(TestCase):
+
+    def setUp(self):
+        self.city = City.objects.create(name='Москва', avg_price_per_sqm=Decimal('1500'))
+
+    def test_studio_counted_only_in_all_segment(self):
+        for rooms, price in ((0, '25000'), (1, '30000')):
+            MarketOffer.objects.create(
+                city=self.city, source='mock', address='ул. Садовая, д. 1',
+                area=Decimal('30'), rooms=rooms, price=Decimal(price),
+            )
+
+        overviews = {overview.rooms: overview for overview in market_overview_builder.build_for_city(self.city)}
+        self.assertEqual(sorted(overviews), [0, 1])
+        self.assertEqual(overviews[0].offers_count, 2)
+        self.assertEqual(overviews[1].offers_count, 1)
+
+
+class OfferUpsertTests(TestCase):
+
+    def setUp(self):
+        from utils.real_estate_api import RealEstateDataCollector
+
+        self.collector = RealEstateDataCollector()
+        self.city = City.objects.create(name='Москва', avg_price_per_sqm=Decimal('1500'))
+        self.offer_data = {
+            'source': 'avito', 'external_id': '42', 'address': 'ул. Садовая, д. 1',
+            'area': 40, 'rooms': 1, 'price': 30000, 'additional_info': {'floor_info': '2/9'},
+        }
+
+    def test_unchanged_offer_skipped(self):
+        self.collector.save_offers_to_db([dict(self.offer_data)], self.city)
+        stats = self.collector.save_offers_to_db([dict(self.offer_data)], self.city)
+        self.assertEqual(stats['unchanged'], 1)
+
+    def test_deactivated_offer_reactivated_when_seen_again(self):
+        self.collector.save_offers_to_db([dict(self.offer_data)], self.city)
+        # Так деактивирует устаревшие предложения finish_market_update: хэш не пересчитывается
+        MarketOffer.objects.update(is_active=False)
+
+        stats = self.collector.save_offers_to_db([dict(self.offer_data)], self.city)
+        self.assertEqual(stats['updated'], 1)
+        self.assertTrue(MarketOffer.objects.get().is_active)
+
+    def test_city_analytics_do_not_change_hash(self):
+        offer = MarketOffer(city=self.city, price=Decimal('30000'), area=Decimal('40'), additional_info={'floor_info': '2/9'})
+        content_hash = offer.compute_content_hash()
+
+        offer.additional_info = {'floor_info': '2/9', 'market_avg_price': 31000.0, 'price_deviation_percent': -3.2}
+        self.assertEqual(offer.compute_content_hash(), content_hash)
+
+        offer.additional_info = {'floor_info': '3/9'}
+        self.assertNotEqual(offer.compute_content_hash(), content_hash)
+
+
+class GeocodingQueueClaimTests(TestCase):
+
+    def setUp(self):
+        from utils.geocoding_queue import geocoding_queue
+
+        self.queue = geocoding_queue
+        self.city = City.objects.create(name='Москва', avg_price_per_sqm=Decimal('1500'))
+        self.queue.enqueue_many(GeocodingTask.KIND_BUILDING, [(1, self.city.pk, 'ул. Ленина, 5'), (2, self.city.pk, 'ул. Мира, 1')])
+
+    def test_task_claimed_once(self):
+        candidates = self.queue._due().order_by('created_at')
+        first = self.queue._claim(candidates)
+        # Другой обработчик выбрал те же задания до UPDATE
+        second = self.queue._claim(GeocodingTask.objects.filter(id__in=[task.id for task in first]))
+
+        self.assertEqual(len(first), 2)
+        self.assertEqual(second, [])
+        self.assertEqual(self.queue.due_count(), 0)
+        self.assertEqual(self.queue.pending_count(), 2)
+
+    def test_abandoned_claim_reclaimed(self):
+        self.queue._claim(self.queue._due())
+        GeocodingTask.objects.update(updated_at=timezone.now() - self.queue.CLAIM_TIMEOUT - timedelta(seconds=1))
+
+        self.assertEqual(len(self.queue._claim(self.queue._due())), 2)
+
+
+class AddressNormalizerTests(SimpleTestCase):
+
+    def test_house_letter_after_space(self):
+        for address in ('ул. Ленина 5 А', 'ул. Ленина, 5 А', 'ул. Ленина, д. 5а', 'г. Москва, ул. Ленина 5 А, кв. 3'):
+            with self.subTest(address=address):
+                self.assertEqual(address_normalizer.parse(address), ('ленина', 'ул', '5а'))
+        self.assertEqual(address_normalizer.house('д. 5 А'), '5а')
+
+
+class BuildingRegistryTests(TestCase):
+    VARIANTS = ('Москва, ЦАО, ул. Ленина, 5', 'ул. Ленина, 5', 'г. Москва, ул. Ленина, д. 5', 'Ленина ул., 5')
+
+    def setUp(self):
+        self.city = City.objects.create(name='Москва', avg_price_per_sqm=Decimal('1500'))
+
+    def test_address_variants_share_building(self):
+        buildings = building_registry.resolve_many((self.city.pk, address) for address in self.VARIANTS)
+
+        self.assertEqual(len(buildings), len(self.VARIANTS))
+        self.assertEqual(Building.objects.get().key, 'ул ленина 5')
+        self.assertEqual({building.pk for building in buildings.values()}, {Building.objects.get().pk})
+
+    def test_apartment_joins_offer_building(self):
+        offer = MarketOffer.objects.create(
+            city=self.city, source='mock', address=self.VARIANTS[0], area=Decimal('40'), rooms=1, price=Decimal('30000'),
+        )
+        apartment = Apartment.objects.create(
+            user=User.objects.create_user(username='tester'), city=self.city, address=self.VARIANTS[3],
+            area=Decimal('40'), rooms=1, floor=2, total_floors=9, desired_price=Decimal('30000'),
+        )
+        self.assertEqual(apartment.building_id, offer.building_id)
+
+
+class IngestionPipelineStageTests(TestCase):
+
+    def setUp(self):
+        from utils.ingestion_pipeline import IngestionPipeline
+        from utils.real_estate_api import data_collector
+
+        self.city = City.objects.create(name='Москва', avg_price_per_sqm=Decimal('1500'))
+        self.pipeline = IngestionPipeline(data_collector, self.city)
+
+    def test_parse_keeps_studios_and_dates(self):
+        batch = [
+            {'price': '25000', 'area': '25', 'rooms': 0, 'parsed_date': '2026-10-01T12:00:00'},
+            {'price': '30000', 'area': '40', 'parsed_date': 1790000000},
+            {'price': '30000', 'area': '40', 'rooms': 2, 'parsed_date': 'вчера'},
+        ]
+        studio, one_room, two_rooms = self.pipeline._parse(batch)
+
+        self.assertEqual(studio['rooms'], 0)
+        self.assertEqual(studio['parsed_date'].year, 2026)
+        self.assertTrue(timezone.is_aware(studio['parsed_date']))
+        self.assertEqual(one_room['rooms'], 1)
+        self.assertEqual(one_room['parsed_date'].timestamp(), 1790000000)
+        self.assertNotIn('parsed_date', two_rooms)
+
+    def test_dedupe_memory_is_bounded(self):
+        self.pipeline.MEMO_SIZE = 3
+        offers = [
+            MarketOffer(source='avito', external_id=str(index), content_hash='x') for index in range(5)
+        ]
+        self.assertEqual(len(self.pipeline._dedupe(offers)), 5)
+        self.assertEqual(list(self.pipeline._seen_hashes), [('avito', '2'), ('avito', '3'), ('avito', '4')])
+        # Недавний точный повтор отбрасывается
+        self.assertEqual(self.pipeline._dedupe(offers[4:]), [])
+
+
+class GeocodeCacheKeyTests(TestCase):
+
+    def test_city_prefix_shares_entry(self):
+        from utils.geocode_cache import geocode_cache
+
+        geocode_cache.set('г. Москва, ул. Ленина, 5', 'Москва', 55.75, 37.61, 'nominatim')
+
+        for address in ('ул. Ленина, 5', 'Россия, Москва, ул. Ленина, д. 5', '101000, Москва, ул. Ленина, 5'):
+            with self.subTest(address=address):
+                self.assertEqual(geocode_cache.get(address, 'Москва')['lat'], 55.75)
+        self.assertIsNone(geocode_cache.get('ул. Ленина, 5', 'Казань'))
+
+
+class OfferFileLoaderTests(TestCase):
+
+    def setUp(self):
+        from utils.offer_loader import OfferFileLoader
+
+        self.loader = OfferFileLoader()
+        self.city = City.objects.create(name='Москва', avg_price_per_sqm=Decimal('1500'))
+        self.row = {'address': 'ул. Садовая, д. 1', 'area': '40', 'price': '30 000', 'rooms': '1'}
+
+    def test_coordinates_validated(self):
+        _, offer_data = self.loader.normalize_row({**self.row, 'latitude': '55,7', 'longitude': '37.6'}, self.city)
+        self.assertEqual(offer_data['latitude'], Decimal('55.7'))
+
+        for latitude, longitude in (('abc', '37.6'), ('95', '37.6'), ('55.7', '')):
+            with self.subTest(latitude=latitude, longitude=longitude), self.assertRaises(ValueError):
+                self.loader.normalize_row({**self.row, 'latitude': latitude, 'longitude': longitude}, self.city)
+
+    def test_bad_coordinates_reported_per_line(self):
+        from utils.real_estate_api import data_collector
+
+        rows = [(1, {**self.row, 'latitude': 'abc', 'longitude': '37.6'}), (2, {**self.row, 'address': 'ул. Мира, 1'})]
+        stats = self.loader.load_chunk(data_collector, rows, self.city)
+
+        self.assertEqual((stats['invalid'], stats['inserted']), (1, 1))
+        self.assertEqual(stats['errors'][0][0], 1)
+
+    def test_empty_is_active_means_active(self):
+        for value in ('', None, 'да'):
+            with self.subTest(value=value):
+                self.assertTrue(self.loader.normalize_row({**self.row, 'is_active': value}, self.city)[1]['is_active'])
+        self.assertFalse(self.loader.normalize_row({**self.row, 'is_active': 'нет'}, self.city)[1]['is_active'])
+
+
+class ListingExtractorTests(SimpleTestCase):
+    OFFERS = [
+        {'id': '1', 'price': {'value': 30000, 'currency': 'RUR'}, 'area': {'value': 40}, 'rooms': 1,
+         'location': {'address': 'ул. Ленина, 5 {корп. "А"}', 'point': {'lat': 55.7}}},
+        {'id': '2', 'price': {'value': 45000}, 'area': {'value': 55.5}, 'rooms': 2,
+         'description': 'скобки } ] { и кавычки \\" в тексте', 'location': {'address': 'пр. Мира, 1'}},
+    ]
+    CARD = (
+        '<div data-testid="offer-card"><a href="/offer/7/">Квартира</a>'
+        '<span data-testid="offer-card__title">2-к квартира, 50 м²</span>'
+        '<span data-testid="offer-card__price">40&nbsp;000 ₽</span></div>'
+    )
+
+    def page(self, with_state=True):
+        # Фильтры тоже содержат price и area, но это не предложение
+        state = {'search': {'offers': {'entities': self.OFFERS}}, 'filters': {'price': 1, 'area': 2}}
+        script = f'<script>window.__INITIAL_STATE__ = {json.dumps(state, ensure_ascii=False)};</script>'
+        body = (script if with_state else '') + self.CARD
+        return f'<html><head><script>var brace = "}}";</script></head><body>{body}</body></html>'
+
+    def extract(self, page, chunk_size):
+        from utils.listing_extractor import extract_listing_items, iter_chunks
+
+        return list(extract_listing_items(iter_chunks(page, chunk_size)))
+
+    def test_output_independent_of_chunk_size(self):
+        expected = self.extract(self.page(), 10 ** 6)
+        for chunk_size in (1, 2, 3, 7, 64):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(self.extract(self.page(), chunk_size), expected)
+
+    def test_nested_offers_with_braces_and_escaped_quotes(self):
+        items = self.extract(self.page(), 5)
+        self.assertEqual([item for kind, item in items if kind == 'state'], self.OFFERS)
+
+    def test_html_card_fallback(self):
+        from utils.reliable_yandex_parser import ReliableYandexRealtyParser
+
+        items = self.extract(self.page(with_state=False), 3)
+        self.assertEqual(items, [('card', ('/offer/7/', '2-к квартира, 50 м²', '40\xa0000 ₽'))])
+
+        parser = ReliableYandexRealtyParser()
+        offers = parser._parse_html_response(self.page(with_state=False), 'Москва', limit=10)
+        self.assertEqual(len(offers), 1)
+        self.assertEqual((offers[0]['rooms'], offers[0]['area'], offers[0]['price']), (2, 50.0, 40000))
+        self.assertEqual(offers[0]['url'], 'https://realty.yandex.ru/offer/7/')
+        # Идентификатор не зависит от процесса (в отличие от hash())
+        self.assertEqual(parser._parse_html_response(self.page(with_state=False), 'Москва', 10)[0]['external_id'],
+                         offers[0]['external_id'])
+
+        # Предложения из состояния страницы приоритетнее карточек
+        sources = {offer['source'] for offer in parser._parse_html_response(self.page(), 'Москва', 10)}
+        self.assertEqual(sources, {'yandex_api'})
+
+
+class BulkGeocoderTests(TestCase):
+    RESULT = {'lat': 55.75, 'lon': 37.61, 'precision': 'house', 'display_name': 'Москва'}
+
+    def setUp(self):
+        self.city = City.objects.create(name='Москва', avg_price_per_sqm=Decimal('1500'))
+        self.checkpoint_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.checkpoint_dir, True)
+
+    def add_offers(self, addresses, **fields):
+        return [
+            MarketOffer.objects.create(
+                city=self.city, source='mock', external_id=str(index), address=address,
+                area=Decimal('40'), rooms=1, price=Decimal('30000'), **fields,
+            )
+            for index, address in enumerate(addresses)
+        ]
+
+    def geocoder(self, **kwargs):
+        from utils.bulk_geocoder import BulkGeocoder
+
+        return BulkGeocoder(
+            kinds=[GeocodingTask.KIND_MARKET_OFFER], workers=1, checkpoint_dir=self.checkpoint_dir, **kwargs
+        )
+
+    def patch_service(self, result=RESULT):
+        from utils.geocoding_service import GeocodeAttempt, geocoding_service
+
+        patches = (
+            mock.patch.object(geocoding_service, 'lookup_local', return_value=None),
+            mock.patch.object(geocoding_service, 'attempt', return_value=GeocodeAttempt(result)),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        return geocoding_service.attempt
+
+    def test_duplicate_addresses_requested_once(self):
+        attempt = self.patch_service()
+        self.add_offers(['ул. Ленина, 5', 'г. Москва, ул. Ленина, 5', 'ул. Ленина, д. 5'])
+
+        stats = self.geocoder().run()
+
+        self.assertEqual(attempt.call_count, 1)
+        self.assertEqual((stats['objects'], stats['addresses'], stats['updated']), (3, 1, 3))
+        self.assertFalse(MarketOffer.objects.filter(latitude__isnull=True).exists())
+
+    def test_address_spellings_share_building_request(self):
+        from utils.bulk_geocoder import BulkGeocoder
+
+        attempt = self.patch_service()
+        self.add_offers(['Москва, ЦАО, ул. Ленина, 5', 'Ленина ул., 5', 'г. Москва, ул. Ленина, д. 5'])
+
+        BulkGeocoder(workers=1, checkpoint_dir=self.checkpoint_dir).run()
+
+        self.assertEqual(attempt.call_count, 1)
+        self.assertFalse(MarketOffer.objects.filter(latitude__isnull=True).exists())
+
+    def test_interrupted_run_resumes_from_checkpoint(self):
+        attempt = self.patch_service()
+        offers = self.add_offers(['ул. Ленина, 1', 'ул. Ленина, 2', 'ул. Ленина, 3'])
+
+        first = self.geocoder(chunk_size=1)
+        stats = first.run(limit=2)
+        self.assertFalse(stats['completed'])
+        self.assertTrue(first.checkpoint_path.exists())
+
+        resumed = self.geocoder(chunk_size=1)
+        self.assertTrue(resumed.load_checkpoint())
+        self.assertEqual(resumed.last_ids[GeocodingTask.KIND_MARKET_OFFER], offers[1].pk)
+        self.assertEqual(resumed.pending_count(), 1)
+
+        stats = resumed.run()
+        self.assertTrue(stats['completed'])
+        self.assertEqual(stats['objects'], 3)
+        self.assertEqual(attempt.call_count, 3)
+        self.assertEqual(attempt.call_args.args[0], 'ул. Ленина, 3')
+        self.assertFalse(resumed.checkpoint_path.exists())
+
+    def test_precision_below_replaces_only_with_more_precise(self):
+        self.patch_service({**self.RESULT, 'precision': 'street'})
+        coarse, street = self.add_offers(['ул. Ленина, 1', 'ул. Ленина, 2'], latitude=Decimal('55'), longitude=Decimal('37'))
+        MarketOffer.objects.filter(pk=coarse.pk).update(location_precision='city')
+        MarketOffer.objects.filter(pk=street.pk).update(location_precision='street')
+
+        self.geocoder(precision_below='house', only_missing=False).run()
+
+        coarse.refresh_from_db()
+        street.refresh_from_db()
+        self.assertEqual((coarse.location_precision, coarse.latitude), ('street', Decimal('55.75')))
+        self.assertEqual((street.location_precision, street.latitude), ('street', Decimal('55')))
+
+
+class GeocodingQueueWorkerTests(TestCase):
+    RESULT = {'lat': 55.75, 'lon': 37.61, 'precision': 'house', 'display_name': 'Москва'}
+
+    def setUp(self):
+        from utils.geocoding_queue import geocoding_queue
+
+        self.queue = geocoding_queue
+        self.city = City.objects.create(name='Москва', avg_price_per_sqm=Decimal('1500'))
+        self.offers = [
+            MarketOffer.objects.create(
+                city=self.city, source='mock', address=address, area=Decimal('40'), rooms=1, price=Decimal('30000'),
+            )
+            for address in ('ул. Ленина, 5', 'г. Москва, ул. Ленина, д. 5')
+        ]
+        self.apartment = Apartment.objects.create(
+            user=User.objects.create_user(username='tester'), city=self.city, address='Ленина ул., 5',
+            area=Decimal('40'), rooms=1, floor=2, total_floors=9, desired_price=Decimal('30000'),
+        )
+
+    def patch_resolve(self, attempt):
+        from utils.geocoding_service import geocoding_service
+
+        patch = mock.patch.object(geocoding_service, 'resolve', return_value=attempt)
+        self.addCleanup(patch.stop)
+        return patch.start()
+
+    def test_building_result_propagated(self):
+        from utils.geocoding_service import GeocodeAttempt
+
+        resolve = self.patch_resolve(GeocodeAttempt(self.RESULT))
+        task = GeocodingTask.objects.get()
+        self.assertEqual(task.kind, GeocodingTask.KIND_BUILDING)
+
+        stats = self.queue.process_batch()
+
+        self.assertEqual((stats['processed'], stats['requests'], stats['geocoded']), (1, 1, 1))
+        self.assertEqual(resolve.call_count, 1)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts, task.claim_token), (GeocodingTask.STATUS_DONE, 1, ''))
+        for obj in [*self.offers, self.apartment]:
+            obj.refresh_from_db()
+            self.assertEqual((obj.latitude, obj.location_precision), (Decimal('55.75'), 'house'))
+
+    def test_failure_deferred_then_failed(self):
+        from utils.geocoding_service import GeocodeAttempt
+
+        retry_after = timezone.now() + timedelta(hours=1)
+        self.patch_resolve(GeocodeAttempt(None, 'not_found', retry_after))
+
+        stats = self.queue.process_batch()
+        task = GeocodingTask.objects.get()
+        self.assertEqual((stats['deferred'], task.status, task.attempts), (1, GeocodingTask.STATUS_PENDING, 1))
+        self.assertEqual(task.next_attempt_at, retry_after)
+        self.assertEqual(self.queue.due_count(), 0)
+
+        GeocodingTask.objects.update(attempts=self.queue.MAX_ATTEMPTS - 1, next_attempt_at=None)
+        stats = self.queue.process_batch()
+        task.refresh_from_db()
+        self.assertEqual((stats['failed'], task.status), (1, GeocodingTask.STATUS_FAILED))
+        self.offers[0].refresh_from_db()
+        self.assertIsNone(self.offers[0].latitude)
+
+
+class FinishMarketUpdateTests(TestCase):
+
+    def setUp(self):
+        self.city = City.objects.create(name='Москва', avg_price_per_sqm=Decimal('1500'))
+
+    def add_offer(self, source, days_ago):
+        offer = MarketOffer.objects.create(
+            city=self.city, source=source, address='ул. Садовая, д. 1', area=Decimal('40'), rooms=1,
+            price=Decimal('30000'), latitude=Decimal('55.7'), longitude=Decimal('37.6'),
+        )
+        MarketOffer.objects.filter(pk=offer.pk).update(parsed_date=timezone.now() - timedelta(days=days_ago))
+        return offer
+
+    def test_stale_offers_deactivated_by_source(self):
+        from utils.real_estate_api import data_collector
+
+        stale = [self.add_offer('analytic', 15), self.add_offer('yandex_real', 31)]
+        # Другие источники и свежие предложения этим правилом не деактивируются
+        kept = [self.add_offer('analytic', 10), self.add_offer('yandex_real', 20), self.add_offer('avito', 60)]
+
+        result = data_collector.finish_market_update(
+            self.city, {'inserted': 0, 'updated': 0, 'unchanged': 0, 'failed': 0}
+        )
+
+        self.assertEqual(result['deactivated'], 2)
+        self.assertEqual(
+            set(MarketOffer.objects.filter(is_active=True).values_list('pk', flat=True)), {offer.pk for offer in kept}
+        )
+        self.assertFalse(MarketOffer.objects.filter(pk__in=[offer.pk for offer in stale], is_active=True).exists())
+
+
+class OfferDeduplicatorTests(TestCase):
+
+    def setUp(self):
+        self.city = City.objects.create(name='Москва', avg_price_per_sqm=Decimal('1500'))
+
+    def add_offer(self, source, address, price, area='40', rooms=1):
+        return MarketOffer.objects.create(
+            city=self.city, source=source, address=address, area=Decimal(area), rooms=rooms, price=Decimal(price),
+        )
+
+    def test_cross_source_cluster_with_canonical_source(self):
+        from utils.offer_dedup import offer_deduplicator
+
+        avito = self.add_offer('avito', 'ул. Ленина, д. 5', '30000')
+        yandex = self.add_offer('yandex_real', 'Москва, улица Ленина 5', '30500', area='40.5')
+        analytic = self.add_offer('analytic', 'ул. Ленина, 5', '29800')
+        # Другой дом, другой источник того же адреса с другой ценой, тот же источник
+        other_house = self.add_offer('html_parsed', 'ул. Ленина, д. 7', '30000')
+        other_price = self.add_offer('html_parsed', 'ул. Ленина, д. 5', '45000')
+        same_source = self.add_offer('avito', 'ул. Ленина, д. 5', '30100')
+
+        stats = offer_deduplicator.cluster_city(self.city)
+
+        links = dict(MarketOffer.objects.filter(duplicate_of__isnull=False).values_list('pk', 'duplicate_of_id'))
+        self.assertEqual(links, {avito.pk: yandex.pk, analytic.pk: yandex.pk, same_source.pk: yandex.pk})
+        self.assertEqual((stats['clusters'], stats['duplicates']), (1, 3))
+        for offer in (other_house, other_price):
+            self.assertNotIn(offer.pk, links)
+
+        # Пересчет заменяет прежние связи; из равных по источнику основным становится свежее
+        yandex.delete()
+        offer_deduplicator.cluster_city(self.city)
+        links = dict(MarketOffer.objects.filter(duplicate_of__isnull=False).values_list('pk', 'duplicate_of_id'))
+        self.assertEqual(links, {avito.pk: same_source.pk, analytic.pk: same_source.pk})
+
+
+class OfferArchiverTests(TestCase):
+
+    def setUp(self):
+        self.city = City.objects.create(name='Москва', avg_price_per_sqm=Decimal('1500'))
+
+    def add_offer(self, is_active, days_ago, **fields):
+        offer = MarketOffer.objects.create(
+            city=self.city, source='avito', address='ул. Садовая, д. 1', area=Decimal('40'), rooms=1,
+            price=Decimal('30000'), latitude=Decimal('55.7'), longitude=Decimal('37.6'), **fields,
+        )
+        MarketOffer.objects.filter(pk=offer.pk).update(
+            is_active=is_active, parsed_date=timezone.now() - timedelta(days=days_ago)
+        )
+        return offer
+
+    def test_archive_moves_old_inactive_offers(self):
+        from utils.geocoding_queue import geocoding_queue
+        from utils.offer_archive import offer_archiver
+
+        old = [self.add_offer(False, 200), self.add_offer(False, 100)]
+        recent = self.add_offer(False, 10)
+        active = self.add_offer(True, 200)
+        duplicate = self.add_offer(True, 1, duplicate_of=old[0])
+        geocoding_queue.enqueue_many(GeocodingTask.KIND_MARKET_OFFER, [(old[0].pk, self.city.pk, old[0].address)])
+
+        stats = offer_archiver.archive(retention_days=90, batch_size=1)
+
+        self.assertEqual(stats, {'archived': 2, 'batches': 2})
+        self.assertEqual(
+            sorted(ArchivedMarketOffer.objects.values_list('offer_id', flat=True)), sorted(offer.pk for offer in old)
+        )
+        self.assertEqual(
+            set(MarketOffer.objects.values_list('pk', flat=True)), {recent.pk, active.pk, duplicate.pk}
+        )
+        duplicate.refresh_from_db()
+        self.assertIsNone(duplicate.duplicate_of_id)
+        self.assertFalse(GeocodingTask.objects.filter(kind=GeocodingTask.KIND_MARKET_OFFER).exists())
+
+        # Повторный запуск ничего не переносит
+        self.assertEqual(offer_archiver.archive(retention_days=90)['archived'], 0)
+
+    def test_history_reads_both_tables(self):
+        from utils.offer_archive import offer_archiver
+
+        old = self.add_offer(False, 200)
+        recent = self.add_offer(False, 10)
+        active = self.add_offer(True, 1)
+        offer_archiver.archive(retention_days=90)
+
+        rows = {row['offer_pk']: row for row in offer_archiver.history(city=self.city, rooms=1)}
+        self.assertEqual(set(rows), {old.pk, recent.pk, active.pk})
+        self.assertTrue(rows[old.pk]['archived'])
+        self.assertFalse(rows[active.pk]['archived'])
+        self.assertEqual(rows[old.pk]['price'], Decimal('30000'))
+
+        inactive = offer_archiver.history(city=self.city, include_active=False)
+        self.assertEqual({row['offer_pk'] for row in inactive}, {old.pk, recent.pk})
+        since = offer_archiver.history(city=self.city, since=timezone.now() - timedelta(days=30))
+        self.assertEqual({row['offer_pk'] for row in since}, {recent.pk, active.pk})
+        self.assertEqual(offer_archiver.history(city=self.city, rooms=2).count(), 0)
+
+
+class PriceHistoryTests(TestCase):
+
+    def setUp(self):
+        self.city = City.objects.create(name='Москва', avg_price_per_sqm=Decimal('1500'))
+
+    def test_upsert_records_first_price_and_changes_only(self):
+        from utils.real_estate_api import data_collector
+
+        offer_data = {'source': 'avito', 'external_id': '1', 'address': 'ул. Садовая, д. 1', 'area': 25, 'rooms': 0}
+        for price in (30000, 30000, 32000):
+            data_collector.save_offers_to_db([{**offer_data, 'price': price}], self.city)
+
+        offer = MarketOffer.objects.get()
+        history = OfferPriceHistory.objects.filter(offer_id=offer.pk).order_by('id')
+        self.assertEqual([row.price for row in history], [Decimal('30000'), Decimal('32000')])
+        self.assertEqual({row.rooms for row in history}, {0})
+
+    def test_segment_series(self):
+        from utils.price_history import price_history
+
+        day = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0) - timedelta(days=3)
+        self.assertEqual(price_history.record_many([]), 0)
+        price_history.record_many([(1, self.city.pk, 1, 30000), (2, self.city.pk, 1, 40000)], recorded_at=day)
+        price_history.record_many([(1, self.city.pk, 1, 32000), (3, self.city.pk, 2, 60000)],
+                                  recorded_at=day + timedelta(days=1))
+
+        series = price_history.segment_series(self.city, rooms=1)
+        self.assertEqual(
+            [(row['avg_price'], row['min_price'], row['max_price'], row['changes']) for row in series],
+            [
+                (Decimal('35000'), Decimal('30000'), Decimal('40000'), 2),
+                (Decimal('32000'), Decimal('32000'), Decimal('32000'), 1),
+            ],
+        )
+        # Окно since отсекает первый день; по городу — все комнаты
+        self.assertEqual(
+            [row['changes'] for row in price_history.city_series(self.city, since=day + timedelta(hours=1))], [2]
+        )
+        self.assertEqual([row['price'] for row in price_history.offer_series(1)], [Decimal('30000'), Decimal('32000')])
+        with self.assertRaises(ValueError):
+            price_history.segment_series(self.city, bucket='year')
+
+
+class FileTokenBucketTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.path = f"{self.directory}/nominatim.bucket"
+
+        # Часы и sleep подменены: ожидание только записывается
+        self.now = 1000.0
+        self.sleeps = []
+        patch = mock.patch('utils.rate_limiter.time')
+        self.addCleanup(patch.stop)
+        fake_time = patch.start()
+        fake_time.time.side_effect = lambda: self.now
+        fake_time.sleep.side_effect = self.sleeps.append
+
+    def test_requests_spaced_at_rate_across_instances(self):
+        from utils.rate_limiter import FileTokenBucket
+
+        # Два экземпляра на одном файле — как два процесса
+        first, second = FileTokenBucket(self.path), FileTokenBucket(self.path)
+        delays = [first.acquire(2.0), second.acquire(2.0), first.acquire(2.0)]
+
+        self.assertEqual(delays, [0.0, 0.5, 1.0])
+        self.assertEqual(self.sleeps, [0.5, 1.0])
+
+        # После простоя накапливается не больше capacity токенов
+        self.now += 60
+        self.assertEqual([second.acquire(2.0), first.acquire(2.0)], [0.0, 0.5])
+
+    def test_unreadable_state_and_disabled_limit(self):
+        from utils.rate_limiter import FileTokenBucket, SourceRateLimiter
+
+        with open(self.path, 'w') as file:
+            file.write('мусор')
+        self.assertEqual(FileTokenBucket(self.path).acquire(1.0), 0.0)
+        self.assertEqual(FileTokenBucket(self.path).acquire(0), 0.0)
+
+        # Общий лимит источника — тот же файл; нулевой лимит отключает ожидание
+        limiter = SourceRateLimiter(rates={'nominatim': 1.0, 'avito': 0}, shared=['nominatim'], state_dir=self.directory)
+        self.assertEqual(limiter.wait('nominatim'), 1.0)
+        self.assertEqual(limiter.wait('avito'), 0.0)
+
+
+class GazetteerLookupTests(SimpleTestCase):
+    ROWS = (
+        'city;street;housenumber;lat;lon',
+        'Москва;улица Ленина;5А;55.70;37.50',
+        'Москва;улица Ленина;7;55.72;37.54',
+        'Москва;проспект Мира;10;55.80;37.63',
+        'Москва;улица Мира;10;55.81;37.64',
+        'Москва;;12;55.90;37.70',
+        'Москва;улица Ленина;9;не число;37.50',
+    )
+
+    def setUp(self):
+        from utils.gazetteer import Gazetteer
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        path = f"{directory}/addresses.csv"
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('\n'.join(self.ROWS))
+        self.gazetteer = Gazetteer(path)
+
+    def test_house_found_for_address_spellings(self):
+        self.assertEqual(self.gazetteer.size, 4)
+        for address in ('ул. Ленина, 5А', 'Ленина ул., д. 5 а', 'г. Москва, улица Ленина, дом 5а', 'Ленина, 5а'):
+            with self.subTest(address=address):
+                result = self.gazetteer.lookup(address, 'Москва')
+                self.assertEqual((result['lat'], result['lon'], result['precision']), (55.70, 37.50, 'house'))
+
+        self.assertIsNone(self.gazetteer.lookup('ул. Ленина, 5', 'Москва'))
+        self.assertIsNone(self.gazetteer.lookup('ул. Ленина, 5А', 'Казань'))
+
+    def test_street_type_and_centroid_fallback(self):
+        self.assertEqual(self.gazetteer.lookup('пр-т Мира, 10', 'Москва')['lat'], 55.80)
+        self.assertEqual(self.gazetteer.lookup('ул. Мира, 10', 'Москва')['lat'], 55.81)
+        # Улиц с названием «Мира» две: без типа адрес неоднозначен
+        self.assertIsNone(self.gazetteer.lookup('Мира, 10', 'Москва'))
+
+        result = self.gazetteer.lookup('ул. Ленина', 'Москва')
+        self.assertEqual(result['precision'], 'street')
+        self.assertAlmostEqual(result['lat'], 55.71)
+        self.assertAlmostEqual(result['lon'], 37.52)
+
+
+class RegeocodeImpreciseTests(TestCase):
+    RESULT = {'lat': 55.75, 'lon': 37.61, 'precision': 'house', 'display_name': 'Москва'}
+
+    def setUp(self):
+        from utils.geocoding_service import GeocodeAttempt, geocoding_service
+
+        self.moscow = City.objects.create(name='Москва', avg_price_per_sqm=Decimal('1500'))
+        self.kazan = City.objects.create(name='Казань', avg_price_per_sqm=Decimal('1000'))
+        checkpoint_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, checkpoint_dir, True)
+        overridden = self.settings(GEOCODING_CHECKPOINT_DIR=checkpoint_dir)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        patches = (
+            mock.patch.object(geocoding_service, 'lookup_local', return_value=None),
+            mock.patch.object(geocoding_service, 'attempt', return_value=GeocodeAttempt(self.RESULT)),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.attempt = geocoding_service.attempt
+
+    def add_offer(self, city, number, precision=None):
+        coordinates = {'latitude': Decimal('55.7'), 'longitude': Decimal('37.6')} if precision else {}
+        return MarketOffer.objects.create(
+            city=city, source='mock', external_id=f"{city.pk}-{number}", address=f"ул. Ленина, {number}",
+            area=Decimal('40'), rooms=1, price=Decimal('30000'), location_precision=precision or '', **coordinates,
+        )
+
+    def run_command(self, *args):
+        from io import StringIO
+
+        from django.core.management import call_command
+
+        output = StringIO()
+        call_command('regeocode_imprecise', '--type', 'offers', *args, stdout=output)
+        return output.getvalue()
+
+    def test_only_coarser_coordinates_selected(self):
+        offers = {
+            precision: self.add_offer(self.moscow, number, precision)
+            for number, precision in enumerate(('house', 'street', 'district', 'city', None), start=1)
+        }
+
+        self.run_command('--precision', 'street')
+
+        self.assertEqual(self.attempt.call_count, 2)
+        updated = set(MarketOffer.objects.filter(location_precision='house').values_list('pk', flat=True))
+        self.assertEqual(updated, {offers[name].pk for name in ('house', 'district', 'city')})
+        # Объекты без координат — задача geocode_bulk, а не уточнения
+        self.assertIsNone(MarketOffer.objects.get(pk=offers[None].pk).latitude)
+
+    def test_cities_ordered_by_demand_and_coarser_result_ignored(self):
+        from utils.geocoding_service import GeocodeAttempt
+
+        self.add_offer(self.kazan, 1, 'street')
+        self.add_offer(self.kazan, 2, 'street')
+        self.add_offer(self.moscow, 1, 'city')
+        Apartment.objects.create(
+            user=User.objects.create_user(username='tester'), city=self.moscow, address='ул. Мира, 1',
+            area=Decimal('40'), rooms=1, floor=2, total_floors=9, desired_price=Decimal('30000'),
+        )
+
+        output = self.run_command('--limit', '2')
+        # Город с квартирами пользователей первым; лимит оставляет одно предложение Казани
+        self.assertLess(output.index('Москва'), output.index('Казань'))
+        self.assertEqual(self.attempt.call_count, 2)
+
+        # Результат грубее текущих координат их не заменяет
+        self.attempt.return_value = GeocodeAttempt({**self.RESULT, 'precision': 'district'})
+        self.run_command('--restart')
+        self.assertEqual(
+            set(MarketOffer.objects.values_list('city__name', 'location_precision')),
+            {('Москва', 'house'), ('Казань', 'house'), ('Казань', 'street')},
+        )
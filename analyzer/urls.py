@@ -16,6 +16,7 @@ urlpatterns = [
     path('apartment/<int:pk>/', views.apartment_detail, name='apartment_detail'),
     path('apartment/<int:pk>/delete/', views.delete_apartment, name='delete_apartment'),
     path('apartment/<int:apartment_id>/analyze/', views.analyze_apartment, name='analyze_apartment'),
+    path('apartment/<int:apartment_id>/location/', views.apartment_location, name='apartment_location'),
     path('apartment/<int:apartment_id>/results/', views.analysis_results, name='analysis_results'),
     path('apartment/<int:apartment_id>/save-report/', views.save_analysis_report, name='save_analysis_report'),
 
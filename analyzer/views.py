@@ -1,14 +1,19 @@
 #import report
+from django.http import JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.views.generic import ListView
 from django.contrib import messages
-from django.db.models import Count, Avg, Min, Max
+from django.db.models import Count, Avg, Min, Max, Q
 from .models import Apartment, City, MarketOffer, AnalysisReport
 from .forms import ApartmentForm, AnalysisFilterForm
 from utils.analyzer import ApartmentAnalyzer
-from utils.geocoder_simple_working import geocoder
+from utils.geocoding_service import geocoding_service
+from utils.geocode_cache import geocode_cache
+from utils.geocoding_queue import geocoding_queue
 from utils.charts import chart_generator
+from utils.market_overview import market_overview_builder
+from utils.site_stats import site_stats
 import logging
 import numpy as np
 from analyzer.models import Apartment, City, MarketOffer, AnalysisReport
@@ -26,26 +31,11 @@ logger = logging.getLogger(__name__)
 # Главная страница приложения analyzer
 def home(request):
     """Главная страница приложения analyzer"""
-    import logging
-    logger = logging.getLogger(__name__)
-
     try:
-        # Получаем данные с проверкой
-        cities = City.objects.all()
-        cities_list = list(cities[:8])  # Преобразуем в список
-        total_apartments = Apartment.objects.count()
-        total_offers = MarketOffer.objects.filter(is_active=True).count()
-
-        # Логируем для отладки
-        logger.info(f"=== HOME FUNCTION DEBUG ===")
-        logger.info(f"Type of cities: {type(cities)}")
-        logger.info(f"Number of cities in DB: {cities.count()}")
-        logger.info(f"City names: {[c.name for c in cities_list]}")
-        logger.info(f"Total apartments: {total_apartments}")
-        logger.info(f"Total offers: {total_offers}")
+        cities_list = list(City.objects.all()[:8])
 
         # Проверяем есть ли данные вообще
-        if cities.count() == 0:
+        if not cities_list:
             logger.warning("В базе нет городов!")
             # Создаем тестовые города для отладки
             test_cities = [
@@ -56,54 +46,65 @@ def home(request):
             ]
             for name, price in test_cities:
                 City.objects.get_or_create(name=name, defaults={'avg_price_per_sqm': price})
-            cities = City.objects.all()
-            cities_list = list(cities)
-            logger.info(f"Созданы тестовые города: {[c.name for c in cities_list]}")
+            cities_list = list(City.objects.all()[:8])
+            logger.info(f"Созданы тестовые города: {len(cities_list)}")
+
+        # Счетчики сайта одним запросом, из кэша (см. utils.site_stats)
+        stats = site_stats.get()
+
+        # Предрассчитанные сводки рынка (графики строятся при обновлении данных)
+        market_overviews = market_overview_builder.get_latest_overviews(
+            city_ids=[city.id for city in cities_list]
+        )
 
         context = {
             'cities': cities_list,  # Передаем список, а не QuerySet
-            'total_apartments': total_apartments,
-            'total_offers': total_offers,
+            'total_cities': stats['cities'],
+            'total_apartments': stats['apartments'],
+            'total_offers': stats['active_offers'],
+            'market_overviews': list(market_overviews.values()),
         }
 
         return render(request, 'analyzer/home.html', context)
 
     except Exception as e:
-        logger.error(f"Ошибка в функции home: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
+        logger.exception(f"Ошибка в функции home: {e}")
 
         # Возвращаем хотя бы пустой контекст при ошибке
         return render(request, 'analyzer/home.html', {
             'cities': [],
+            'total_cities': 0,
             'total_apartments': 0,
             'total_offers': 0,
+            'market_overviews': [],
         })
 
 
 @login_required
 def dashboard(request):
     """Личный кабинет пользователя с историей анализов"""
-    # Квартиры текущего пользователя
-    user_apartments = Apartment.objects.filter(user=request.user)
-
-    # Отчеты анализа для квартир пользователя
-    reports = AnalysisReport.objects.filter(apartment__user=request.user).select_related('apartment').order_by(
-        '-created_at')
-
-    # Статистика
-    total_analyses = reports.count()
-    successful_analyses = reports.filter(similar_offers_count__gte=3).count()
+    # Квартиры и отчеты выводятся целиком: загружаем по одному разу
+    user_apartments = list(Apartment.objects.filter(user=request.user))
+    reports = list(
+        AnalysisReport.objects.filter(apartment__user=request.user).select_related('apartment').order_by('-created_at')
+    )
 
-    # Последние анализы (5 штук)
-    recent_analyses = reports[:5]
+    # Статистика одним агрегирующим запросом
+    report_stats = AnalysisReport.objects.filter(apartment__user=request.user).aggregate(
+        total=Count('id'),
+        successful=Count('id', filter=Q(similar_offers_count__gte=3)),
+        last_created_at=Max('created_at'),
+    )
 
     context = {
         'user_apartments': user_apartments,
+        'apartments_count': len(user_apartments),
         'reports': reports,
-        'total_analyses': total_analyses,
-        'successful_analyses': successful_analyses,
-        'recent_analyses': recent_analyses,
+        'total_analyses': report_stats['total'],
+        'successful_analyses': report_stats['successful'],
+        'last_analysis_at': report_stats['last_created_at'],
+        # Последние анализы (5 штук)
+        'recent_analyses': reports[:5],
         'title': 'Личный кабинет',
     }
     return render(request, 'analyzer/dashboard.html', context)
@@ -130,22 +131,26 @@ def add_apartment(request):
             apartment = form.save(commit=False)
             apartment.user = request.user
 
-            # Пробуем геокодировать адрес
-            try:
-                result = geocoder.geocode(
-                    apartment.address,
-                    apartment.city.name if apartment.city else None
-                )
-                if result:
-                    apartment.latitude = result['lat']
-                    apartment.longitude = result['lon']
-                    messages.success(request, 'Адрес успешно геокодирован!')
-            except Exception as e:
-                messages.warning(request, f'Геокодирование не удалось: {str(e)}')
+            # Без ожидания сети: только газеттир и общий кэш геокодирования
+            result = geocoding_service.geocode(
+                apartment.address,
+                apartment.city.name if apartment.city else None,
+                remote=False
+            )
+            if result:
+                for field, value in geocode_cache.location_fields(result).items():
+                    setattr(apartment, field, value)
 
+            # Без координат (своих или уже геокодированного дома) квартира
+            # попадает в очередь геокодирования (Apartment.save)
             apartment.save()
             messages.success(request, 'Квартира успешно добавлена!')
 
+            if not apartment.latitude:
+                # Запрос к геокодеру выполнится в фоне, страница анализа обновит местоположение сама
+                geocoding_queue.process_in_background(apartment)
+                messages.info(request, 'Точное местоположение определяется, это займет несколько секунд.')
+
             # Предлагаем сразу проанализировать
             return redirect('analyzer:analyze_apartment', apartment_id=apartment.id)
     else:
@@ -157,6 +162,57 @@ def add_apartment(request):
     })
 
 
+@login_required
+def apartment_location(request, apartment_id):
+    """Состояние геокодирования квартиры (страница анализа опрашивает его, пока координат нет)"""
+    apartment = get_object_or_404(Apartment, id=apartment_id, user=request.user)
+    return JsonResponse({
+        'status': geocoding_queue.location_status(apartment),
+        'latitude': float(apartment.latitude) if apartment.latitude else None,
+        'longitude': float(apartment.longitude) if apartment.longitude else None,
+    })
+
+
+def _run_analysis(request, apartment, filter_params):
+    """Анализ квартиры с сохранением результатов в сессии для страницы результатов"""
+    analyzer = ApartmentAnalyzer(apartment)
+    results = analyzer.analyze(
+        area_tolerance=filter_params['area_tolerance'],
+        price_tolerance=filter_params['price_tolerance'],
+        include_same_floor=filter_params['include_same_floor'],
+        max_distance_km=filter_params['max_distance_km'],  # Передаем параметр расстояния
+        max_results=50
+    )
+
+    # Конвертируем Decimal в float для сериализации в JSON
+    serializable_results = results.copy()
+
+    # Преобразуем Decimal поля в float
+    decimal_fields = ['avg_price', 'median_price', 'min_price', 'max_price',
+                      'avg_price_per_sqm', 'fair_price', 'price_difference']
+
+    for field in decimal_fields:
+        if field in serializable_results and hasattr(serializable_results[field], 'quantize'):
+            serializable_results[field] = float(serializable_results[field])
+
+    # Удаляем несериализуемые объекты
+    if 'apartment' in serializable_results:
+        del serializable_results['apartment']
+
+    # Добавьте сохранение фильтров и похожих предложений:
+    request.session['analysis_results'] = {
+        'apartment_id': apartment.id,
+        'results': serializable_results,
+        'similar_offers_count': results['count'],
+        'filter_params': filter_params,
+        # Сохраняем ID похожих предложений
+        'similar_offer_ids': [offer.id for offer in results.get('similar_offers', [])][:50],
+        # Анализ без координат квартиры повторяется, когда они появятся
+        'located': bool(apartment.latitude and apartment.longitude),
+    }
+    return results
+
+
 @login_required
 def analyze_apartment(request, apartment_id):
     """Анализ конкретной квартиры"""
@@ -175,14 +231,12 @@ def analyze_apartment(request, apartment_id):
             max_distance_km = float(filter_form.cleaned_data['max_distance'])
 
             # Запускаем анализ с учетом расстояния
-            analyzer = ApartmentAnalyzer(apartment)
-            results = analyzer.analyze(
-                area_tolerance=area_tolerance,
-                price_tolerance=price_tolerance,
-                include_same_floor=include_same_floor,
-                max_distance_km=max_distance_km,  # Передаем параметр расстояния
-                max_results=50
-            )
+            results = _run_analysis(request, apartment, {
+                'area_tolerance': area_tolerance,
+                'price_tolerance': price_tolerance,
+                'max_distance_km': max_distance_km,
+                'include_same_floor': include_same_floor,
+            })
 
             # Проверяем достаточно ли похожих предложений
             if results['count'] < min_similar_offers:
@@ -194,42 +248,13 @@ def analyze_apartment(request, apartment_id):
             else:
                 messages.success(request, 'Анализ успешно выполнен!')
 
-            # Конвертируем Decimal в float для сериализации в JSON
-            serializable_results = results.copy()
-
-            # Преобразуем Decimal поля в float
-            decimal_fields = ['avg_price', 'median_price', 'min_price', 'max_price',
-                              'avg_price_per_sqm', 'fair_price', 'price_difference']
-
-            for field in decimal_fields:
-                if field in serializable_results and hasattr(serializable_results[field], 'quantize'):
-                    serializable_results[field] = float(serializable_results[field])
-
-            # Удаляем несериализуемые объекты
-            if 'apartment' in serializable_results:
-                del serializable_results['apartment']
-
-            # Добавьте сохранение фильтров и похожих предложений:
-            request.session['analysis_results'] = {
-                'apartment_id': apartment.id,
-                'results': serializable_results,
-                'similar_offers_count': results['count'],
-                'filter_params': {
-                    'area_tolerance': area_tolerance,
-                    'price_tolerance': price_tolerance,
-                    'max_distance_km': max_distance_km,
-                    'include_same_floor': include_same_floor,
-                },
-                # Сохраняем ID похожих предложений
-                'similar_offer_ids': [offer.id for offer in results.get('similar_offers', [])][:50],
-            }
-
             return redirect('analyzer:analysis_results', apartment_id=apartment.id)
     else:
         filter_form = AnalysisFilterForm()
 
     return render(request, 'analyzer/analyze_apartment.html', {
         'apartment': apartment,
+        'location_status': geocoding_queue.location_status(apartment),
         'form': filter_form,
         'title': f'Анализ квартиры: {apartment.address}'
     })
@@ -282,6 +307,15 @@ def analysis_results(request, apartment_id):
         messages.info(request, 'Результаты анализа не найдены. Запустите анализ сначала.')
         return redirect('analyzer:analyze_apartment', apartment_id=apartment.id)
 
+    # Анализ был выполнен до геокодирования квартиры, а координаты уже готовы — уточняем его
+    if analysis_data.get('located') is False and apartment.latitude and apartment.longitude:
+        _run_analysis(request, apartment, {
+            'include_same_floor': False,
+            **analysis_data.get('filter_params', {}),
+        })
+        analysis_data = request.session['analysis_results']
+        messages.success(request, 'Местоположение квартиры уточнено, анализ обновлен с учетом расстояния.')
+
     results = analysis_data['results']
 
     # Получаем параметры фильтрации из сессии
@@ -507,6 +541,7 @@ def analysis_results(request, apartment_id):
 
     return render(request, 'analyzer/analysis_results.html', {
         'apartment': apartment,
+        'location_status': geocoding_queue.location_status(apartment),
         'results': formatted_results,
         'similar_offers': similar_offers[:20],  # Показываем только 20 для производительности
         'similar_count': len(similar_offers),
@@ -690,22 +725,30 @@ def update_market_data(request):
 
         if city_id:
             city = get_object_or_404(City, id=city_id)
-            saved_count = data_collector.update_market_data(city, limit)
+            stats = data_collector.update_market_data(city, limit)
             messages.success(
                 request,
-                f"Данные для {city.name} обновлены! Добавлено {saved_count} предложений."
+                f"Данные для {city.name} обновлены! Добавлено {stats['inserted']}, "
+                f"обновлено {stats['updated']}, без изменений {stats['unchanged']} предложений."
             )
         else:
             # Обновляем все города
             cities = City.objects.all()
-            total_saved = 0
-            for city in cities:
-                saved = data_collector.update_market_data(city, limit)
-                total_saved += saved
-
+            totals = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+            results = data_collector.update_all_cities(cities, limit)
+            for result in results:
+                if result['error']:
+                    messages.warning(request, f"{result['city'].name}: ошибка обновления - {result['error']}")
+                    continue
+                for key in totals:
+                    totals[key] += result['stats'][key]
+
+            slowest = max(results, key=lambda r: r['total_seconds'], default=None)
             messages.success(
                 request,
-                f"Данные для всех городов обновлены! Всего добавлено {total_saved} предложений."
+                f"Данные для всех городов обновлены! Всего добавлено {totals['inserted']}, "
+                f"обновлено {totals['updated']}, без изменений {totals['unchanged']} предложений."
+                + (f" Дольше всех: {slowest['city'].name} ({slowest['total_seconds']:.1f} сек)." if slowest else "")
             )
 
         return redirect('analyzer:market_offers')
@@ -727,6 +770,16 @@ class CityListView(ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+
+        # Прикрепляем предрассчитанные сводки рынка к городам текущей страницы
+        page_cities = list(context['cities'])
+        market_overviews = market_overview_builder.get_latest_overviews(
+            city_ids=[city.id for city in page_cities]
+        )
+        for city in page_cities:
+            city.market_overview = market_overviews.get(city.id)
+        context['cities'] = page_cities
+
         cities = City.objects.all()
 
         # Рассчитываем статистику в Python
@@ -753,7 +806,8 @@ class MarketOffersListView(ListView):
     paginate_by = 20
 
     def get_queryset(self):
-        queryset = MarketOffer.objects.filter(is_active=True)
+        # Город выводится в каждой строке таблицы
+        queryset = MarketOffer.objects.filter(is_active=True).select_related('city')
 
         # Получаем параметры фильтрации
         city_id = self.request.GET.get('city')
@@ -801,23 +855,46 @@ class MarketOffersListView(ListView):
 
         return queryset
 
+    def get_offer_stats(self):
+        """Количество и цены отфильтрованных предложений одним агрегирующим запросом"""
+        if not hasattr(self, '_offer_stats'):
+            self._offer_stats = self.object_list.order_by().aggregate(
+                total=Count('id'),
+                avg_price=Avg('price'),
+                min_price=Min('price'),
+                max_price=Max('price'),
+            )
+        return self._offer_stats
+
+    def get_paginator(self, queryset, per_page, **kwargs):
+        paginator = super().get_paginator(queryset, per_page, **kwargs)
+        # Количество уже посчитано вместе со статистикой: пагинатор не делает свой COUNT
+        paginator.count = self.get_offer_stats()['total']
+        return paginator
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        queryset = self.get_queryset()
 
         # Статистика
-        if queryset.exists():
-            prices = [float(offer.price) for offer in queryset]
-            context['avg_price'] = sum(prices) / len(prices)
-            context['min_price'] = min(prices)
-            context['max_price'] = max(prices)
-        else:
-            context['avg_price'] = 0
-            context['min_price'] = 0
-            context['max_price'] = 0
+        stats = self.get_offer_stats()
+        context['avg_price'] = stats['avg_price'] or 0
+        context['min_price'] = stats['min_price'] or 0
+        context['max_price'] = stats['max_price'] or 0
+        context['total_offers'] = stats['total']
+
+        cities = list(City.objects.all())
+        context['cities'] = cities
 
-        context['total_offers'] = queryset.count()
-        context['cities'] = City.objects.all()
+        # Предрассчитанная сводка по выбранному городу и количеству комнат
+        context['market_overview'] = None
+        city_id = self.request.GET.get('city')
+        rooms = self.request.GET.get('rooms')
+        if city_id and city_id != 'all':
+            city = next((city for city in cities if str(city.id) == city_id), None)
+            if city:
+                overviews = market_overview_builder.get_city_overviews(city)
+                segment = int(rooms) if rooms and rooms != 'all' else 0
+                context['market_overview'] = overviews.get(segment)
         context['rooms_list'] = [1, 2, 3, 4, 5]
         context['sources'] = MarketOffer.SOURCE_CHOICES
 
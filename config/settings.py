@@ -160,6 +160,63 @@ CACHES = {
     }
 }
 
+# Обновление рыночных данных
+# Количество городов, обновляемых параллельно (1 = последовательно)
+MARKET_REFRESH_MAX_WORKERS = int(os.getenv('MARKET_REFRESH_MAX_WORKERS', 4))
+# Ограничение частоты запросов к источникам (запросов в секунду)
+SOURCE_DEFAULT_RATE_LIMIT = 1.0
+SOURCE_RATE_LIMITS = {
+    'yandex_real': 1.0,
+    'avito': 0.5,
+    'nominatim': 1.0,  # правила использования Nominatim: не больше 1 запроса в секунду
+}
+# Источники, лимит которых общий для всех процессов (команды, воркеры, веб-запросы)
+SOURCE_SHARED_RATE_LIMITS = ['nominatim']
+RATE_LIMIT_STATE_DIR = BASE_DIR / 'cache' / 'rate_limits'
+# Бэкенды сервиса геокодирования в порядке опроса (utils.geocoding_service)
+GEOCODING_BACKENDS = ['gazetteer', 'nominatim']
+# Локальный справочник адресов: CSV (или .csv.gz) с колонками city, street, housenumber, lat, lon,
+# например выгрузка адресов из OSM; если файла нет, бэкенд gazetteer ничего не находит
+GEOCODING_GAZETTEER_PATH = Path(os.getenv('GEOCODING_GAZETTEER_PATH', BASE_DIR / 'data' / 'gazetteer.csv.gz'))
+# Массовое геокодирование (geocode_addresses): параллельных запросов и каталог контрольных точек
+GEOCODING_BULK_WORKERS = 4
+GEOCODING_CHECKPOINT_DIR = BASE_DIR / 'cache' / 'geocoding'
+# Квартиры, добавленные пользователем, геокодируются в фоновых потоках веб-процесса
+GEOCODING_IN_BACKGROUND = True
+GEOCODING_BACKGROUND_WORKERS = 2
+# Отрицательный кэш геокодирования: пауза (сек) перед повторным запросом адреса после первой
+# неудачи, по коду причины; каждая следующая неудача подряд удваивает паузу до GEOCODING_FAILURE_TTL_MAX
+GEOCODING_FAILURE_TTL = {
+    'not_found': 24 * 60 * 60,
+    'rate_limited': 10 * 60,
+    'http_error': 10 * 60,
+    'network': 5 * 60,
+    'error': 60 * 60,
+}
+GEOCODING_FAILURE_TTL_MAX = 30 * 24 * 60 * 60
+# Пакетов в очереди между этапами конвейера загрузки (ограничивает память)
+INGEST_QUEUE_SIZE = 4
+# Через сколько дней неактивные предложения переносятся в архив (archive_market_offers)
+OFFER_ARCHIVE_RETENTION_DAYS = 90
+
+# Общий HTTP-клиент парсеров и геокодеров
+HTTP_POOL_MAXSIZE = 10  # keep-alive соединений на хост
+HTTP_PER_HOST_CONCURRENCY = 4  # одновременных запросов к одному хосту
+HTTP_RETRIES = 2
+HTTP_RETRY_BACKOFF = 0.5  # сек, удваивается с каждой попыткой
+HTTP_TIMEOUT = 15  # сек на одну попытку
+HTTP_TIMEOUT_BUDGET = 60  # сек на запрос вместе с повторами
+# Подмена хостов источников, например {'realty.yandex.ru': 'http://127.0.0.1:8765'}
+# (локальный тестовый сервер, см. utils.fake_sources)
+HTTP_HOST_OVERRIDES = {}
+
+# Дисковый кэш ответов источников объявлений
+HTTP_CACHE_DIR = BASE_DIR / 'cache' / 'http'
+HTTP_CACHE_TTL = 15 * 60  # сек, для ответов без ETag/Last-Modified
+HTTP_CACHE_MAX_BYTES = 200 * 1024 * 1024
+# Только из кэша, без сети (воспроизведение сбора данных)
+HTTP_CACHE_OFFLINE = os.getenv('HTTP_CACHE_OFFLINE', 'False') == 'True'
+
 # Production settings
 import os
 
@@ -0,0 +1,299 @@
+"""
+Нормализация адресов
+
+Адрес разбирается за один проход одной скомпилированной регуляркой на
+токены: слова, номера домов, разделители и шум объявлений («2-к», «45 м²»,
+«5/9 эт.»). Сокращения распознаются только как целые слова, поэтому «пр.»
+не заменяется внутри других слов. Из токенов строятся все нужные формы:
+
+- key — нормализованный адрес («ул ленина 5»);
+- local_key — он же без страны, города и индекса: ключ кэша геокодирования;
+- query — запрос для Nominatim («улица Ленина 5»);
+- tokens — значимые слова и номера для поиска дублей;
+- parse / street / house — улица и номер дома для газеттира.
+
+Результаты запоминаются в LRU-кэше: одни и те же адреса приходят и от
+парсеров, и из очереди геокодирования, и из поиска дублей.
+"""
+import re
+from functools import lru_cache
+from typing import FrozenSet, List, NamedTuple, Optional, Tuple
+
+
+class Token(NamedTuple):
+    kind: str  # word, type, number, marker, building, apartment, sep
+    key: str  # каноническая форма в нижнем регистре
+    text: str  # как в исходном адресе
+
+
+class AddressNormalizer:
+    """Разбор адреса на токены и производные формы с запоминанием"""
+
+    # Тип улицы → (сокращение для ключа, полная форма для запроса)
+    STREET_TYPES = {
+        'ул': ('ул', 'улица'), 'улица': ('ул', 'улица'),
+        'пр': ('пр', 'проспект'), 'пр-т': ('пр', 'проспект'), 'пр-кт': ('пр', 'проспект'),
+        'просп': ('пр', 'проспект'), 'проспект': ('пр', 'проспект'),
+        'пер': ('пер', 'переулок'), 'переулок': ('пер', 'переулок'),
+        'наб': ('наб', 'набережная'), 'набережная': ('наб', 'набережная'),
+        'пл': ('пл', 'площадь'), 'площадь': ('пл', 'площадь'),
+        'ш': ('ш', 'шоссе'), 'шоссе': ('ш', 'шоссе'),
+        'б-р': ('б-р', 'бульвар'), 'бул': ('б-р', 'бульвар'), 'бульвар': ('б-р', 'бульвар'),
+        'ал': ('ал', 'аллея'), 'аллея': ('ал', 'аллея'),
+        'пр-д': ('пр-д', 'проезд'), 'проезд': ('пр-д', 'проезд'),
+        'туп': ('туп', 'тупик'), 'тупик': ('туп', 'тупик'),
+    }
+    # Слова перед номером: дом, корпус/строение (часть номера дома), квартира/офис (отбрасываются)
+    HOUSE_MARKERS = {'д': 'д', 'дом': 'д'}
+    BUILDING_MARKERS = {'к': 'к', 'корп': 'к', 'корпус': 'к', 'стр': 'стр', 'строение': 'стр'}
+    APARTMENT_MARKERS = frozenset({'кв', 'квартира', 'оф', 'офис'})
+
+    # Части адреса, не относящиеся к улице и дому
+    REGION_WORDS = frozenset({'россия', 'рф', 'г', 'город'})
+    # Не различают адреса при поиске дублей
+    STOP_WORDS = frozenset({
+        'г', 'город', 'россия', 'рф', 'д', 'дом', 'к', 'корп', 'стр', 'кв', 'квартира', 'м', 'эт', 'этаж',
+        'студия', 'апартаменты', 'комната',
+    })
+
+    # Текст уже в нижнем регистре; буквы и разделители проверяются раньше
+    # цифровых альтернатив, чтобы большинство позиций отсекалось сразу
+    _TOKEN = re.compile(
+        r'(?P<word>[^\W\d_]+(?:-[^\W\d_]+)*)'
+        r'|(?P<sep>[,;])'
+        r'|(?=\d)(?:'
+        r'(?P<noise>\d+\s*-\s*к\w*(?:\s+квартира)?|\d+[.,]?\d*\s*м²|\d+\s*/\s*\d+\s*эт\w*\.?|\d+\s*комн\w*)'
+        r'|(?P<ordinal>\d+-[а-яa-z]{1,2}(?![а-яa-z]))'
+        r'|(?P<number>\d+(?:[а-яa-z](?![а-яa-z\d]))?(?:\s*/\s*\d+[а-яa-z]?)?))'
+    )
+    _POSTCODE = re.compile(r'\d{6}')
+
+    # Запоминаемые формы
+    _FORMS = ('key', 'local_key', 'query', 'tokens', 'parse', 'street', 'house')
+
+    def __init__(self, cache_size: int = 65536):
+        self.cache_size = cache_size
+        self._word_kind_map = self._word_kinds()
+        self.key = lru_cache(maxsize=cache_size)(self._key)
+        self.local_key = lru_cache(maxsize=cache_size)(self._local_key)
+        self.query = lru_cache(maxsize=cache_size)(self._query)
+        self.tokens = lru_cache(maxsize=cache_size)(self._tokens)
+        self.parse = lru_cache(maxsize=cache_size)(self._parse)
+        self.street = lru_cache(maxsize=cache_size)(self._street)
+        self.house = lru_cache(maxsize=cache_size)(self._house)
+
+    def cache_info(self):
+        """Статистика LRU-кэшей по формам"""
+        return {name: getattr(self, name).cache_info() for name in self._FORMS}
+
+    def cache_clear(self):
+        for name in self._FORMS:
+            getattr(self, name).cache_clear()
+
+    # --- разбор ---
+
+    def _word_kinds(self):
+        kinds = {}
+        for words, kind in (
+            ({word: key for word, (key, _) in self.STREET_TYPES.items()}, 'type'),
+            (self.HOUSE_MARKERS, 'marker'),
+            (self.BUILDING_MARKERS, 'building'),
+            ({word: word for word in self.APARTMENT_MARKERS}, 'apartment'),
+        ):
+            kinds.update({word: (kind, key) for word, key in words.items()})
+        return kinds
+
+    def scan(self, text: str) -> List[Token]:
+        """Токены адреса (один проход, без запоминания)"""
+        text = text or ''
+        lowered = text.lower().replace('ё', 'е')
+        # Исходное написание нужно только для запроса (если смена регистра
+        # изменила длину строки, берется нижний регистр)
+        original = text if len(lowered) == len(text) else lowered
+        word_kinds = self._word_kind_map
+        tokens = []
+        pending = None  # маркер дома, корпуса или квартиры, ожидающий номера
+
+        for match in self._TOKEN.finditer(lowered):
+            kind = match.lastgroup
+            if kind == 'noise':
+                continue
+            value = match.group()
+            raw = original[match.start():match.end()]
+            if kind == 'word':
+                kind, value = word_kinds.get(value, ('word', value))
+            elif kind == 'number':
+                value = value.replace(' ', '')
+            elif kind == 'ordinal':
+                kind = 'word'
+
+            # Маркер — только перед номером, иначе это обычное слово
+            if pending is not None and kind != 'number':
+                tokens[pending] = Token('word', tokens[pending].text.lower().replace('ё', 'е'), tokens[pending].text)
+            pending = len(tokens) if kind in ('marker', 'building', 'apartment') else None
+            tokens.append(Token(kind, value, raw))
+
+        if pending is not None:
+            tokens[pending] = Token('word', tokens[pending].text.lower().replace('ё', 'е'), tokens[pending].text)
+        return tokens
+
+    def segments(self, text: str) -> List[List[Token]]:
+        """Части адреса между запятыми, без номеров квартир"""
+        segments = []
+        segment = []
+        skip_number = False
+        for token in self.scan(text):
+            kind = token.kind
+            if kind == 'sep':
+                if segment:
+                    segments.append(segment)
+                    segment = []
+            elif kind == 'apartment':
+                skip_number = True
+            elif skip_number and kind == 'number':
+                skip_number = False
+            else:
+                segment.append(token)
+        if segment:
+            segments.append(segment)
+        return segments
+
+    # --- формы ---
+
+    def _key(self, text: str) -> str:
+        """Ключ: сокращения в одной форме, без пунктуации, шума объявлений, «д.» и квартиры"""
+        return ' '.join(token.key for segment in self.segments(text) for token in segment if token.kind != 'marker')
+
+    def _local_segments(self, text: str, city: str = '') -> List[List[Token]]:
+        """Части адреса без страны, города («г. Москва», «Москва») и почтового индекса"""
+        city_key = ' '.join(token.key for token in self.scan(city))
+        parts = []
+        for segment in self.segments(text):
+            if segment[0].key in self.REGION_WORDS:
+                continue
+            if len(segment) == 1 and segment[0].kind == 'number' and self._POSTCODE.fullmatch(segment[0].key):
+                continue
+            if ' '.join(token.key for token in segment) == city_key:
+                continue
+            parts.append(segment)
+        return parts
+
+    def _local_key(self, text: str, city: str = '') -> str:
+        """
+        Ключ без страны, города и индекса: «г. Москва, ул. Ленина, 5» и
+        «ул. Ленина, 5» в городе Москва → «ул ленина 5»; если кроме них
+        ничего нет — обычный ключ
+        """
+        key = ' '.join(
+            token.key for segment in self._local_segments(text, city) for token in segment if token.kind != 'marker'
+        )
+        return key or self._key(text)
+
+    def _query(self, text: str) -> str:
+        """Адрес для Nominatim: полные названия типов улиц, номер дома без «д.» и запятой перед ним"""
+        parts = []
+        for segment in self.segments(text):
+            words = []
+            glue = False
+            for token in segment:
+                if token.kind == 'marker':
+                    continue
+                if token.kind == 'building':
+                    # «5 корп. 1» → «5к1»
+                    words[-1:] = [''.join(words[-1:]) + token.key]
+                    glue = True
+                elif glue:
+                    words[-1] += token.text
+                    glue = False
+                elif token.kind == 'type':
+                    words.append(self.STREET_TYPES[token.key][1])
+                else:
+                    words.append(token.text)
+            if not words:
+                continue
+            words = ' '.join(words)
+            # «улица Садовая, 4» → «улица Садовая 4»
+            if parts and segment[0].kind in ('number', 'marker'):
+                parts[-1] = f"{parts[-1]} {words}"
+            else:
+                parts.append(words)
+        return ', '.join(parts)
+
+    def _tokens(self, text: str, city: str = '') -> FrozenSet[str]:
+        """Значимые слова и номера адреса (без типов улиц, маркеров и названия города)"""
+        city_words = {token.key for token in self.scan(city)}
+        return frozenset(
+            token.key
+            for segment in self.segments(text)
+            for token in segment
+            if token.kind in ('word', 'number') and token.key not in self.STOP_WORDS and token.key not in city_words
+        )
+
+    @staticmethod
+    def _join_house(tokens: List[Token]) -> Optional[str]:
+        """[д] номер [буква] [корпус номер] [строение номер] → «5а», «12к1», «7стр2»"""
+        if tokens and tokens[0].kind == 'marker':
+            tokens = tokens[1:]
+        if not tokens or tokens[0].kind != 'number':
+            return None
+        house = tokens[0].key
+        rest = tokens[1:]
+        # Отдельная буква после номера («5 А»)
+        if rest and rest[0].kind == 'word' and len(rest[0].key) == 1 and not house[-1].isalpha():
+            house += rest[0].key
+            rest = rest[1:]
+        while len(rest) >= 2 and rest[0].kind == 'building' and rest[1].kind == 'number':
+            house += rest[0].key + rest[1].key
+            rest = rest[2:]
+        return None if rest else house
+
+    @staticmethod
+    def _split_street(tokens: List[Token]) -> Tuple[str, str]:
+        street_type = next((token.key for token in tokens if token.kind == 'type'), '')
+        name = ' '.join(token.key for token in tokens if token.kind != 'type')
+        return name, street_type
+
+    def _street(self, text: str) -> Tuple[str, str]:
+        """«ул. Ленина», «Ленина улица» → ('ленина', 'ул'); тип пустой, если не указан"""
+        return self._split_street([token for segment in self.segments(text) for token in segment])
+
+    def _house(self, text: str) -> Optional[str]:
+        """«д. 5 А», «5а», «5 корп. 1» → «5а», «5а», «5к1»; None, если это не номер дома"""
+        return self._join_house([token for segment in self.segments(text) for token in segment])
+
+    def _parse(self, text: str, city: str = '') -> Optional[Tuple[str, str, Optional[str]]]:
+        """
+        Улица и номер дома
+
+        Returns:
+            (улица, тип улицы, номер дома или None) или None, если улицу не удалось выделить
+        """
+        parts = self._local_segments(text, city)
+
+        # Номер дома — отдельная часть после улицы («ул. Ленина, 5») или конец части («ул. Ленина 5»)
+        for index in range(len(parts) - 1, -1, -1):
+            segment = parts[index]
+            house = self._join_house(segment)
+            if house is not None:
+                if index == 0:
+                    continue
+                name, street_type = self._split_street(parts[index - 1])
+                return (name, street_type, house) if name else None
+            for start in range(1, len(segment)):
+                if segment[start].kind in ('number', 'marker'):
+                    house = self._join_house(segment[start:])
+                    if house is not None:
+                        name, street_type = self._split_street(segment[:start])
+                        return (name, street_type, house) if name else None
+                    break
+
+        # Без номера дома: улица — последняя часть с типом улицы
+        for segment in reversed(parts):
+            name, street_type = self._split_street(segment)
+            if name and street_type:
+                return name, street_type, None
+        return None
+
+
+# Глобальный экземпляр
+address_normalizer = AddressNormalizer()
@@ -1,3 +1,4 @@
+import math
 import pandas as pd
 from typing import List, Dict, Tuple, Optional
 from decimal import Decimal
@@ -31,9 +32,35 @@ def float_to_decimal(value, precision=2):
         return value.quantize(Decimal(f'1.{precision}'), rounding=ROUND_HALF_UP)
     return Decimal(str(value))
 
+def weighted_median(values: List[float], weights: List[float]) -> float:
+    """Взвешенная медиана; при равных весах совпадает с обычной (np.median)"""
+    pairs = sorted(zip(values, weights))
+    half = sum(weights) / 2
+    cumulative = 0.0
+    for index, (value, weight) in enumerate(pairs):
+        cumulative += weight
+        if math.isclose(cumulative, half) and index + 1 < len(pairs):
+            return (value + pairs[index + 1][0]) / 2
+        if cumulative > half:
+            return value
+    return pairs[-1][0]
+
 class ApartmentAnalyzer:
     """Класс для анализа квартир и поиска похожих предложений"""
 
+    # Погрешность координат по точности геокодирования (км); пусто — координат нет,
+    # вместо них берется центр города
+    LOCATION_ERROR_KM = {
+        'house': 0.05,
+        'street': 0.5,
+        'district': 2.0,
+        'city': 5.0,
+        'unknown': 2.0,
+        '': 5.0,
+    }
+    # Расстояние с большей суммарной погрешностью считается приблизительным
+    APPROXIMATE_DISTANCE_ERROR_KM = 1.0
+
     def __init__(self, apartment: Apartment):
         self.apartment = apartment
         self.city = apartment.city
@@ -58,9 +85,18 @@ class ApartmentAnalyzer:
         apartment_area = float(self.apartment.area)
         desired_price = float(self.apartment.desired_price) if self.apartment.desired_price else None
 
+        # Координаты города: используются, пока точка не геокодирована очередью
+        city_lat = float(self.city.latitude) if self.city.latitude else None
+        city_lon = float(self.city.longitude) if self.city.longitude else None
+
         # Координаты квартиры
-        apartment_lat = float(self.apartment.latitude) if self.apartment.latitude else None
-        apartment_lon = float(self.apartment.longitude) if self.apartment.longitude else None
+        if self.apartment.latitude and self.apartment.longitude:
+            apartment_lat = float(self.apartment.latitude)
+            apartment_lon = float(self.apartment.longitude)
+            apartment_error = self._location_error(self.apartment.location_precision)
+        else:
+            apartment_lat, apartment_lon = city_lat, city_lon
+            apartment_error = self._location_error('')
 
         logger.info(f"Поиск похожих предложений для квартиры:")
         logger.info(f"  Город: {self.apartment.city.name}")
@@ -77,7 +113,8 @@ class ApartmentAnalyzer:
             rooms_filter = rooms_filter | Q(rooms=self.apartment.rooms - 1)
         rooms_filter = rooms_filter | Q(rooms=self.apartment.rooms + 1)
 
-        filters = Q(city=self.apartment.city) & Q(is_active=True) & rooms_filter
+        # Дубли из других источников не учитываем: каждый кластер — одно предложение
+        filters = Q(city=self.apartment.city) & Q(is_active=True) & Q(duplicate_of__isnull=True) & rooms_filter
 
         logger.info(f"Базовый фильтр: {MarketOffer.objects.filter(filters).count()} предложений")
 
@@ -117,15 +154,35 @@ class ApartmentAnalyzer:
         if apartment_lat and apartment_lon and max_distance_km > 0:
             from utils.distance_calculator import calculate_distance
 
+            # Предложения одного дома делят его координаты: расстояние считается один раз на точку
+            distances = {}
+
             for offer in all_offers:
+                # Пока предложение не геокодировано, считаем его в центре города
+                offer_lat, offer_lon = offer.latitude, offer.longitude
+                offer_error = self._location_error(offer.location_precision)
+                if not (offer_lat and offer_lon):
+                    offer_lat, offer_lon = city_lat, city_lon
+                    offer_error = self._location_error('')
+
+                # Приблизительное расстояние (координаты улицы, района, центра города)
+                # меньше влияет на порядок предложений и на статистику
+                error = apartment_error + offer_error
+                offer.distance_error_km = round(error, 1)
+                offer.distance_approximate = error > self.APPROXIMATE_DISTANCE_ERROR_KM
+                offer.weight = 1.0 / (1.0 + error / max_distance_km)
+
                 # Проверяем, есть ли у предложения координаты
-                if offer.latitude and offer.longitude:
+                if offer_lat and offer_lon:
                     try:
                         # Рассчитываем расстояние
-                        distance = calculate_distance(
-                            apartment_lat, apartment_lon,
-                            float(offer.latitude), float(offer.longitude)
-                        )
+                        point = (offer_lat, offer_lon)
+                        if point not in distances:
+                            distances[point] = calculate_distance(
+                                apartment_lat, apartment_lon,
+                                float(offer_lat), float(offer_lon)
+                            )
+                        distance = distances[point]
 
                         # Сохраняем расстояние как дополнительное поле
                         offer.distance_km = round(distance, 1)
@@ -149,10 +206,10 @@ class ApartmentAnalyzer:
             filtered_offers = list(all_offers)
             logger.info("Фильтрация по расстоянию отключена")
 
-        # Сортируем по расстоянию (если оно есть), затем по цене
+        # Сортируем по расстоянию с учетом погрешности (если оно есть), затем по цене
         try:
             filtered_offers.sort(key=lambda x: (
-                getattr(x, 'distance_km', float('inf')),  # Сначала по расстоянию
+                getattr(x, 'distance_km', float('inf')) + getattr(x, 'distance_error_km', 0.0),
                 float(x.price)  # Затем по цене
             ))
         except:
@@ -174,6 +231,9 @@ class ApartmentAnalyzer:
 
         return self.similar_offers
 
+    def _location_error(self, precision: str) -> float:
+        return self.LOCATION_ERROR_KM.get(precision or '', self.LOCATION_ERROR_KM['unknown'])
+
     def calculate_statistics(self) -> Dict:
         """Расчет статистики по похожим предложениям"""
         if not self.similar_offers:
@@ -185,21 +245,26 @@ class ApartmentAnalyzer:
                 'max_price': Decimal('0'),
                 'avg_price_per_sqm': Decimal('0'),
                 'price_range': '0 - 0',
+                'approximate_count': 0,
             }
 
         # Собираем данные (преобразуем Decimal в float для расчетов)
         prices = [float(offer.price) for offer in self.similar_offers]
         areas = [float(offer.area) for offer in self.similar_offers]
+        # Предложения с приблизительным расстоянием весят меньше (см. find_similar_offers)
+        weights = [getattr(offer, 'weight', 1.0) for offer in self.similar_offers]
 
         # Рассчитываем статистику
-        avg_price = sum(prices) / len(prices)
-        median_price = np.median(prices)
+        avg_price = float(np.average(prices, weights=weights))
+        median_price = weighted_median(prices, weights)
         min_price = min(prices)
         max_price = max(prices)
 
         # Цена за м²
-        prices_per_sqm = [price / area for price, area in zip(prices, areas) if area > 0]
-        avg_price_per_sqm = sum(prices_per_sqm) / len(prices_per_sqm) if prices_per_sqm else 0
+        sqm = [(price / area, weight) for price, area, weight in zip(prices, areas, weights) if area > 0]
+        avg_price_per_sqm = (
+            sum(value * weight for value, weight in sqm) / sum(weight for _, weight in sqm) if sqm else 0
+        )
 
         # Формируем результаты (возвращаем как Decimal)
         self.analysis_results = {
@@ -210,6 +275,7 @@ class ApartmentAnalyzer:
             'max_price': Decimal(str(max_price)),
             'avg_price_per_sqm': Decimal(str(avg_price_per_sqm)),
             'price_range': f"{min_price:.0f} - {max_price:.0f}",
+            'approximate_count': sum(1 for offer in self.similar_offers if getattr(offer, 'distance_approximate', False)),
             'similar_offers': self.similar_offers,
         }
 
@@ -1,12 +1,12 @@
 """
 Модуль для получения данных из Avito (публичный доступ)
 """
-import requests
 import re
 import logging
 from typing import List, Dict
 from bs4 import BeautifulSoup
 import time
+from .http_client import http_client
 
 logger = logging.getLogger(__name__)
 
@@ -27,12 +27,11 @@ class AvitoParser:
     }
 
     def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
+        self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
             'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
-        })
+        }
 
     def get_rent_offers(self, city_name: str, rooms: int = None, limit: int = 10) -> List[Dict]:
         """
@@ -55,17 +54,14 @@ class AvitoParser:
 
             logger.info(f"Запрос Avito: {url}")
 
-            # Делаем запрос
-            response = self.session.get(url, timeout=15)
+            # Делаем запрос (общий для всех потоков лимит запросов к Avito, из кэша — без ожидания)
+            response = http_client.cached_get(url, headers=self.headers, timeout=15, rate_limit_key='avito')
 
             if response.status_code == 200:
                 offers = self._parse_avito_page(response.text, city_name, limit)
             else:
                 logger.warning(f"Avito вернул статус {response.status_code}")
 
-            # Пауза между запросами
-            time.sleep(2)
-
         except Exception as e:
             logger.error(f"Ошибка при запросе Avito: {e}")
 
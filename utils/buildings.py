@@ -0,0 +1,192 @@
+"""
+Дома: нормализованные адреса, общие для предложений и квартир
+
+В одном доме десятки предложений, а адреса квартир пользователей повторяют
+адреса предложений. Каждое предложение и каждая квартира ссылаются на дом
+(Building) с ключом — улицей и номером дома в пределах города, поэтому
+адрес геокодируется один раз на дом, а не на каждую запись. Город, район и
+порядок слов в адресе на ключ не влияют: «Москва, ЦАО, ул. Ленина, 5» и
+«Ленина ул., д. 5» — один дом.
+
+Координаты предложений и квартир остаются денормализованными копиями
+координат дома: на них работают фильтры, карта и расчет расстояний.
+Найденные координаты дома копируются (propagate) во все его записи без
+координат или с менее точными; координаты из объявления, наоборот,
+уточняют дом, если они точнее.
+"""
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db.models import OuterRef, Q, Subquery
+
+from analyzer.models import Apartment, Building, City, MarketOffer
+
+from .address_normalizer import address_normalizer
+from .geocode_cache import geocode_cache
+
+logger = logging.getLogger(__name__)
+
+
+class BuildingRegistry:
+    """Поиск и создание домов по адресам, обмен координатами с их записями"""
+
+    # Записи, координаты которых копируются из дома
+    MODELS = (MarketOffer, Apartment)
+
+    # Ключей в одном запросе IN (...)
+    BATCH_SIZE = 500
+
+    def key(self, address: str, city: str = '') -> str:
+        """
+        Ключ дома: «ул ленина 5» из улицы, ее типа и номера дома
+
+        Если улицу выделить не удалось (см. AddressNormalizer.parse), ключ —
+        нормализованный адрес целиком (см. GeocodeCache.normalize); пустой,
+        если адреса нет.
+        """
+        parsed = address_normalizer.parse(address or '', city or '')
+        if parsed is None:
+            return geocode_cache.normalize(address)[:255]
+        name, street_type, house = parsed
+        return ' '.join(part for part in (street_type, name, house) if part)[:255]
+
+    @staticmethod
+    def display_address(address: str) -> str:
+        """Адрес дома без номера квартиры и шума объявлений"""
+        return (address_normalizer.query(address) or address).strip()[:255]
+
+    def resolve_many(self, pairs: Iterable[Tuple[int, str]]) -> Dict[Tuple[int, str], Building]:
+        """
+        Дома для пар (id города, адрес); недостающие создаются
+
+        Returns:
+            Словарь (id города, адрес) → Building; адреса с пустым ключом пропускаются
+        """
+        pairs = set(pairs)
+        city_names = dict(City.objects.filter(pk__in={city_id for city_id, _ in pairs}).values_list('pk', 'name'))
+        keys = {}
+        addresses = {}
+        for city_id, address in pairs:
+            key = self.key(address, city_names.get(city_id, ''))
+            if key:
+                keys[(city_id, address)] = (city_id, key)
+                addresses.setdefault((city_id, key), address)
+
+        buildings = self._existing(addresses)
+        missing = [
+            Building(city_id=city_id, key=key, address=self.display_address(address))
+            for (city_id, key), address in addresses.items()
+            if (city_id, key) not in buildings
+        ]
+        if missing:
+            # Дом мог создать параллельный процесс: конфликты пропускаем и перечитываем
+            Building.objects.bulk_create(missing, ignore_conflicts=True, batch_size=self.BATCH_SIZE)
+            buildings.update(self._existing({(b.city_id, b.key): b.address for b in missing}))
+        return {pair: buildings[key] for pair, key in keys.items() if key in buildings}
+
+    def _existing(self, keys: Iterable[Tuple[int, str]]) -> Dict[Tuple[int, str], Building]:
+        """Сохраненные дома: по запросу на город и на каждые BATCH_SIZE ключей"""
+        keys_by_city = {}
+        for city_id, key in keys:
+            keys_by_city.setdefault(city_id, []).append(key)
+
+        buildings = {}
+        for city_id, city_keys in keys_by_city.items():
+            for start in range(0, len(city_keys), self.BATCH_SIZE):
+                for building in Building.objects.filter(city_id=city_id, key__in=city_keys[start:start + self.BATCH_SIZE]):
+                    buildings[(city_id, building.key)] = building
+        return buildings
+
+    def resolve(self, city_id: int, address: str) -> Optional[Building]:
+        return self.resolve_many([(city_id, address)]).get((city_id, address))
+
+    @staticmethod
+    def more_precise(location, other) -> bool:
+        """Точнее ли координаты location (дом, предложение, квартира), чем у other"""
+        if location.latitude is None or location.longitude is None:
+            return False
+        if other.latitude is None or other.longitude is None:
+            return True
+        return geocode_cache.precision_rank(location.location_precision) > geocode_cache.precision_rank(other.location_precision)
+
+    @staticmethod
+    def copy_location(source, target):
+        for field in geocode_cache.LOCATION_FIELDS:
+            setattr(target, field, getattr(source, field))
+
+    def adopt_locations(self, items: Iterable[Tuple[Building, object]]) -> List[Building]:
+        """
+        Уточняет дома координатами их записей (например, из объявлений)
+
+        Args:
+            items: Пары (дом, предложение или квартира)
+
+        Returns:
+            Дома, координаты которых изменились (уже сохранены)
+        """
+        changed = {}
+        for building, obj in items:
+            if self.more_precise(obj, building):
+                self.copy_location(obj, building)
+                changed[building.pk] = building
+        if changed:
+            Building.objects.bulk_update(
+                list(changed.values()), geocode_cache.LOCATION_FIELDS, batch_size=self.BATCH_SIZE
+            )
+        return list(changed.values())
+
+    def attach(self, obj) -> Optional[Building]:
+        """
+        Связывает несохраненное предложение или квартиру с домом по адресу
+
+        Запись без координат (или с менее точными) получает координаты дома,
+        дом без координат — координаты записи. Вызывается из save() моделей.
+        """
+        key = self.key(obj.address, obj.city.name) if obj.city_id else ''
+        if not key:
+            obj.building = None
+            return None
+
+        building = obj.building if obj.building_id else None
+        if building is None or building.city_id != obj.city_id or building.key != key:
+            building = self.resolve(obj.city_id, obj.address)
+        obj.building = building
+
+        if self.more_precise(building, obj):
+            self.copy_location(building, obj)
+        elif self.adopt_locations([(building, obj)]):
+            self.propagate([building])
+        return building
+
+    def propagate(self, buildings: Iterable[Building]) -> int:
+        """
+        Копирует координаты домов в их предложения и квартиры
+
+        Обновляются только записи без координат или с менее точными: по
+        одному UPDATE на модель и точность дома.
+
+        Returns:
+            Количество обновленных записей
+        """
+        ids_by_precision = {}
+        for building in buildings:
+            if building.latitude is not None and building.longitude is not None:
+                ids_by_precision.setdefault(building.location_precision, []).append(building.pk)
+
+        location = {
+            field: Subquery(Building.objects.filter(pk=OuterRef('building_id')).values(field)[:1])
+            for field in geocode_cache.LOCATION_FIELDS
+        }
+        updated = 0
+        for precision, ids in ids_by_precision.items():
+            stale = Q(latitude__isnull=True) | Q(location_precision__in=geocode_cache.less_precise(precision))
+            for start in range(0, len(ids), self.BATCH_SIZE):
+                for model in self.MODELS:
+                    updated += model.objects.filter(stale, building_id__in=ids[start:start + self.BATCH_SIZE]).update(
+                        **location
+                    )
+        return updated
+
+
+# Глобальный экземпляр
+building_registry = BuildingRegistry()
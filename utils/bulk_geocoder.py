@@ -0,0 +1,277 @@
+"""
+Массовое геокодирование домов, предложений и квартир
+
+Дома (см. utils.buildings) обрабатываются первыми: их координаты сразу
+копируются во все предложения и квартиры дома, поэтому записи остаются
+только без дома или с ненайденным домом.
+
+Объекты читаются пакетами по возрастанию id. В каждом пакете адреса
+схлопываются до уникальных пар (адрес, город) еще до запросов: найденные в
+локальном газеттире или общем кэше применяются сразу, адреса на паузе после
+прежней неудачи (отрицательный кэш) пропускаются, остальные
+геокодируются параллельно несколькими потоками. Частоту запросов держит общий лимит
+source_rate_limiter, поэтому потоки лишь перекрывают задержку сети и
+запросы идут ровно на лимите. Координаты и кэш записываются пакетно, после
+чего в файл контрольной точки сохраняется последний обработанный id:
+прерванный запуск продолжается с того же места.
+
+С precision_below выбираются объекты с координатами грубее заданной
+точности (см. команду regeocode_imprecise): результат из газеттира или
+кэша принимается, только если он достаточно точен, а координаты объекта
+заменяются только более точными.
+"""
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+
+from analyzer.models import Apartment, Building, City, GeocodingTask, MarketOffer
+
+from .buildings import building_registry
+from .geocode_cache import geocode_cache
+from .geocoding_service import geocoding_service
+
+logger = logging.getLogger(__name__)
+
+
+class BulkGeocoder:
+    """Пакетное геокодирование с дедупликацией адресов и контрольными точками"""
+
+    MODELS = {
+        GeocodingTask.KIND_BUILDING: Building,
+        GeocodingTask.KIND_MARKET_OFFER: MarketOffer,
+        GeocodingTask.KIND_APARTMENT: Apartment,
+    }
+    STATS_KEYS = (
+        'objects', 'addresses', 'local_hits', 'cache_hits', 'backoff', 'requests', 'geocoded', 'failed', 'updated'
+    )
+
+    def __init__(self, kinds: Iterable[str] = (GeocodingTask.KIND_BUILDING, GeocodingTask.KIND_MARKET_OFFER,
+                                               GeocodingTask.KIND_APARTMENT),
+                 city: Optional[City] = None, only_missing: bool = True, refresh_cache: bool = False,
+                 workers: Optional[int] = None, chunk_size: int = 500,
+                 checkpoint_dir: Optional[Path] = None, precision_below: Optional[str] = None):
+        self.kinds = list(kinds)
+        self.city = city
+        self.only_missing = only_missing
+        self.precision_below = precision_below
+        self.refresh_cache = refresh_cache
+        self.workers = workers or getattr(settings, 'GEOCODING_BULK_WORKERS', 4)
+        self.chunk_size = chunk_size
+        self.checkpoint_dir = Path(
+            checkpoint_dir or getattr(settings, 'GEOCODING_CHECKPOINT_DIR', settings.BASE_DIR / 'cache' / 'geocoding')
+        )
+
+        self.stats = dict.fromkeys(self.STATS_KEYS, 0)
+        self.last_ids = dict.fromkeys(self.kinds, 0)
+        # Адреса, не найденные в этом запуске (повторно не запрашиваются)
+        self._not_found = set()
+
+    @property
+    def checkpoint_path(self) -> Path:
+        """Файл контрольной точки: свой для каждого набора параметров"""
+        if self.precision_below:
+            mode = f"below-{self.precision_below}"
+        else:
+            mode = 'missing' if self.only_missing else 'all'
+        city = f"city{self.city.pk}" if self.city else 'all'
+        return self.checkpoint_dir / f"{'-'.join(sorted(self.kinds))}_{city}_{mode}.json"
+
+    def load_checkpoint(self) -> bool:
+        """Продолжает прерванный запуск, если есть контрольная точка"""
+        try:
+            state = json.loads(self.checkpoint_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return False
+        self.last_ids.update({kind: state['last_ids'].get(kind, 0) for kind in self.kinds})
+        for key in self.STATS_KEYS:
+            self.stats[key] = state.get('stats', {}).get(key, 0)
+        return True
+
+    def save_checkpoint(self):
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        # Запись через временный файл: прерывание не оставит испорченную контрольную точку
+        temporary = self.checkpoint_path.with_suffix('.tmp')
+        temporary.write_text(json.dumps({'last_ids': self.last_ids, 'stats': self.stats}), encoding='utf-8')
+        temporary.replace(self.checkpoint_path)
+
+    def clear_checkpoint(self):
+        self.checkpoint_path.unlink(missing_ok=True)
+
+    def _queryset(self, kind: str):
+        objects = self.MODELS[kind].objects.exclude(address='')
+        if self.city is not None:
+            objects = objects.filter(city=self.city)
+        if self.precision_below:
+            objects = objects.filter(
+                latitude__isnull=False, location_precision__in=geocode_cache.less_precise(self.precision_below)
+            )
+        elif self.only_missing:
+            objects = objects.filter(latitude__isnull=True)
+        return objects
+
+    def _precise_enough(self, result: Optional[Dict]) -> bool:
+        if not result:
+            return False
+        if not self.precision_below:
+            return True
+        return geocode_cache.precision_rank(result.get('precision')) >= geocode_cache.precision_rank(self.precision_below)
+
+    @staticmethod
+    def _more_precise(result: Dict, other: Optional[Dict]) -> bool:
+        if not other:
+            return True
+        return geocode_cache.precision_rank(result.get('precision')) > geocode_cache.precision_rank(other.get('precision'))
+
+    def pending_count(self) -> int:
+        """Сколько объектов осталось обработать (с учетом контрольной точки)"""
+        return sum(self._queryset(kind).filter(id__gt=self.last_ids[kind]).count() for kind in self.kinds)
+
+    def _resolve(self, pairs: Dict[tuple, tuple]) -> Dict[tuple, Dict]:
+        """
+        Координаты для уникальных пар: газеттир, затем кэш, затем параллельные запросы
+
+        С refresh_cache кэш не читается совсем, в том числе паузы после неудач.
+        Недостаточно точный результат газеттира (precision_below) остается
+        запасным, если запрос не найдет ничего лучше; недостаточно точный
+        результат из кэша — последний ответ сетевого геокодера, поэтому
+        повторно адрес запрашивается только с refresh_cache.
+        """
+        results = {}
+        fallback = {}
+        for key, (address, city_name) in pairs.items():
+            result = geocoding_service.lookup_local(address, city_name)
+            if self._precise_enough(result):
+                results[key] = result
+            elif result:
+                fallback[key] = result
+        self.stats['local_hits'] += len(results)
+
+        cached, backoff = {}, {}
+        if not self.refresh_cache:
+            cached, backoff = geocode_cache.probe_many(pair for key, pair in pairs.items() if key not in results)
+            for key, result in cached.items():
+                if self._precise_enough(result):
+                    results[key] = result
+                elif self._more_precise(result, fallback.get(key)):
+                    fallback[key] = result
+            self.stats['cache_hits'] += len(cached)
+            self.stats['backoff'] += len(backoff)
+
+        missing = [
+            key for key in pairs
+            if key not in results and key not in cached and key not in backoff and key not in self._not_found
+        ]
+        if not missing:
+            return {**fallback, **results}
+
+        self.stats['requests'] += len(missing)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='geocode') as executor:
+            attempts = executor.map(lambda key: geocoding_service.attempt(*pairs[key], local=False), missing)
+            fetched = dict(zip(missing, attempts))
+
+        geocode_cache.store_many(
+            (pairs[key][0], pairs[key][1], attempt.result) for key, attempt in fetched.items() if attempt.result
+        )
+        geocode_cache.store_failures(
+            (pairs[key][0], pairs[key][1], attempt.reason) for key, attempt in fetched.items() if not attempt.result
+        )
+        for key, attempt in fetched.items():
+            if attempt.result:
+                results[key] = attempt.result
+            else:
+                self._not_found.add(key)
+        # Запрос мог вернуть результат грубее запасного
+        for key, result in fallback.items():
+            if self._more_precise(result, results.get(key)):
+                results[key] = result
+        return results
+
+    def _process_chunk(self, kind: str, rows: List[tuple]):
+        model = self.MODELS[kind]
+
+        # Уникальные пары (адрес, город) до любых запросов
+        pairs = {}
+        keys = []
+        for object_id, address, city_name, _ in rows:
+            key = geocode_cache.make_key(address, city_name)
+            pairs.setdefault(key, (address, city_name))
+            keys.append(key)
+
+        results = self._resolve(pairs)
+        self.stats['objects'] += len(rows)
+        self.stats['addresses'] += len(pairs)
+        self.stats['geocoded'] += sum(1 for key in pairs if key in results)
+        self.stats['failed'] += sum(1 for key in pairs if key not in results)
+
+        updates = []
+        for (object_id, _, _, precision), key in zip(rows, keys):
+            result = results.get(key)
+            if not result:
+                continue
+            fields = geocode_cache.location_fields(result)
+            # При уточнении координаты заменяются только более точными
+            if self.precision_below and (
+                    geocode_cache.precision_rank(fields['location_precision']) <= geocode_cache.precision_rank(precision)):
+                continue
+            updates.append(model(pk=object_id, **fields))
+
+        with transaction.atomic():
+            if updates:
+                model.objects.bulk_update(updates, geocode_cache.LOCATION_FIELDS, batch_size=500)
+                if kind == GeocodingTask.KIND_BUILDING:
+                    building_registry.propagate(updates)
+                # Задания очереди для этих объектов больше не нужны
+                GeocodingTask.objects.filter(
+                    kind=kind, object_id__in=[obj.pk for obj in updates], status=GeocodingTask.STATUS_PENDING
+                ).update(status=GeocodingTask.STATUS_DONE, last_error='')
+        self.stats['updated'] += len(updates)
+
+        self.last_ids[kind] = rows[-1][0]
+        self.save_checkpoint()
+
+    def run(self, limit: int = 0, progress=None) -> Dict[str, int]:
+        """
+        Геокодирует объекты, начиная с контрольной точки
+
+        Args:
+            limit: Обработать не больше стольких объектов за запуск (0 = все)
+            progress: Функция, вызываемая со статистикой после каждого пакета
+
+        Returns:
+            Накопленная статистика: objects, addresses, local_hits (газеттир),
+            cache_hits, backoff (пропущены на паузе после неудачи), requests,
+            geocoded, failed, updated; seconds и rate
+            (запросов в секунду) — для этого запуска; completed — обработаны ли все объекты
+        """
+        started = time.monotonic()
+        requests_before = self.stats['requests']
+        processed = 0
+
+        for kind in self.kinds:
+            while not limit or processed < limit:
+                size = min(self.chunk_size, limit - processed) if limit else self.chunk_size
+                rows = list(
+                    self._queryset(kind).filter(id__gt=self.last_ids[kind])
+                    .order_by('id').values_list('id', 'address', 'city__name', 'location_precision')[:size]
+                )
+                if not rows:
+                    break
+                self._process_chunk(kind, rows)
+                processed += len(rows)
+                if progress:
+                    progress(kind, dict(self.stats))
+
+        completed = not limit or processed < limit or not self.pending_count()
+        if completed:
+            self.clear_checkpoint()
+
+        seconds = time.monotonic() - started
+        rate = (self.stats['requests'] - requests_before) / seconds if seconds else 0.0
+        logger.info(f"Массовое геокодирование: {self.stats}")
+        return {**self.stats, 'seconds': seconds, 'rate': rate, 'completed': completed}
@@ -0,0 +1,366 @@
+"""
+Локальный тестовый сервер источников объявлений и геокодера
+
+Отдает сгенерированные страницы и JSON в форматах, которые разбирают
+AvitoParser, ReliableYandexRealtyParser и YandexRealtyAPI, а также ответы
+Nominatim (/search, /reverse). Задержка ответа, доля ошибок 5xx и лимит
+частоты запросов (429 с Retry-After) настраиваются — это позволяет
+замерять сбор данных без обращений к настоящим сайтам.
+
+Парсеры направляются на сервер подменой хостов в общем HTTP-клиенте
+(HttpClient.host_overrides / настройка HTTP_HOST_OVERRIDES).
+"""
+import re
+import csv
+import json
+import math
+import time
+import random
+import hashlib
+import logging
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+CITY_CENTERS = {
+    'Москва': (55.7558, 37.6173),
+    'Санкт-Петербург': (59.9343, 30.3351),
+    'Екатеринбург': (56.8389, 60.6057),
+    'Новосибирск': (55.0084, 82.9357),
+    'Казань': (55.7963, 49.1088),
+    'Нижний Новгород': (56.2965, 43.9361),
+}
+
+STREETS = ['Тверская', 'Арбат', 'Ленина', 'Мира', 'Садовая', 'Пушкина', 'Гагарина']
+
+
+def generate_offer_items(offers_count: int, rng=random) -> List[Dict]:
+    """Предложения в формате состояния страницы и API Яндекс.Недвижимости"""
+    items = []
+    for i in range(offers_count):
+        rooms = rng.randint(1, 3)
+        area = round(rng.uniform(25, 90), 1)
+        floors = rng.randint(5, 25)
+        items.append({
+            'id': f"{rng.randint(10 ** 9, 10 ** 10)}",
+            'price': {'value': rng.randint(20, 120) * 1000, 'currency': 'RUR'},
+            'area': {'value': area, 'unit': 'SQUARE_METER'},
+            'rooms': rooms,
+            'floor': rng.randint(1, floors),
+            'building': {'floorsCount': floors},
+            'location': {'address': f"ул. {rng.choice(STREETS)}, {rng.randint(1, 150)}"},
+            'description': 'Сдается квартира "без комиссии" {рядом метро} ' * rng.randint(1, 20),
+            'photos': [f"https://img.example/{i}/{n}.jpg" for n in range(rng.randint(2, 12))],
+        })
+    return items
+
+
+def render_search_page(items: List[Dict], variant: str = 'cards', padding_kb: int = 0) -> str:
+    """
+    Страница поиска Яндекс.Недвижимости
+
+    variant: 'state' — карточки и __INITIAL_STATE__, 'cards' — только карточки,
+    'changed' — изменившаяся разметка карточек (цена размечена по-другому)
+    """
+    cards = []
+    for item in items:
+        price = f"{item['price']['value']:,}".replace(',', '\xa0')
+        price_testid = 'offer-card__cost' if variant == 'changed' else 'offer-card__price'
+        cards.append(
+            f'<div class="card" data-testid="offer-card"><div class="photo"><img src="x.jpg"></div>'
+            f'<a class="link" href="/offer/{item["id"]}/">'
+            f'<span class="title" data-testid="offer-card__title">{item["rooms"]}-к квартира, '
+            f'{item["area"]["value"]} м², {item["location"]["address"]}</span></a>'
+            f'<span data-testid="{price_testid}">{price} ₽/мес.</span>'
+            f'<p>{item["description"][:200]}</p></div>'
+        )
+
+    padding = '<div class="filler"><span>реклама</span> <b>баннер</b></div>' * (padding_kb * 16)
+    state = ''
+    if variant == 'state':
+        # Кроме предложений в состоянии много служебных данных (фильтры, гео, SEO)
+        state_data = {
+            'page': {'name': 'search', 'params': {'rgid': 587795}},
+            'user': {'favorites': list(range(200))},
+            'geo': {'districts': [
+                {'id': n, 'name': f"Район {n}", 'polygon': [[55.7 + n / 1000, 37.6 + k / 1000] for k in range(20)]}
+                for n in range(padding_kb // 2)
+            ]},
+            'search': {'offers': {'entities': items, 'pager': {'page': 1, 'total': len(items)}}},
+            'seo': {'texts': ['Аренда квартир'] * 50},
+        }
+        state = f'<script>window.__INITIAL_STATE__ = {json.dumps(state_data, ensure_ascii=False)}</script>'
+
+    return (
+        '<!DOCTYPE html><html><head><title>Снять квартиру</title>'
+        '<script>var metrics = {a: 1}; if (a < 2) { console.log("</div>"); }</script></head><body>'
+        f'{padding}<div class="list">{"".join(cards)}</div>{padding}{state}</body></html>'
+    )
+
+
+def generate_page(offers_count: int, variant: str, padding_kb: int) -> str:
+    """Синтетическая страница поиска Яндекс.Недвижимости"""
+    if variant == 'changed':
+        # Прежние регулярки на такой странице растут сверхлинейно: берем маленькую
+        offers_count, padding_kb = min(offers_count, 20), min(padding_kb, 64)
+    return render_search_page(generate_offer_items(offers_count), variant, padding_kb)
+
+
+def render_avito_page(items: List[Dict], city_slug: str) -> str:
+    """Страница поиска Avito с карточками data-marker="item" """
+    cards = []
+    for item in items:
+        floors = item['building']['floorsCount']
+        cards.append(
+            f'<div data-marker="item" data-item-id="{item["id"]}">'
+            f'<a data-marker="item-title" href="/{city_slug}/kvartiry/{item["rooms"]}-k_{item["id"]}">'
+            f'<h3 itemprop="name">{item["rooms"]}-к. квартира, {item["area"]["value"]} м², '
+            f'{item["floor"]}/{floors} эт.</h3></a>'
+            f'<meta itemprop="price" content="{item["price"]["value"]}">'
+            f'<div class="geo-georeferences-SEtee"><span>{item["location"]["address"]}</span></div>'
+            f'</div>'
+        )
+    return f'<!DOCTYPE html><html><head><title>Авито</title></head><body>{"".join(cards)}</body></html>'
+
+
+def write_gazetteer(path, coverage: float = 1.0, seed: int = 1) -> int:
+    """
+    Газеттир (utils.gazetteer) для адресов тестового сервера
+
+    Args:
+        coverage: Доля домов, попадающих в файл (остальные достаются Nominatim)
+
+    Returns:
+        Количество записанных домов
+    """
+    rng = random.Random(seed)
+    written = 0
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['city', 'street', 'housenumber', 'lat', 'lon'])
+        for city in CITY_CENTERS:
+            for street in STREETS:
+                for house in range(1, 151):
+                    if rng.random() < coverage:
+                        lat, lon = FakeSourceServer._coordinates(f"{street} {house}, {city}")
+                        writer.writerow([city, f"улица {street}", house, f"{lat:.6f}", f"{lon:.6f}"])
+                        written += 1
+    return written
+
+
+class FakeSourceServer:
+    """
+    HTTP-сервер, имитирующий источники объявлений и Nominatim
+
+    Args:
+        latency: Задержка каждого ответа (сек)
+        jitter: Случайная добавка к задержке, от 0 до jitter (сек)
+        error_rate: Доля ответов 500/502/503
+        rate_limit: Запросов в секунду на один маршрут, сверх — 429 (0 = без лимита)
+        offers_per_page: Предложений на странице и в ответе API
+        padding_kb: Объем шумовой разметки HTML-страниц (КБ)
+        seed: Зерно генератора (одинаковые запросы — одинаковые ответы)
+    """
+
+    # Хосты, которые обслуживает сервер
+    HOSTS = (
+        'realty.yandex.ru',
+        'api.realty.yandex.ru',
+        'frontend.realty.yandex.ru',
+        'www.avito.ru',
+        'nominatim.openstreetmap.org',
+    )
+
+    ROUTES = (
+        ('yandex_api', re.compile(r'^/2\.0/offer/\d+/search\.json$')),
+        ('yandex_gate', re.compile(r'^/gate/react-page/get$')),
+        ('yandex_html', re.compile(r'^/[\w-]+/snyat/kvartira/?$')),
+        ('avito_html', re.compile(r'^/[\w-]+/kvartiry/sdam/')),
+        ('nominatim_search', re.compile(r'^/search$')),
+        ('nominatim_reverse', re.compile(r'^/reverse$')),
+    )
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.05,
+                 jitter: float = 0.0, error_rate: float = 0.0, rate_limit: float = 0.0,
+                 offers_per_page: int = 50, padding_kb: int = 64, seed: int = 42):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.offers_per_page = offers_per_page
+        self.padding_kb = padding_kb
+        self.seed = seed
+
+        self.requests = Counter()
+        self.statuses = Counter()
+        self._windows = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def host_overrides(self) -> Dict[str, str]:
+        """Значение для HttpClient.host_overrides"""
+        return {host: self.url for host in self.HOSTS}
+
+    def start(self) -> 'FakeSourceServer':
+        handler = type('FakeSourceHandler', (_FakeSourceHandler,), {'fake': self})
+        self._httpd = ThreadingHTTPServer((self.host, self.port), handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='fake-sources', daemon=True)
+        self._thread.start()
+        logger.info(f"Тестовый сервер источников запущен на {self.url}")
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # Поведение сервера
+
+    def route_for(self, path: str) -> Optional[str]:
+        for name, pattern in self.ROUTES:
+            if pattern.search(path):
+                return name
+        return None
+
+    def failure_for(self, route: str) -> Optional[int]:
+        """Статус ошибки для очередного запроса или None"""
+        with self._lock:
+            if self.rate_limit > 0:
+                window = int(time.monotonic())
+                start, count = self._windows.get(route, (window, 0))
+                if start != window:
+                    start, count = window, 0
+                self._windows[route] = (start, count + 1)
+                if count + 1 > self.rate_limit:
+                    return 429
+
+            if self.error_rate > 0 and self._random.random() < self.error_rate:
+                return self._random.choice((500, 502, 503))
+        return None
+
+    def delay(self):
+        with self._lock:
+            extra = self._random.uniform(0, self.jitter) if self.jitter > 0 else 0.0
+        time.sleep(self.latency + extra)
+
+    def record(self, route: str, status: int):
+        with self._lock:
+            self.requests[route] += 1
+            self.statuses[status] += 1
+
+    def render(self, route: str, path: str, query: Dict[str, List[str]]):
+        """Тело и Content-Type ответа маршрута"""
+        # Одинаковый запрос — одинаковые данные (для условных запросов и кэша)
+        rng = random.Random(f"{self.seed}:{path}:{sorted(query.items())}")
+
+        if route == 'yandex_api':
+            page_size = int(query.get('pageSize', [self.offers_per_page])[0])
+            items = generate_offer_items(min(page_size, self.offers_per_page), rng)
+            return self._json({'response': {'offers': items}})
+
+        if route == 'yandex_gate':
+            items = generate_offer_items(self.offers_per_page, rng)
+            return self._json({'response': {'search': {'offers': [{'offer': item} for item in items]}}})
+
+        if route == 'yandex_html':
+            items = generate_offer_items(self.offers_per_page, rng)
+            return render_search_page(items, 'cards', self.padding_kb).encode('utf-8'), 'text/html; charset=utf-8'
+
+        if route == 'avito_html':
+            items = generate_offer_items(self.offers_per_page, rng)
+            city_slug = path.strip('/').split('/')[0]
+            return render_avito_page(items, city_slug).encode('utf-8'), 'text/html; charset=utf-8'
+
+        if route == 'nominatim_search':
+            text = query.get('q', [''])[0]
+            lat, lon = self._coordinates(text)
+            return self._json([{
+                'place_id': int(hashlib.md5(text.encode('utf-8')).hexdigest()[:8], 16),
+                'lat': f"{lat:.7f}",
+                'lon': f"{lon:.7f}",
+                'display_name': text,
+                'type': 'house',
+                'importance': 0.5,
+            }])
+
+        lat, lon = float(query.get('lat', ['0'])[0]), float(query.get('lon', ['0'])[0])
+        city = min(CITY_CENTERS, key=lambda name: math.dist(CITY_CENTERS[name], (lat, lon)))
+        return self._json({
+            'display_name': f"ул. {rng.choice(STREETS)}, {rng.randint(1, 150)}, {city}, Россия",
+            'address': {'road': f"улица {rng.choice(STREETS)}", 'city': city, 'country': 'Россия'},
+        })
+
+    @staticmethod
+    def _json(data):
+        return json.dumps(data, ensure_ascii=False).encode('utf-8'), 'application/json; charset=utf-8'
+
+    @staticmethod
+    def _coordinates(text: str):
+        """Координаты рядом с центром города из запроса (детерминированно по тексту)"""
+        center = next((CITY_CENTERS[name] for name in CITY_CENTERS if name in text), CITY_CENTERS['Москва'])
+        digest = hashlib.md5(text.encode('utf-8')).digest()
+        lat_offset = (digest[0] * 256 + digest[1]) / 65535 - 0.5
+        lon_offset = (digest[2] * 256 + digest[3]) / 65535 - 0.5
+        return center[0] + lat_offset * 0.2, center[1] + lon_offset * 0.3
+
+
+class _FakeSourceHandler(BaseHTTPRequestHandler):
+    fake = None
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        route = self.fake.route_for(parts.path)
+        self.fake.delay()
+
+        if route is None:
+            return self._send(404, b'{"error": "not found"}', 'application/json')
+
+        status = self.fake.failure_for(route)
+        if status is not None:
+            headers = {'Retry-After': '1'} if status == 429 else {}
+            self.fake.record(route, status)
+            return self._send(status, b'{"error": "unavailable"}', 'application/json', headers)
+
+        body, content_type = self.fake.render(route, parts.path, parse_qs(parts.query))
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.fake.record(route, 304)
+            return self._send(304, b'', content_type, {'ETag': etag})
+
+        self.fake.record(route, 200)
+        self._send(200, body, content_type, {'ETag': etag})
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"Тестовый сервер: {format % args}")
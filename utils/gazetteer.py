@@ -0,0 +1,180 @@
+"""
+Локальный справочник адресов (газеттир) для геокодирования без сети
+
+Файл CSV со строками «город, улица, номер дома, широта, долгота» (например,
+выгрузка адресов OSM: addr:city, addr:street, addr:housenumber, lat, lon)
+загружается в компактный индекс в памяти:
+город → улица → {номер дома → позиция в массиве координат}.
+Поиск адреса — разбор строки (utils.address_normalizer) и несколько
+обращений к словарям, без HTTP.
+"""
+import csv
+import gzip
+import logging
+import threading
+from array import array
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+from .address_normalizer import address_normalizer
+
+logger = logging.getLogger(__name__)
+
+
+class Gazetteer:
+    """Индекс адресов городов в памяти"""
+
+    # Возможные названия колонок файла
+    COLUMNS = {
+        'city': ('city', 'addr:city', 'город'),
+        'street': ('street', 'addr:street', 'улица'),
+        'housenumber': ('housenumber', 'addr:housenumber', 'house', 'дом'),
+        'lat': ('lat', 'latitude', 'y', 'широта'),
+        'lon': ('lon', 'longitude', 'x', 'долгота'),
+    }
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else None
+        self._cities: Dict[str, Dict[str, Dict[str, Dict[str, int]]]] = {}
+        self._coords = array('d')
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    # --- загрузка ---
+
+    def _open(self, path: Path):
+        opener = gzip.open if path.suffix.lower() == '.gz' else open
+        return opener(path, 'rt', encoding='utf-8-sig', newline='')
+
+    def _rows(self, path: Path) -> Iterator[Tuple[str, str, str, float, float]]:
+        with self._open(path) as file:
+            sample = file.read(4096)
+            file.seek(0)
+            delimiter = ';' if sample.count(';') > sample.count(',') else ','
+            reader = csv.DictReader(file, delimiter=delimiter)
+            header = {name.strip().lower(): name for name in reader.fieldnames or ()}
+            columns = {}
+            for field, aliases in self.COLUMNS.items():
+                columns[field] = next((header[alias] for alias in aliases if alias in header), None)
+            missing = [field for field, column in columns.items() if column is None]
+            if missing:
+                raise ValueError(f"В газеттире {path.name} нет колонок: {', '.join(missing)}")
+
+            for row in reader:
+                try:
+                    yield (
+                        row[columns['city']], row[columns['street']], row[columns['housenumber']],
+                        float(row[columns['lat']]), float(row[columns['lon']]),
+                    )
+                except (TypeError, ValueError):
+                    continue
+
+    def load(self, path: Optional[Path] = None) -> int:
+        """Загружает файл в индекс (заменяя прежний), возвращает количество домов"""
+        with self._lock:
+            return self._load(Path(path or self.path))
+
+    def _load(self, path: Path) -> int:
+        cities = {}
+        coords = array('d')
+        skipped = 0
+
+        for city, street, house, lat, lon in self._rows(path):
+            street_key, street_type = address_normalizer.street(street)
+            house_key = address_normalizer.house(house)
+            if not street_key or not house_key:
+                skipped += 1
+                continue
+            houses = cities.setdefault(address_normalizer.key(city), {}).setdefault(street_key, {}).setdefault(street_type, {})
+            if house_key not in houses:
+                houses[house_key] = len(coords) // 2
+                coords.extend((lat, lon))
+
+        self._cities, self._coords, self._loaded = cities, coords, True
+        logger.info(f"Газеттир {path.name}: домов {len(coords) // 2}, городов {len(cities)}, пропущено строк {skipped}")
+        return len(coords) // 2
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        # Остальные потоки ждут окончания загрузки, а не ищут в пустом индексе
+        with self._lock:
+            if self._loaded:
+                return
+            if self.path is None or not self.path.exists():
+                logger.info(f"Газеттир не найден ({self.path}), геокодирование без него")
+            else:
+                try:
+                    self._load(self.path)
+                except (OSError, ValueError) as e:
+                    logger.error(f"Не удалось загрузить газеттир {self.path}: {e}")
+            self._loaded = True
+
+    @property
+    def size(self) -> int:
+        self._ensure_loaded()
+        return len(self._coords) // 2
+
+    # --- поиск ---
+
+    def _street_centroid(self, houses: Dict[str, int]) -> Tuple[float, float]:
+        lat = sum(self._coords[2 * index] for index in houses.values()) / len(houses)
+        lon = sum(self._coords[2 * index + 1] for index in houses.values()) / len(houses)
+        return lat, lon
+
+    def lookup(self, address: str, city: Optional[str] = None) -> Optional[Dict]:
+        """
+        Координаты адреса из индекса
+
+        Returns:
+            {lat, lon, display_name, precision} — дом (house) или, если номер
+            не указан, середина улицы (street); None, если адреса нет
+        """
+        self._ensure_loaded()
+        city = city or ''
+        streets = self._cities.get(address_normalizer.key(city))
+        if not streets:
+            return None
+
+        parsed = address_normalizer.parse(address or '', city)
+        if parsed is None:
+            return None
+        street, street_type, house = parsed
+
+        variants = streets.get(street)
+        if not variants:
+            return None
+        if street_type in variants:
+            houses = variants[street_type]
+        elif len(variants) == 1:
+            # Тип не указан или записан иначе, но улица с таким названием одна
+            houses = next(iter(variants.values()))
+        else:
+            return None
+
+        if house is None:
+            lat, lon = self._street_centroid(houses)
+            precision = 'street'
+        else:
+            index = houses.get(house)
+            if index is None:
+                return None
+            lat, lon = self._coords[2 * index], self._coords[2 * index + 1]
+            precision = 'house'
+
+        return {
+            'lat': lat,
+            'lon': lon,
+            'display_name': f"{street_type + ' ' if street_type else ''}{street}{', ' + house if house else ''}, {city}",
+            'precision': precision,
+        }
+
+
+def _default_path() -> Optional[Path]:
+    from django.conf import settings
+    path = getattr(settings, 'GEOCODING_GAZETTEER_PATH', None) if settings.configured else None
+    return Path(path) if path else None
+
+
+# Глобальный экземпляр (файл загружается при первом поиске)
+gazetteer = Gazetteer(_default_path())
@@ -0,0 +1,391 @@
+"""
+Общий кэш геокодирования в базе данных
+
+Все геокодеры (utils.geocoder*, сервис геокодирования, очередь и команда
+geocode_addresses) сначала ищут адрес здесь и сохраняют сюда найденные
+координаты, поэтому один и тот же адрес не геокодируется повторно ни в
+другом процессе, ни после перезапуска. Ключ — нормализованный адрес без
+страны и города (они хранятся отдельно) и нормализованный город; вместе с координатами хранятся точность и источник результата.
+
+Неудачи тоже кэшируются: отрицательная запись (без координат) хранит код
+причины и время, до которого адрес повторно не запрашивается. Пауза
+зависит от причины (GEOCODING_FAILURE_TTL) и удваивается с каждой новой
+неудачей подряд, поэтому несуществующие адреса перестают расходовать
+лимит запросов, а временные ошибки повторяются быстро.
+"""
+import logging
+from datetime import datetime, timedelta
+from decimal import Decimal
+from functools import wraps
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from analyzer.models import GeocodeCacheEntry
+
+from .address_normalizer import address_normalizer
+
+logger = logging.getLogger(__name__)
+
+
+class GeocodeCache:
+    """Чтение и запись кэша геокодирования"""
+
+    # Тип объекта Nominatim (addresstype / type) → точность
+    _PRECISION_BY_TYPE = {
+        'house': GeocodeCacheEntry.PRECISION_HOUSE,
+        'building': GeocodeCacheEntry.PRECISION_HOUSE,
+        'apartments': GeocodeCacheEntry.PRECISION_HOUSE,
+        'residential': GeocodeCacheEntry.PRECISION_HOUSE,
+        'road': GeocodeCacheEntry.PRECISION_STREET,
+        'street': GeocodeCacheEntry.PRECISION_STREET,
+        'suburb': GeocodeCacheEntry.PRECISION_DISTRICT,
+        'quarter': GeocodeCacheEntry.PRECISION_DISTRICT,
+        'neighbourhood': GeocodeCacheEntry.PRECISION_DISTRICT,
+        'city_district': GeocodeCacheEntry.PRECISION_DISTRICT,
+        'city': GeocodeCacheEntry.PRECISION_CITY,
+        'town': GeocodeCacheEntry.PRECISION_CITY,
+        'village': GeocodeCacheEntry.PRECISION_CITY,
+    }
+
+    # Ранг точности: чем больше, тем точнее
+    PRECISION_RANK = {
+        GeocodeCacheEntry.PRECISION_HOUSE: 4,
+        GeocodeCacheEntry.PRECISION_STREET: 3,
+        GeocodeCacheEntry.PRECISION_DISTRICT: 2,
+        GeocodeCacheEntry.PRECISION_CITY: 1,
+        GeocodeCacheEntry.PRECISION_UNKNOWN: 0,
+    }
+
+    # Пауза после первой неудачи по причине (сек), если не задана GEOCODING_FAILURE_TTL
+    FAILURE_TTL = {
+        GeocodeCacheEntry.FAILURE_NOT_FOUND: 24 * 60 * 60,
+        GeocodeCacheEntry.FAILURE_RATE_LIMITED: 10 * 60,
+        GeocodeCacheEntry.FAILURE_HTTP_ERROR: 10 * 60,
+        GeocodeCacheEntry.FAILURE_NETWORK: 5 * 60,
+        GeocodeCacheEntry.FAILURE_ERROR: 60 * 60,
+    }
+    FAILURE_TTL_MAX = 30 * 24 * 60 * 60
+
+    def normalize(self, text: str) -> str:
+        """«ул. Ленина, д. 5» и «улица Ленина 5» → «ул ленина 5» (см. utils.address_normalizer)"""
+        return address_normalizer.key(text or '')
+
+    def make_key(self, address: str, city: Optional[str] = None) -> Tuple[str, str]:
+        """
+        (нормализованный адрес, нормализованный город)
+
+        Город и страна из адреса в ключ адреса не входят (AddressNormalizer.local_key):
+        «г. Москва, ул. Ленина, 5» и «ул. Ленина, 5» в Москве — одна запись.
+        """
+        return address_normalizer.local_key(address or '', city or '')[:255], self.normalize(city or '')[:100]
+
+    @staticmethod
+    def _as_result(entry: Dict) -> Dict:
+        return {
+            'lat': float(entry['latitude']),
+            'lon': float(entry['longitude']),
+            'display_name': entry['display_name'],
+            'precision': entry['precision'],
+            'source': entry['source'],
+            'from_cache': True,
+        }
+
+    @staticmethod
+    def _as_failure(entry: Dict) -> Dict:
+        return {
+            'reason': entry['failure_reason'],
+            'failures': entry['failures'],
+            'retry_after': entry['retry_after'],
+        }
+
+    _VALUES = (
+        'address_key', 'city_key', 'latitude', 'longitude', 'display_name', 'precision', 'source',
+        'failure_reason', 'failures', 'retry_after',
+    )
+
+    def _rows(self, keys: Iterable[Tuple[str, str]], values: Tuple[str, ...]) -> List[Dict]:
+        """Записи кэша для ключей make_key: по запросу на город и на каждые 500 адресов"""
+        keys_by_city = {}
+        for address_key, city_key in keys:
+            if address_key:
+                keys_by_city.setdefault(city_key, set()).add(address_key)
+
+        rows = []
+        for city_key, address_keys in keys_by_city.items():
+            address_keys = list(address_keys)
+            for start in range(0, len(address_keys), 500):
+                rows.extend(GeocodeCacheEntry.objects.filter(
+                    city_key=city_key, address_key__in=address_keys[start:start + 500]
+                ).values(*values))
+        return rows
+
+    def probe(self, address: str, city: Optional[str] = None) -> Tuple[Optional[Dict], Optional[Dict]]:
+        """
+        Результат или действующая отрицательная запись одним запросом
+
+        Returns:
+            (результат, None), (None, {reason, failures, retry_after}), если
+            адрес еще на паузе после неудачи, или (None, None)
+        """
+        found, failed = self.probe_many([(address, city)])
+        key = self.make_key(address, city)
+        return found.get(key), failed.get(key)
+
+    def probe_many(self, pairs: Iterable[Tuple[str, Optional[str]]]) -> Tuple[Dict, Dict]:
+        """
+        Результаты и действующие отрицательные записи для многих адресов
+
+        Returns:
+            Два словаря по ключу make_key(адрес, город): найденные результаты
+            и неудачи, пауза которых еще не истекла
+        """
+        now = timezone.now()
+        found, failed = {}, {}
+        for entry in self._rows((self.make_key(address, city) for address, city in pairs), self._VALUES):
+            key = (entry['address_key'], entry['city_key'])
+            if entry['latitude'] is not None:
+                found[key] = self._as_result(entry)
+            elif entry['retry_after'] and entry['retry_after'] > now:
+                failed[key] = self._as_failure(entry)
+        return found, failed
+
+    def get(self, address: str, city: Optional[str] = None) -> Optional[Dict]:
+        """Результат из кэша в формате геокодеров (lat, lon, display_name, precision, source) или None"""
+        return self.probe(address, city)[0]
+
+    def get_many(self, pairs: Iterable[Tuple[str, Optional[str]]]) -> Dict[Tuple[str, str], Dict]:
+        """
+        Результаты для многих адресов одного или нескольких городов
+
+        Returns:
+            Словарь make_key(адрес, город) → результат (только найденные)
+        """
+        return self.probe_many(pairs)[0]
+
+    def precision_rank(self, precision: str) -> int:
+        """Ранг точности; у объекта без координат (пустая точность) — -1"""
+        return self.PRECISION_RANK.get(precision or '', -1)
+
+    def less_precise(self, precision: str) -> List[str]:
+        """Точности грубее заданной (для выборки объектов на перегеокодирование)"""
+        rank = self.precision_rank(precision)
+        return [name for name, name_rank in self.PRECISION_RANK.items() if name_rank < rank]
+
+    def location_fields(self, result: Dict) -> Dict:
+        """Поля координат предложения или квартиры по результату геокодера"""
+        return {
+            'latitude': Decimal(str(result['lat'])).quantize(Decimal('0.000001')),
+            'longitude': Decimal(str(result['lon'])).quantize(Decimal('0.000001')),
+            'location_precision': self.infer_precision(result),
+            'location_source': (result.get('source') or '')[:30],
+        }
+
+    # Поля, которые записывает location_fields (для bulk_update)
+    LOCATION_FIELDS = ['latitude', 'longitude', 'location_precision', 'location_source']
+
+    def infer_precision(self, result: Dict) -> str:
+        """Точность по ответу Nominatim или результату геокодера"""
+        if result.get('precision') in dict(GeocodeCacheEntry.PRECISION_CHOICES):
+            return result['precision']
+        if result.get('is_approximate'):
+            if result.get('fallback_type') == 'city_center':
+                return GeocodeCacheEntry.PRECISION_CITY
+            return GeocodeCacheEntry.PRECISION_DISTRICT
+
+        for field in ('addresstype', 'type'):
+            precision = self._PRECISION_BY_TYPE.get(result.get(field) or '')
+            if precision:
+                return precision
+
+        details = result.get('address') or {}
+        if details.get('house_number'):
+            return GeocodeCacheEntry.PRECISION_HOUSE
+        if details.get('road'):
+            return GeocodeCacheEntry.PRECISION_STREET
+        if details.get('suburb') or details.get('city_district'):
+            return GeocodeCacheEntry.PRECISION_DISTRICT
+        return GeocodeCacheEntry.PRECISION_UNKNOWN
+
+    def set(self, address: str, city: Optional[str], lat: float, lon: float, source: str,
+            precision: str = GeocodeCacheEntry.PRECISION_UNKNOWN, display_name: str = '') -> bool:
+        """Сохраняет (или обновляет) координаты адреса"""
+        address_key, city_key = self.make_key(address, city)
+        if not address_key:
+            return False
+        try:
+            GeocodeCacheEntry.objects.update_or_create(
+                address_key=address_key,
+                city_key=city_key,
+                defaults={
+                    'latitude': Decimal(str(lat)).quantize(Decimal('0.000001')),
+                    'longitude': Decimal(str(lon)).quantize(Decimal('0.000001')),
+                    'precision': precision,
+                    'source': source[:30],
+                    'display_name': (display_name or '')[:255],
+                    'failure_reason': '',
+                    'failures': 0,
+                    'retry_after': None,
+                },
+            )
+        except Exception as e:
+            # Кэш не должен ломать геокодирование (например, при гонке двух процессов)
+            logger.warning(f"Не удалось сохранить в кэш геокодирования {address}: {e}")
+            return False
+        return True
+
+    def _cacheable(self, result: Optional[Dict]) -> bool:
+        return bool(result) and not (
+            result.get('from_cache') or result.get('is_fallback') or result.get('is_approximate')
+        )
+
+    def store_many(self, items: Iterable[Tuple[str, Optional[str], Dict]]) -> int:
+        """
+        Пакетное сохранение результатов: (адрес, город, результат геокодера с полем source)
+
+        Returns:
+            Количество сохраненных записей
+        """
+        entries = {}
+        for address, city, result in items:
+            address_key, city_key = self.make_key(address, city)
+            if not address_key or not self._cacheable(result):
+                continue
+            entries[(address_key, city_key)] = GeocodeCacheEntry(
+                address_key=address_key,
+                city_key=city_key,
+                latitude=Decimal(str(result['lat'])).quantize(Decimal('0.000001')),
+                longitude=Decimal(str(result['lon'])).quantize(Decimal('0.000001')),
+                precision=self.infer_precision(result),
+                source=result.get('source', '')[:30],
+                display_name=(result.get('display_name') or '')[:255],
+            )
+        if entries:
+            GeocodeCacheEntry.objects.bulk_create(
+                list(entries.values()),
+                update_conflicts=True,
+                unique_fields=['address_key', 'city_key'],
+                update_fields=[
+                    'latitude', 'longitude', 'precision', 'source', 'display_name',
+                    'failure_reason', 'failures', 'retry_after', 'updated_at',
+                ],
+                batch_size=500,
+            )
+        return len(entries)
+
+    def failure_ttl(self, reason: str, failures: int) -> timedelta:
+        """Пауза после failures-й неудачи подряд: базовая для причины, удвоенная failures - 1 раз"""
+        ttl = {**self.FAILURE_TTL, **getattr(settings, 'GEOCODING_FAILURE_TTL', {})}
+        base = ttl.get(reason, ttl[GeocodeCacheEntry.FAILURE_ERROR])
+        limit = getattr(settings, 'GEOCODING_FAILURE_TTL_MAX', self.FAILURE_TTL_MAX)
+        return timedelta(seconds=min(base * 2 ** min(failures - 1, 30), limit))
+
+    def store_failures(self, items: Iterable[Tuple[str, Optional[str], str]]) -> Dict[Tuple[str, str], Dict]:
+        """
+        Пакетное сохранение неудач: (адрес, город, код причины GeocodeCacheEntry.FAILURE_*)
+
+        Счетчик неудач подряд продолжается с прежней отрицательной записи;
+        адреса, которые тем временем нашел другой процесс, не трогаются.
+
+        Returns:
+            Словарь make_key(адрес, город) → {reason, failures, retry_after}
+        """
+        reasons = {}
+        for address, city, reason in items:
+            key = self.make_key(address, city)
+            if key[0] and reason:
+                reasons[key] = reason
+        if not reasons:
+            return {}
+
+        previous = {
+            (entry['address_key'], entry['city_key']): entry
+            for entry in self._rows(reasons, ('address_key', 'city_key', 'latitude', 'failures'))
+        }
+        now = timezone.now()
+        entries, stored = [], {}
+        for key, reason in reasons.items():
+            entry = previous.get(key)
+            if entry and entry['latitude'] is not None:
+                continue
+            failures = (entry['failures'] if entry else 0) + 1
+            stored[key] = {
+                'reason': reason,
+                'failures': failures,
+                'retry_after': now + self.failure_ttl(reason, failures),
+            }
+            entries.append(GeocodeCacheEntry(
+                address_key=key[0],
+                city_key=key[1],
+                failure_reason=reason,
+                failures=failures,
+                retry_after=stored[key]['retry_after'],
+            ))
+
+        try:
+            GeocodeCacheEntry.objects.bulk_create(
+                entries,
+                update_conflicts=True,
+                unique_fields=['address_key', 'city_key'],
+                update_fields=['failure_reason', 'failures', 'retry_after', 'updated_at'],
+                batch_size=500,
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить неудачи геокодирования: {e}")
+            return {}
+        return stored
+
+    def store_failure(self, address: str, city: Optional[str], reason: str) -> Optional[datetime]:
+        """Сохраняет неудачу геокодирования адреса; возвращает время, до которого адрес не запрашивается"""
+        failure = self.store_failures([(address, city, reason)]).get(self.make_key(address, city))
+        return failure['retry_after'] if failure else None
+
+    def store_result(self, address: str, city: Optional[str], result: Dict, source: str) -> bool:
+        """
+        Сохраняет результат геокодера
+
+        Приблизительные координаты (fallback по району или центру города)
+        вычисляются локально и не кэшируются, чтобы не подменять ими
+        настоящий результат при следующем геокодировании.
+        """
+        if not self._cacheable(result):
+            return False
+        return self.set(
+            address, city, result['lat'], result['lon'], source,
+            precision=self.infer_precision(result),
+            display_name=result.get('display_name', ''),
+        )
+
+    def cached(self, source: str):
+        """
+        Декоратор метода geocode(self, address, city=None) -> Optional[Dict]:
+        сначала кэш, затем сам геокодер с сохранением результата
+
+        Такие геокодеры не сообщают причину неудачи, поэтому None
+        сохраняется как FAILURE_ERROR: по умолчанию пауза час (FAILURE_TTL) —
+        короче, чем после «не найден», но длиннее, чем после сетевой ошибки
+        или ограничения частоты.
+        """
+        def decorator(method):
+            @wraps(method)
+            def wrapper(geocoder, address: str, city: Optional[str] = None, *args, **kwargs):
+                result, failure = self.probe(address, city)
+                if result is not None:
+                    logger.debug(f"Геокодирование из кэша: {address}, {city}")
+                    return result
+                if failure is not None:
+                    logger.debug(f"Адрес на паузе после неудачи ({failure['reason']}): {address}, {city}")
+                    return None
+                result = method(geocoder, address, city, *args, **kwargs)
+                if result:
+                    self.store_result(address, city, result, source)
+                else:
+                    self.store_failure(address, city, GeocodeCacheEntry.FAILURE_ERROR)
+                return result
+            return wrapper
+        return decorator
+
+
+# Глобальный экземпляр
+geocode_cache = GeocodeCache()
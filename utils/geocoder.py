@@ -7,6 +7,10 @@ from typing import Optional, Dict, Tuple
 from django.core.cache import cache
 import random
 import math
+from .http_client import http_client
+from .address_normalizer import address_normalizer
+from .geocode_cache import geocode_cache
+from .rate_limiter import source_rate_limiter
 logger = logging.getLogger(__name__)
 
 
@@ -16,46 +20,19 @@ class OpenStreetMapGeocoder:
     BASE_URL = "https://nominatim.openstreetmap.org/search"
 
     def __init__(self):
-        self.session = requests.Session()
         # Добавляем пользовательский агент и реферер
-        self.session.headers.update({
+        self.headers = {
             'User-Agent': 'RentAnalyzerPro/1.0 (educational-project@example.com)',
             'Accept': 'application/json',
             'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
             'Referer': 'https://rent-analyzer-pro.example.com/'
-        })
-        self.last_request_time = 0
-        self.min_request_interval = 1.0  # Минимальная задержка между запросами (1 секунда)
+        }
 
     def normalize_address(self, address: str) -> str:
         """
-        Нормализация адреса для лучшего поиска
+        Нормализация адреса для лучшего поиска (см. utils.address_normalizer)
         """
-        # Убираем лишние пробелы
-        address = ' '.join(address.strip().split())
-
-        # Стандартизируем сокращения (только если отдельно стоят)
-        replacements = [
-            (' пр-кт ', ' проспект '),
-            (' пр. ', ' проспект '),
-            (' ул. ', ' улица '),
-            (' пер. ', ' переулок '),
-            (' наб. ', ' набережная '),
-            (' пл. ', ' площадь '),
-            (' ш. ', ' шоссе '),
-            (' бул. ', ' бульвар '),
-            (' пр-д ', ' проезд '),
-            (' ал. ', ' аллея '),
-            (' б-р ', ' бульвар '),
-        ]
-
-        for old, new in replacements:
-            address = address.replace(old, new)
-
-        # Убираем двойные пробелы
-        address = ' '.join(address.split())
-
-        return address
+        return address_normalizer.query(address)
 
     def extract_address_parts(self, address: str):
         """
@@ -97,9 +74,10 @@ class OpenStreetMapGeocoder:
                 'street_without_number': ' '.join(address.split()[:-1]) if len(address.split()) > 1 else address,
             }
 
+    @geocode_cache.cached('nominatim')
     def geocode(self, address: str, city: str = None) -> Optional[Dict]:
         """
-        Геокодирование адреса с кэшированием и задержками
+        Геокодирование адреса с кэшированием (в базе, см. utils.geocode_cache) и задержками
         """
         # Нормализуем адрес
         normalized_address = self.normalize_address(address)
@@ -127,15 +105,6 @@ class OpenStreetMapGeocoder:
         address_parts = self.extract_address_parts(normalized_address)
         logger.info(f"Части адреса: {address_parts}")
 
-        # Создаем ключ для кэша
-        cache_key = f"geocode_{normalized_address}_{city}"
-
-        # Пробуем получить из кэша
-        cached_result = cache.get(cache_key)
-        if cached_result is not None:
-            logger.info(f"Геокодирование из кэша: {normalized_address}, {city}")
-            return cached_result
-
         # Соблюдаем задержку между запросами
         self._respect_rate_limit()
 
@@ -212,11 +181,12 @@ class OpenStreetMapGeocoder:
                         logger.info(f"Попытка геокодирования [{i + 1}/{len(query_variants)}]: {query}")
 
                         # Увеличиваем таймаут
-                        response = self.session.get(
+                        response = http_client.get(
                             self.BASE_URL,
                             params=params,
                             timeout=30,  # Увеличиваем таймаут
                             headers={
+                                **self.headers,
                                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (educational-project@rentanalyzer.com)'
                             }
                         )
@@ -352,9 +322,10 @@ class OpenStreetMapGeocoder:
 
             logger.info(f"Геокодирование (без countrycodes): {query}")
 
-            response = self.session.get(
+            response = http_client.get(
                 self.BASE_URL,
                 params=params,
+                headers=self.headers,
                 timeout=15
             )
 
@@ -451,16 +422,8 @@ class OpenStreetMapGeocoder:
             return None
 
     def _respect_rate_limit(self):
-        """Соблюдение ограничений по частоте запросов"""
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
-
-        if time_since_last < self.min_request_interval:
-            sleep_time = self.min_request_interval - time_since_last
-            logger.debug(f"Задержка {sleep_time:.2f} сек для соблюдения rate limit")
-            time.sleep(sleep_time + random.uniform(0.1, 0.5))  # Добавляем случайную задержку
-
-        self.last_request_time = time.time()
+        """Общий для всех геокодеров и процессов лимит запросов к Nominatim"""
+        source_rate_limiter.wait('nominatim')
 
     def calculate_distance(self, lat1, lon1, lat2, lon2):
         """Расчет расстояния между двумя точками (в км)"""
@@ -487,9 +450,10 @@ class OpenStreetMapGeocoder:
                 'accept-language': 'ru',
             }
 
-            response = self.session.get(
+            response = http_client.get(
                 "https://nominatim.openstreetmap.org/reverse",
                 params=params,
+                headers=self.headers,
                 timeout=10
             )
 
@@ -2,7 +2,10 @@ import requests
 import time
 import logging
 from typing import Optional, Dict
-from django.core.cache import cache
+from .http_client import http_client
+from .address_normalizer import address_normalizer
+from .geocode_cache import geocode_cache
+from .rate_limiter import source_rate_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -13,25 +16,16 @@ class WorkingGeocoder:
     BASE_URL = "https://nominatim.openstreetmap.org/search"
 
     def __init__(self):
-        self.session = requests.Session()
         # ВАЖНО: Используем тот же User-Agent, что и в работающем тесте
-        self.session.headers.update({
+        self.headers = {
             'User-Agent': 'RentAnalyzerPro/1.0',
             'Accept': 'application/json',
             'Accept-Language': 'ru-RU,ru;q=0.9',
-        })
-        self.last_request_time = 0
-        self.min_request_interval = 1.0  # 1 секунда между запросами
+        }
 
     def _respect_rate_limit(self):
-        """Соблюдение rate limit"""
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
-
-        if time_since_last < self.min_request_interval:
-            time.sleep(self.min_request_interval - time_since_last)
-
-        self.last_request_time = time.time()
+        """Общий для всех геокодеров и процессов лимит запросов к Nominatim"""
+        source_rate_limiter.wait('nominatim')
 
     def _format_address_for_nominatim(self, address: str, city: str = None) -> str:
         """
@@ -39,32 +33,8 @@ class WorkingGeocoder:
 
         Из 'ул. Садовая, 4' делаем 'улица Садовая 4'
         """
-        # Сначала нормализуем адрес
-        address = address.strip()
-
-        # Заменяем сокращения
-        replacements = {
-            'ул.': 'улица',
-            'пр.': 'проспект',
-            'пер.': 'переулок',
-            'наб.': 'набережная',
-            'пл.': 'площадь',
-            'ш.': 'шоссе',
-            'б-р': 'бульвар',
-            'ал.': 'аллея',
-        }
-
-        # Простая замена в строке
-        for short, full in replacements.items():
-            # Заменяем только если это отдельное слово
-            address = address.replace(f' {short} ', f' {full} ')
-            if address.startswith(f'{short} '):
-                address = address.replace(f'{short} ', f'{full} ', 1)
-
-        # Убираем запятые между улицей и номером
-        # 'улица Садовая, 4' -> 'улица Садовая 4'
-        import re
-        address = re.sub(r'(\D+),\s*(\d+)', r'\1 \2', address)
+        # Сокращения и запятая перед номером дома (utils.address_normalizer)
+        address = address_normalizer.query(address)
 
         # Если указан город, добавляем его
         if city:
@@ -82,23 +52,15 @@ class WorkingGeocoder:
         else:
             return f"{address}, Россия"
 
+    @geocode_cache.cached('nominatim')
     def geocode(self, address: str, city: str = None) -> Optional[Dict]:
         """
         Геокодирование - точная копия работающего теста
+        (результаты кэшируются в базе, см. utils.geocode_cache)
         """
         # Форматируем адрес
         formatted_address = self._format_address_for_nominatim(address, city)
 
-        # Кэширование
-        cache_key = f"geocode_working_{address}_{city}"
-        try:
-            cached_result = cache.get(cache_key)
-            if cached_result:
-                logger.info(f"Из кэша: {formatted_address}")
-                return cached_result
-        except:
-            pass
-
         # Соблюдаем rate limit
         self._respect_rate_limit()
 
@@ -114,11 +76,12 @@ class WorkingGeocoder:
             logger.info(f"Запрос Nominatim: {formatted_address}")
 
             # Запрос с таймаутом как в тесте
-            response = self.session.get(
+            response = http_client.get(
                 self.BASE_URL,
                 params=params,
                 timeout=10,  # ТАКОЙ ЖЕ ТАЙМАУТ КАК В РАБОТАЮЩЕМ ТЕСТЕ
                 headers={
+                    **self.headers,
                     'User-Agent': 'RentAnalyzerPro/1.0'  # ТАКОЙ ЖЕ User-Agent
                 }
             )
@@ -137,14 +100,9 @@ class WorkingGeocoder:
                         'display_name': result.get('display_name', ''),
                         'address': result.get('address', {}),
                         'query_used': formatted_address,
+                        'precision': geocode_cache.infer_precision(result),
                     }
 
-                    # Кэшируем
-                    try:
-                        cache.set(cache_key, geocode_result, 60 * 60 * 24)
-                    except:
-                        pass
-
                     logger.info(f"Успешно: {geocode_result['lat']}, {geocode_result['lon']}")
                     return geocode_result
                 else:
@@ -159,6 +117,7 @@ class WorkingGeocoder:
 
         return None
 
+    @geocode_cache.cached('nominatim')
     def geocode_structured(self, address: str, city: str = None) -> Optional[Dict]:
         """
         Структурированное геокодирование (второй вариант из теста)
@@ -193,11 +152,11 @@ class WorkingGeocoder:
                 # Обычный запрос
                 params['q'] = formatted_address
 
-            response = self.session.get(
+            response = http_client.get(
                 self.BASE_URL,
                 params=params,
                 timeout=10,
-                headers={'User-Agent': 'RentAnalyzerPro/1.0'}
+                headers={**self.headers, 'User-Agent': 'RentAnalyzerPro/1.0'}
             )
 
             if response.status_code == 200:
@@ -208,6 +167,7 @@ class WorkingGeocoder:
                         'lat': float(result['lat']),
                         'lon': float(result['lon']),
                         'display_name': result.get('display_name', ''),
+                        'precision': geocode_cache.infer_precision(result),
                     }
 
         except Exception as e:
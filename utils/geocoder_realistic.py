@@ -3,7 +3,10 @@ import requests
 import time
 import logging
 from typing import Optional, Dict
-from django.core.cache import cache
+from .http_client import http_client
+from .address_normalizer import address_normalizer
+from .geocode_cache import geocode_cache
+from .rate_limiter import source_rate_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -14,23 +17,15 @@ class RealisticGeocoder:
     BASE_URL = "https://nominatim.openstreetmap.org/search"
 
     def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
+        self.headers = {
             'User-Agent': 'RentAnalyzer/1.0 (educational-project@example.com)',
             'Accept': 'application/json',
             'Accept-Language': 'ru-RU,ru;q=0.9',
-        })
-        self.last_request_time = 0
-        self.min_request_interval = 1.5  # Безопасная задержка
+        }
 
     def _respect_rate_limit(self):
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
-
-        if time_since_last < self.min_request_interval:
-            time.sleep(self.min_request_interval - time_since_last)
-
-        self.last_request_time = time.time()
+        """Общий для всех геокодеров и процессов лимит запросов к Nominatim"""
+        source_rate_limiter.wait('nominatim')
 
     def _prepare_query(self, address: str, city: str = None) -> str:
         """
@@ -40,28 +35,8 @@ class RealisticGeocoder:
         - "ул. Ленина, 50", "Екатеринбург" → "улица Ленина 50, Екатеринбург, Россия"
         - "Невский пр., 28", "Санкт-Петербург" → "Невский проспект 28, Санкт-Петербург, Россия"
         """
-        # Нормализация
-        address = address.strip()
-
-        # Заменяем общеупотребительные сокращения
-        replacements = [
-            ('ул.', 'улица'),
-            ('пр.', 'проспект'),
-            ('пер.', 'переулок'),
-            ('наб.', 'набережная'),
-            ('пл.', 'площадь'),
-            ('ш.', 'шоссе'),
-            ('б-р', 'бульвар'),
-            ('ал.', 'аллея'),
-            ('д.', 'дом'),
-            ('к.', 'квартира'),
-        ]
-
-        for short, full in replacements:
-            address = address.replace(short, full)
-
-        # Убираем лишние пробелы
-        address = ' '.join(address.split())
+        # Сокращения раскрываются только как целые слова (utils.address_normalizer)
+        address = address_normalizer.query(address)
 
         # Формируем итоговый запрос
         if city:
@@ -79,23 +54,15 @@ class RealisticGeocoder:
 
         return query
 
+    @geocode_cache.cached('nominatim')
     def geocode(self, address: str, city: str = None) -> Optional[Dict]:
         """
         Геокодирование реального адреса
+        (результаты кэшируются в базе, см. utils.geocode_cache)
         """
         # Подготавливаем запрос
         query = self._prepare_query(address, city)
 
-        # Проверяем кэш
-        cache_key = f"geocode_real_{address}_{city}"
-        try:
-            cached = cache.get(cache_key)
-            if cached:
-                logger.info(f"Из кэша: {address}")
-                return cached
-        except:
-            pass
-
         # Соблюдаем rate limit
         self._respect_rate_limit()
 
@@ -112,11 +79,12 @@ class RealisticGeocoder:
             logger.info(f"Запрос: {query}")
 
             # Отправляем запрос
-            response = self.session.get(
+            response = http_client.get(
                 self.BASE_URL,
                 params=params,
                 timeout=15,
                 headers={
+                    **self.headers,
                     'User-Agent': 'RentAnalyzer/1.0'
                 }
             )
@@ -135,14 +103,9 @@ class RealisticGeocoder:
                         'display_name': result.get('display_name', ''),
                         'address': result.get('address', {}),
                         'query_used': query,
+                        'precision': geocode_cache.infer_precision(result),
                     }
 
-                    # Кэшируем
-                    try:
-                        cache.set(cache_key, geocode_result, 60 * 60 * 24 * 7)  # 7 дней
-                    except:
-                        pass
-
                     return geocode_result
                 else:
                     logger.warning(f"Не найдено: {query}")
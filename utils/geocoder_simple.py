@@ -1,29 +1,47 @@
-import requests
 import time
 import logging
 from typing import Optional, Dict
 import re
+from .http_client import http_client
+from .address_normalizer import address_normalizer
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def _geocode_cache():
+    """Общий кэш геокодирования, если модуль работает внутри Django-проекта"""
+    try:
+        from .geocode_cache import geocode_cache
+    except Exception:
+        return None
+    return geocode_cache
+
+
 class SimpleNominatimGeocoder:
     """Простой геокодировщик без зависимостей от Django"""
 
     BASE_URL = "https://nominatim.openstreetmap.org/search"
 
     def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
+        self.headers = {
             'User-Agent': 'RentAnalyzerPro-Test/1.0 (educational-test@example.com)',
             'Accept': 'application/json',
             'Accept-Language': 'ru-RU,ru;q=0.9',
-        })
+        }
         self.last_request_time = 0
         self.min_request_interval = 1.5  # Безопасная задержка
 
     def _respect_rate_limit(self):
+        # Внутри Django-проекта — общий для всех процессов лимит запросов к Nominatim
+        try:
+            from .rate_limiter import source_rate_limiter
+        except Exception:
+            source_rate_limiter = None
+        if source_rate_limiter is not None:
+            source_rate_limiter.wait('nominatim')
+            return
+
         current_time = time.time()
         time_since_last = current_time - self.last_request_time
 
@@ -37,24 +55,18 @@ class SimpleNominatimGeocoder:
         """Очистка адреса"""
         if not address:
             return ""
-
-        # Простая нормализация
-        address = ' '.join(address.strip().split())
-        replacements = {
-            ' ул. ': ' улица ',
-            ' пр. ': ' проспект ',
-            ' д. ': ' дом ',
-        }
-
-        for old, new in replacements.items():
-            address = address.replace(old, new)
-
-        return ' '.join(address.split())
+        return address_normalizer.query(address)
 
     def geocode_simple(self, address: str, city: str = None) -> Optional[Dict]:
         """
         Простое геокодирование - используем только свободный поиск
         """
+        cache = _geocode_cache()
+        if cache is not None:
+            cached = cache.get(address, city)
+            if cached:
+                return cached
+
         self._respect_rate_limit()
 
         try:
@@ -78,9 +90,10 @@ class SimpleNominatimGeocoder:
 
             logger.info(f"Запрос: {query}")
 
-            response = self.session.get(
+            response = http_client.get(
                 self.BASE_URL,
                 params=params,
+                headers=self.headers,
                 timeout=10
             )
 
@@ -89,12 +102,15 @@ class SimpleNominatimGeocoder:
 
                 if data and len(data) > 0:
                     result = data[0]
-                    return {
+                    geocode_result = {
                         'lat': float(result['lat']),
                         'lon': float(result['lon']),
                         'display_name': result.get('display_name', ''),
                         'address': result.get('address', {}),
                     }
+                    if cache is not None:
+                        cache.store_result(address, city, {**geocode_result, 'type': result.get('type')}, 'nominatim')
+                    return geocode_result
                 else:
                     logger.warning(f"Не найдено: {query}")
             else:
@@ -109,6 +125,12 @@ class SimpleNominatimGeocoder:
         """
         Структурированное геокодирование (более точное)
         """
+        cache = _geocode_cache()
+        if cache is not None:
+            cached = cache.get(address, city)
+            if cached:
+                return cached
+
         self._respect_rate_limit()
 
         try:
@@ -146,9 +168,10 @@ class SimpleNominatimGeocoder:
                 params['q'] = f"{query}, Россия"
                 logger.info(f"Свободный запрос: {params['q']}")
 
-            response = self.session.get(
+            response = http_client.get(
                 self.BASE_URL,
                 params=params,
+                headers=self.headers,
                 timeout=10
             )
 
@@ -157,13 +180,16 @@ class SimpleNominatimGeocoder:
 
                 if data and len(data) > 0:
                     result = data[0]
-                    return {
+                    geocode_result = {
                         'lat': float(result['lat']),
                         'lon': float(result['lon']),
                         'display_name': result.get('display_name', ''),
                         'address': result.get('address', {}),
                         'params_used': params,
                     }
+                    if cache is not None:
+                        cache.store_result(address, city, {**geocode_result, 'type': result.get('type')}, 'nominatim')
+                    return geocode_result
 
         except Exception as e:
             logger.error(f"Ошибка структурированного поиска: {e}")
@@ -0,0 +1,322 @@
+"""
+Очередь отложенного геокодирования адресов домов, предложений и квартир
+
+Адрес предложения или квартиры геокодируется заданием ее дома (см.
+utils.buildings): одно задание на дом, найденные координаты копируются во
+все его записи. Задание самой записи ставится, только если дома у нее нет.
+
+Задания обрабатывает воркер process_geocoding_queue. Квартиру, добавленную
+пользователем, веб-процесс дополнительно геокодирует в фоновом потоке,
+чтобы страница анализа получила точное местоположение через секунды, не
+дожидаясь воркера и не задерживая ответ на запрос.
+
+Задание, адрес которого не удалось геокодировать, откладывается до конца
+паузы отрицательного кэша (GeocodingTask.next_attempt_at) и до тех пор не
+выбирается воркером.
+
+Воркер и фоновые потоки веб-процессов могут выбрать одни и те же задания,
+поэтому перед обработкой задания забираются одним условным UPDATE (статус
+processing и метка обработчика): каждое задание обрабатывает только тот,
+кто его забрал. Задание, забранное упавшим процессом, снова выбирается
+через CLAIM_TIMEOUT.
+"""
+import time
+import uuid
+import logging
+import threading
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from analyzer.models import Apartment, Building, GeocodeCacheEntry, GeocodingTask, MarketOffer
+
+from .buildings import building_registry
+from .geocode_cache import geocode_cache
+
+logger = logging.getLogger(__name__)
+
+
+class GeocodingQueue:
+    """Постановка адресов в очередь и пакетная обработка заданий"""
+
+    # После стольких неудачных попыток задание помечается как failed
+    MAX_ATTEMPTS = 3
+
+    # Через столько задание, не завершенное забравшим его процессом, снова выбирается
+    CLAIM_TIMEOUT = timedelta(minutes=10)
+
+    # Состояние местоположения объекта (location_status)
+    LOCATION_READY = 'ready'
+    LOCATION_PENDING = 'pending'
+    LOCATION_FAILED = 'failed'
+    LOCATION_UNKNOWN = 'unknown'
+
+    MODELS = {
+        GeocodingTask.KIND_BUILDING: Building,
+        GeocodingTask.KIND_MARKET_OFFER: MarketOffer,
+        GeocodingTask.KIND_APARTMENT: Apartment,
+    }
+
+    def _kind_for(self, obj) -> str:
+        if isinstance(obj, Building):
+            return GeocodingTask.KIND_BUILDING
+        if isinstance(obj, Apartment):
+            return GeocodingTask.KIND_APARTMENT
+        return GeocodingTask.KIND_MARKET_OFFER
+
+    def _task_for(self, obj) -> Tuple[str, int]:
+        """(тип, id) задания объекта: предложение и квартира геокодируются заданием своего дома"""
+        if getattr(obj, 'building_id', None):
+            return GeocodingTask.KIND_BUILDING, obj.building_id
+        return self._kind_for(obj), obj.pk
+
+    def enqueue(self, obj):
+        """Ставит сохраненный дом, предложение или квартиру (их дом) в очередь"""
+        building = getattr(obj, 'building', None)
+        if building is not None:
+            obj = building
+        self.enqueue_many(self._kind_for(obj), [(obj.pk, obj.city_id, obj.address)])
+
+    def enqueue_many(self, kind: str, rows: Iterable[Tuple[int, int, str]]) -> int:
+        """
+        Массовая постановка в очередь
+
+        Args:
+            kind: Тип объектов (GeocodingTask.KIND_*)
+            rows: Кортежи (id объекта, id города, адрес)
+
+        Returns:
+            Количество поставленных заданий
+        """
+        tasks = [
+            GeocodingTask(kind=kind, object_id=object_id, city_id=city_id, address=address[:255])
+            for object_id, city_id, address in rows
+        ]
+        if not tasks:
+            return 0
+
+        # Повторная постановка сбрасывает уже выполненное задание в очередь
+        GeocodingTask.objects.bulk_create(
+            tasks,
+            update_conflicts=True,
+            unique_fields=['kind', 'object_id'],
+            update_fields=['city', 'address', 'status', 'attempts', 'last_error', 'next_attempt_at'],
+        )
+        return len(tasks)
+
+    def _due(self):
+        """Задания в очереди, пауза которых истекла, и брошенные упавшим обработчиком"""
+        now = timezone.now()
+        return GeocodingTask.objects.filter(
+            Q(status=GeocodingTask.STATUS_PENDING) & (Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+            | Q(status=GeocodingTask.STATUS_PROCESSING, updated_at__lt=now - self.CLAIM_TIMEOUT)
+        )
+
+    def _claim(self, candidates) -> List[GeocodingTask]:
+        """
+        Забирает задания в обработку одним условным UPDATE
+
+        Задание, которое между выборкой и UPDATE забрал другой процесс, уже не
+        подходит под условие _due и остается ему.
+
+        Args:
+            candidates: Выборка заданий (QuerySet, может быть со срезом)
+
+        Returns:
+            Забранные этим вызовом задания с городами
+        """
+        ids = list(candidates.values_list('id', flat=True))
+        if not ids:
+            return []
+        token = uuid.uuid4().hex
+        self._due().filter(id__in=ids).update(
+            status=GeocodingTask.STATUS_PROCESSING, claim_token=token, updated_at=timezone.now()
+        )
+        return list(
+            GeocodingTask.objects.filter(id__in=ids, claim_token=token).select_related('city').order_by('created_at')
+        )
+
+    def pending_count(self) -> int:
+        """Задания в очереди, включая отложенные и обрабатываемые сейчас"""
+        return GeocodingTask.objects.filter(
+            status__in=[GeocodingTask.STATUS_PENDING, GeocodingTask.STATUS_PROCESSING]
+        ).count()
+
+    def due_count(self) -> int:
+        """Сколько заданий можно обработать сейчас (без отложенных после неудачи)"""
+        return self._due().count()
+
+    def location_status(self, obj) -> str:
+        """
+        Готовы ли координаты предложения или квартиры
+
+        Returns:
+            ready — координаты есть; pending — адрес в очереди;
+            failed — адрес не найден (или отложен после неудачи); unknown — адреса нет в очереди
+        """
+        if obj.latitude and obj.longitude:
+            return self.LOCATION_READY
+        kind, object_id = self._task_for(obj)
+        task = GeocodingTask.objects.filter(
+            kind=kind, object_id=object_id
+        ).values('status', 'next_attempt_at').first()
+        if task is None and kind == GeocodingTask.KIND_BUILDING:
+            # Задание, поставленное до появления домов
+            task = GeocodingTask.objects.filter(
+                kind=self._kind_for(obj), object_id=obj.pk
+            ).values('status', 'next_attempt_at').first()
+        if task is None:
+            return self.LOCATION_UNKNOWN
+        if task['next_attempt_at'] and task['next_attempt_at'] > timezone.now():
+            return self.LOCATION_FAILED
+        return {
+            GeocodingTask.STATUS_PENDING: self.LOCATION_PENDING,
+            GeocodingTask.STATUS_PROCESSING: self.LOCATION_PENDING,
+            GeocodingTask.STATUS_FAILED: self.LOCATION_FAILED,
+        }.get(task['status'], self.LOCATION_UNKNOWN)
+
+    def process_objects(self, kind: str, object_ids: Iterable[int]) -> Dict[str, int]:
+        """Обрабатывает задания конкретных объектов, не дожидаясь их очереди"""
+        tasks = self._claim(self._due().filter(kind=kind, object_id__in=list(object_ids)))
+        return self._process(tasks)
+
+    def process_in_background(self, obj):
+        """
+        Геокодирует сохраненный объект в фоновом потоке веб-процесса
+
+        Ответ на запрос не ждет геокодера; если процесс завершится раньше,
+        задание останется в очереди и его выполнит воркер.
+        """
+        if not getattr(settings, 'GEOCODING_IN_BACKGROUND', True):
+            return None
+        return _background_executor().submit(self._process_in_thread, *self._task_for(obj))
+
+    def _process_in_thread(self, kind: str, object_id: int):
+        try:
+            return self.process_objects(kind, [object_id])
+        except Exception as e:
+            logger.error(f"Фоновое геокодирование {kind} #{object_id} не удалось: {e}")
+        finally:
+            # У потока свое соединение с базой: закрываем, чтобы не копить их
+            connections.close_all()
+
+    def process_batch(self, batch_size: int = 50, delay: float = 0.0) -> Dict[str, int]:
+        """
+        Обрабатывает один пакет заданий и записывает координаты пакетно
+
+        Args:
+            batch_size: Максимальное количество заданий в пакете
+            delay: Дополнительная пауза между запросами к геокодеру (сек);
+                частоту запросов к Nominatim и так ограничивает общий лимит
+
+        Returns:
+            Словарь со счетчиками processed, geocoded, requests, deferred
+            (отложены: адрес на паузе после неудачи), failed
+        """
+        tasks = self._claim(self._due().order_by('created_at')[:batch_size])
+        return self._process(tasks, delay)
+
+    def _process(self, tasks: List[GeocodingTask], delay: float = 0.0) -> Dict[str, int]:
+        from utils.geocoding_service import GeocodeAttempt, geocoding_service
+
+        stats = {'processed': len(tasks), 'geocoded': 0, 'requests': 0, 'deferred': 0, 'failed': 0}
+        if not tasks:
+            return stats
+
+        # Адреса из общего кэша геокодирования и адреса на паузе после
+        # неудачи не запрашиваются (и не ждут паузы)
+        cached, backoff = geocode_cache.probe_many((task.address, task.city.name) for task in tasks)
+
+        # Один запрос на уникальную пару (адрес, город)
+        results = {}
+        requested = set()
+        for task in tasks:
+            key = geocode_cache.make_key(task.address, task.city.name)
+            if key in results:
+                continue
+            if key in cached:
+                results[key] = GeocodeAttempt(cached[key])
+                continue
+            if key in backoff:
+                results[key] = GeocodeAttempt(None, backoff[key]['reason'], backoff[key]['retry_after'])
+                continue
+
+            if stats['requests'] > 0 and delay > 0:
+                time.sleep(delay)
+            stats['requests'] += 1
+            requested.add(key)
+
+            try:
+                results[key] = geocoding_service.resolve(task.address, task.city.name, use_cache=False)
+            except Exception as e:
+                logger.error(f"Ошибка геокодирования {task.address}: {e}")
+                results[key] = GeocodeAttempt(None, GeocodeCacheEntry.FAILURE_ERROR)
+
+        now = timezone.now()
+        reasons = dict(GeocodeCacheEntry.FAILURE_CHOICES)
+        updates = {kind: [] for kind in self.MODELS}
+        for task in tasks:
+            key = geocode_cache.make_key(task.address, task.city.name)
+            attempt = results[key]
+            task.updated_at = now
+
+            if attempt.result:
+                model = self.MODELS[task.kind]
+                updates[task.kind].append(model(pk=task.object_id, **geocode_cache.location_fields(attempt.result)))
+                task.attempts += 1
+                task.status = GeocodingTask.STATUS_DONE
+                task.last_error = ''
+                task.next_attempt_at = None
+                stats['geocoded'] += 1
+                continue
+
+            # Попыткой считается только запрос к геокодеру; до конца паузы задание не выбирается
+            if key in requested:
+                task.attempts += 1
+            task.last_error = reasons.get(attempt.reason, 'Адрес не найден')
+            task.next_attempt_at = attempt.retry_after
+            task.status = GeocodingTask.STATUS_PENDING
+            if task.attempts >= self.MAX_ATTEMPTS:
+                task.status = GeocodingTask.STATUS_FAILED
+                stats['failed'] += 1
+            elif attempt.retry_after:
+                stats['deferred'] += 1
+
+        with transaction.atomic():
+            for kind, objects in updates.items():
+                if objects:
+                    self.MODELS[kind].objects.bulk_update(objects, geocode_cache.LOCATION_FIELDS)
+            # Координаты домов — во все их предложения и квартиры
+            building_registry.propagate(updates[GeocodingTask.KIND_BUILDING])
+            for task in tasks:
+                task.claim_token = ''
+            GeocodingTask.objects.bulk_update(
+                tasks, ['status', 'attempts', 'last_error', 'next_attempt_at', 'claim_token', 'updated_at']
+            )
+
+        return stats
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _background_executor() -> ThreadPoolExecutor:
+    """Пул фоновых потоков геокодирования (создается при первом использовании)"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'GEOCODING_BACKGROUND_WORKERS', 2),
+                thread_name_prefix='geocode-bg',
+            )
+    return _executor
+
+
+# Глобальный экземпляр
+geocoding_queue = GeocodingQueue()
@@ -0,0 +1,239 @@
+"""
+Единый сервис геокодирования
+
+Сервис опрашивает подключаемые бэкенды по порядку (GEOCODING_BACKENDS).
+Локальные бэкенды (газеттир в памяти) отвечают первыми, без обращения к
+базе и сети; перед сетевыми проверяется общий кэш (utils.geocode_cache),
+куда сохраняется найденный ими результат. Запросы к Nominatim проходят
+через общий для всех процессов лимит source_rate_limiter ('nominatim'),
+поэтому команды, воркеры очереди и веб-запросы вместе не превышают
+1 запрос в секунду.
+
+Неудача сетевых бэкендов сохраняется в кэш как отрицательная запись с
+кодом причины (GeocodeCacheEntry.FAILURE_*): пока ее пауза не истекла,
+адрес не запрашивается повторно.
+"""
+import logging
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+
+import requests
+from django.conf import settings
+
+from analyzer.models import GeocodeCacheEntry
+
+from .http_client import http_client
+from .address_normalizer import address_normalizer
+from .geocode_cache import geocode_cache
+from .gazetteer import Gazetteer, gazetteer
+
+logger = logging.getLogger(__name__)
+
+
+class GeocodingError(Exception):
+    """Бэкенд не смог проверить адрес (в отличие от «не найден»); reason — GeocodeCacheEntry.FAILURE_*"""
+
+    def __init__(self, reason: str, message: str = ''):
+        super().__init__(message or reason)
+        self.reason = reason
+
+
+class GeocodeAttempt(NamedTuple):
+    result: Optional[Dict]
+    reason: str = ''  # код причины неудачи (GeocodeCacheEntry.FAILURE_*), пустой при успехе
+    retry_after: Optional[datetime] = None  # до какого времени адрес не запрашивается
+
+
+class GeocoderBackend:
+    """
+    Бэкенд геокодирования: адрес и город → {lat, lon, display_name, precision} или None
+
+    None означает «адрес не найден»; если ответить не удалось (ошибка HTTP,
+    лимит запросов), бэкенд выбрасывает GeocodingError с кодом причины.
+    """
+
+    name = ''
+    # Локальный бэкенд отвечает из памяти: опрашивается раньше кэша, его результаты не кэшируются
+    local = False
+
+    def geocode(self, address: str, city: Optional[str] = None) -> Optional[Dict]:
+        raise NotImplementedError
+
+
+class GazetteerBackend(GeocoderBackend):
+    """Локальный справочник адресов (GEOCODING_GAZETTEER_PATH), без HTTP"""
+
+    name = 'gazetteer'
+    local = True
+
+    def __init__(self, index: Optional[Gazetteer] = None):
+        self.index = index or gazetteer
+
+    def geocode(self, address: str, city: Optional[str] = None) -> Optional[Dict]:
+        return self.index.lookup(address, city)
+
+
+class NominatimBackend(GeocoderBackend):
+    """Свободный поиск OpenStreetMap Nominatim"""
+
+    name = 'nominatim'
+    BASE_URL = "https://nominatim.openstreetmap.org/search"
+    HEADERS = {
+        'User-Agent': 'RentAnalyzerPro/1.0',
+        'Accept': 'application/json',
+        'Accept-Language': 'ru-RU,ru;q=0.9',
+    }
+
+    def format_query(self, address: str, city: Optional[str] = None) -> str:
+        """Запрос для Nominatim: «ул. Садовая, 4», «Москва» → «улица Садовая 4, Москва, Россия»"""
+        address = address_normalizer.query(address)
+
+        if city:
+            # Город уже в начале адреса — не повторяем
+            if address.lower().startswith(city.lower() + ','):
+                address = address[len(city) + 1:].strip()
+            return f"{address}, {city}, Россия"
+        return f"{address}, Россия"
+
+    def geocode(self, address: str, city: Optional[str] = None) -> Optional[Dict]:
+        query = self.format_query(address, city)
+        response = http_client.get(
+            self.BASE_URL,
+            params={'q': query, 'format': 'json', 'limit': 1, 'countrycodes': 'ru'},
+            headers=self.HEADERS,
+            timeout=10,
+            rate_limit_key=self.name,
+        )
+
+        if response.status_code == 429:
+            raise GeocodingError(GeocodeCacheEntry.FAILURE_RATE_LIMITED, f"Nominatim: HTTP 429 для {query}")
+        if response.status_code != 200:
+            raise GeocodingError(
+                GeocodeCacheEntry.FAILURE_HTTP_ERROR, f"Nominatim: HTTP {response.status_code} для {query}"
+            )
+
+        data = response.json()
+        if not data:
+            logger.info(f"Nominatim: не найдено {query}")
+            return None
+
+        result = data[0]
+        return {
+            'lat': float(result['lat']),
+            'lon': float(result['lon']),
+            'display_name': result.get('display_name', ''),
+            'precision': geocode_cache.infer_precision(result),
+        }
+
+
+class GeocodingService:
+    """Кэш + бэкенды по порядку"""
+
+    # Доступные бэкенды по имени (GEOCODING_BACKENDS)
+    BACKENDS = {
+        GazetteerBackend.name: GazetteerBackend,
+        NominatimBackend.name: NominatimBackend,
+    }
+
+    def __init__(self, backend_names: Optional[List[str]] = None):
+        names = backend_names or getattr(settings, 'GEOCODING_BACKENDS', [NominatimBackend.name])
+        self.backends: List[GeocoderBackend] = [self.BACKENDS[name]() for name in names]
+
+    def register(self, backend: GeocoderBackend, first: bool = False):
+        """Подключает бэкенд (first — опрашивать раньше остальных)"""
+        self.backends = [existing for existing in self.backends if existing.name != backend.name]
+        if first:
+            self.backends.insert(0, backend)
+        else:
+            self.backends.append(backend)
+
+    def geocode(self, address: str, city: Optional[str] = None, use_cache: bool = True,
+                remote: bool = True) -> Optional[Dict]:
+        """
+        Координаты адреса
+
+        Args:
+            use_cache: Проверять общий кэш (и паузу после прежней неудачи) перед сетевыми бэкендами
+            remote: Опрашивать сетевые бэкенды (False — только газеттир и кэш,
+                без ожидания сети, например в обработчике веб-запроса)
+
+        Returns:
+            {lat, lon, display_name, precision, source} или None, если ни один бэкенд не нашел адрес
+        """
+        return self.resolve(address, city, use_cache, remote).result
+
+    def resolve(self, address: str, city: Optional[str] = None, use_cache: bool = True,
+                remote: bool = True) -> GeocodeAttempt:
+        """Как geocode, но при неудаче с кодом причины и временем следующей попытки"""
+        if not address or not address.strip():
+            return GeocodeAttempt(None)
+
+        result = self.lookup_local(address, city)
+        if result:
+            return GeocodeAttempt(result)
+
+        if use_cache:
+            cached, failure = geocode_cache.probe(address, city)
+            if cached is not None:
+                return GeocodeAttempt(cached)
+            if failure is not None:
+                return GeocodeAttempt(None, failure['reason'], failure['retry_after'])
+
+        if not remote:
+            return GeocodeAttempt(None)
+        attempt = self.attempt(address, city, local=False)
+        if attempt.result:
+            geocode_cache.store_result(address, city, attempt.result, attempt.result['source'])
+        elif attempt.reason:
+            attempt = attempt._replace(retry_after=geocode_cache.store_failure(address, city, attempt.reason))
+        return attempt
+
+    def lookup_local(self, address: str, city: Optional[str] = None) -> Optional[Dict]:
+        """Только локальные бэкенды: ответ из памяти за микросекунды или None"""
+        return self._lookup([backend for backend in self.backends if backend.local], address, city).result
+
+    def lookup(self, address: str, city: Optional[str] = None, local: bool = True) -> Optional[Dict]:
+        """
+        Только бэкенды, без чтения и записи кэша
+
+        Не обращается к базе, поэтому подходит для параллельных потоков
+        (см. utils.bulk_geocoder, который пишет кэш пакетно).
+
+        Args:
+            local: Опрашивать и локальные бэкенды (False — только сетевые)
+        """
+        return self.attempt(address, city, local).result
+
+    def attempt(self, address: str, city: Optional[str] = None, local: bool = True) -> GeocodeAttempt:
+        """Как lookup, но при неудаче с кодом причины (без записи отрицательного кэша)"""
+        backends = self.backends if local else [backend for backend in self.backends if not backend.local]
+        return self._lookup(backends, address, city)
+
+    def _lookup(self, backends: List[GeocoderBackend], address: str, city: Optional[str]) -> GeocodeAttempt:
+        # «Не найден» только если ни один бэкенд не ошибся: иначе адрес стоит проверить раньше
+        reason = ''
+        for backend in backends:
+            try:
+                result = backend.geocode(address, city)
+            except GeocodingError as e:
+                logger.warning(f"Ошибка геокодирования {address} ({backend.name}): {e}")
+                reason = e.reason
+                continue
+            except requests.RequestException as e:
+                logger.error(f"Ошибка сети при геокодировании {address} ({backend.name}): {e}")
+                reason = GeocodeCacheEntry.FAILURE_NETWORK
+                continue
+            except Exception as e:
+                logger.error(f"Ошибка геокодирования {address} ({backend.name}): {e}")
+                reason = GeocodeCacheEntry.FAILURE_ERROR
+                continue
+            if result:
+                result['source'] = backend.name
+                return GeocodeAttempt(result)
+            if not backend.local:
+                reason = reason or GeocodeCacheEntry.FAILURE_NOT_FOUND
+        return GeocodeAttempt(None, reason)
+
+
+# Глобальный экземпляр
+geocoding_service = GeocodingService()
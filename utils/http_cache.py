@@ -0,0 +1,173 @@
+"""
+Дисковый кэш HTTP-ответов источников объявлений
+
+Ответы с ETag/Last-Modified перепроверяются условным запросом (304 — берем
+из кэша), остальные переиспользуются в течение TTL. Размер кэша ограничен:
+при переполнении удаляются давно не использованные записи. В режиме offline
+запросы в сеть не отправляются вовсе — это позволяет воспроизводить сбор
+данных для отладки и замеров производительности.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import urlencode
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+
+class OfflineCacheMiss(requests.ConnectionError):
+    """В режиме offline запрошенного ответа нет в кэше"""
+
+
+class HttpResponseCache:
+    """Хранит тело ответа и метаданные в паре файлов <ключ>.body / <ключ>.json"""
+
+    # Заголовки, которые нужны для условных запросов и разбора ответа
+    STORED_HEADERS = ('ETag', 'Last-Modified', 'Content-Type')
+
+    def __init__(self, directory, ttl: float = 900, max_bytes: int = 200 * 1024 * 1024,
+                 offline: bool = False):
+        self.directory = Path(directory)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self._size = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(url: str, params: Optional[Dict] = None) -> str:
+        query = urlencode(sorted((params or {}).items()), doseq=True)
+        return hashlib.sha256(f"{url}?{query}".encode('utf-8')).hexdigest()
+
+    def _paths(self, key: str):
+        return self.directory / f"{key}.json", self.directory / f"{key}.body"
+
+    def load(self, key: str) -> Optional[Dict]:
+        """Метаданные и тело записи или None"""
+        meta_path, body_path = self._paths(key)
+        try:
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+            meta['body'] = body_path.read_bytes()
+        except (OSError, ValueError):
+            return None
+
+        # Время доступа — для вытеснения давно не использованных записей
+        try:
+            os.utime(meta_path)
+        except OSError:
+            pass
+        return meta
+
+    def is_fresh(self, entry: Dict) -> bool:
+        return time.time() - entry['stored_at'] < self.ttl
+
+    @staticmethod
+    def has_validators(entry: Dict) -> bool:
+        headers = entry.get('headers', {})
+        return bool(headers.get('ETag') or headers.get('Last-Modified'))
+
+    @staticmethod
+    def conditional_headers(entry: Dict) -> Dict[str, str]:
+        headers = {}
+        if entry['headers'].get('ETag'):
+            headers['If-None-Match'] = entry['headers']['ETag']
+        if entry['headers'].get('Last-Modified'):
+            headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+        return headers
+
+    def store(self, key: str, response: requests.Response):
+        """Сохраняет успешный ответ"""
+        meta = {
+            'url': response.url,
+            'status_code': response.status_code,
+            'encoding': response.encoding,
+            'headers': {name: response.headers[name] for name in self.STORED_HEADERS if name in response.headers},
+            'stored_at': time.time(),
+        }
+        self._write(key, meta, response.content)
+
+    def revalidated(self, key: str, entry: Dict):
+        """Источник ответил 304: запись снова свежая"""
+        meta = {name: value for name, value in entry.items() if name != 'body'}
+        meta['stored_at'] = time.time()
+        meta_path, _ = self._paths(key)
+        self._atomic_write(meta_path, json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+
+    def _write(self, key: str, meta: Dict, body: bytes):
+        meta_path, body_path = self._paths(key)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        old_size = self._entry_size(key)
+        self._atomic_write(body_path, body)
+        self._atomic_write(meta_path, json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += self._entry_size(key) - old_size
+
+            if self._size > self.max_bytes:
+                self._evict()
+
+    @staticmethod
+    def _atomic_write(path: Path, data: bytes):
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+    def _entry_size(self, key: str) -> int:
+        size = 0
+        for path in self._paths(key):
+            try:
+                size += path.stat().st_size
+            except OSError:
+                pass
+        return size
+
+    def _scan_size(self) -> int:
+        return sum(path.stat().st_size for path in self.directory.glob('*') if path.is_file())
+
+    def _evict(self):
+        """Удаляет давно не использованные записи, пока кэш не станет меньше 90% лимита"""
+        entries = sorted(self.directory.glob('*.json'), key=lambda path: path.stat().st_mtime)
+        target = self.max_bytes * 0.9
+        removed = 0
+
+        for meta_path in entries:
+            if self._size <= target:
+                break
+            key = meta_path.stem
+            size = self._entry_size(key)
+            for path in self._paths(key):
+                path.unlink(missing_ok=True)
+            self._size -= size
+            removed += 1
+
+        logger.info(f"HTTP-кэш: удалено {removed} записей, размер {self._size / 1024 / 1024:.1f} МБ")
+
+    @staticmethod
+    def to_response(entry: Dict) -> requests.Response:
+        """Собирает requests.Response из записи кэша"""
+        response = requests.Response()
+        response.status_code = entry['status_code']
+        response._content = entry['body']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.url = entry['url']
+        response.encoding = entry['encoding']
+        response.from_cache = True
+        return response
+
+    def clear(self):
+        with self._lock:
+            for path in self.directory.glob('*'):
+                path.unlink(missing_ok=True)
+            self._size = 0
@@ -0,0 +1,234 @@
+"""
+Общий HTTP-клиент для парсеров и геокодеров
+
+Все внешние запросы идут через один пул keep-alive соединений с ограничением
+числа одновременных запросов к каждому хосту, повторами с экспоненциальной
+задержкой и общим бюджетом времени на запрос (вместе с повторами).
+"""
+import time
+import asyncio
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from .http_cache import HttpResponseCache, OfflineCacheMiss
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name: str, default):
+    # Геокодеры используются и без настроенного Django (например, в скриптах)
+    if not settings.configured:
+        return default
+    return getattr(settings, name, default)
+
+
+class HttpClient:
+    """
+    Пул соединений + лимит параллельных запросов на хост + повторы
+
+    Синхронный интерфейс (get/request) используют потоки сбора данных,
+    асинхронный (fetch/fetch_many) — код, которому нужно выполнить
+    несколько запросов одновременно.
+    """
+
+    # Статусы, при которых запрос имеет смысл повторить
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, pool_maxsize: int = 10, per_host_limit: int = 4, retries: int = 2,
+                 backoff: float = 0.5, timeout: float = 15.0, budget: float = 60.0,
+                 cache: Optional[HttpResponseCache] = None, host_overrides: Optional[Dict[str, str]] = None):
+        self.cache = cache
+        # Подмена хостов источников (например, на локальный тестовый сервер): {хост: 'http://адрес:порт'}
+        self.host_overrides = dict(host_overrides or {})
+        self.per_host_limit = per_host_limit
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.budget = budget
+
+        # Повторы делаем сами, чтобы учитывать бюджет времени и Retry-After
+        adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    def _slots_for(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._host_slots[host]
+
+    def resolve_url(self, url: str) -> str:
+        """Адрес с учетом host_overrides"""
+        if not self.host_overrides:
+            return url
+        parts = urlsplit(url)
+        override = self.host_overrides.get(parts.netloc)
+        if not override:
+            return url
+        target = urlsplit(override)
+        return urlunsplit((target.scheme, target.netloc, parts.path, parts.query, parts.fragment))
+
+    def _retry_delay(self, attempt: int, response: Optional[requests.Response]) -> float:
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return float(retry_after)
+        return self.backoff * (2 ** attempt)
+
+    def request(self, method: str, url: str, params: Optional[Dict] = None,
+                headers: Optional[Dict] = None, timeout: Optional[float] = None,
+                budget: Optional[float] = None, retries: Optional[int] = None,
+                rate_limit_key: Optional[str] = None, **kwargs) -> requests.Response:
+        """
+        Выполняет запрос с повторами
+
+        Args:
+            method: HTTP-метод
+            url: Адрес
+            params: Параметры строки запроса
+            headers: Заголовки (у каждого парсера свои)
+            timeout: Таймаут одной попытки (сек)
+            budget: Общее время на все попытки (сек)
+            retries: Количество повторов после первой попытки
+            rate_limit_key: Источник для общего лимита частоты (utils.rate_limiter)
+
+        Returns:
+            Ответ последней попытки
+
+        Raises:
+            requests.RequestException: если все попытки завершились ошибкой сети
+        """
+        timeout = timeout or self.timeout
+        retries = self.retries if retries is None else retries
+        deadline = time.monotonic() + (budget or self.budget)
+        # Лимит параллельных запросов — по исходному хосту, даже если он подменен
+        slots = self._slots_for(url)
+        url = self.resolve_url(url)
+
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            response = None
+            error = None
+
+            if rate_limit_key:
+                from .rate_limiter import source_rate_limiter
+                source_rate_limiter.wait(rate_limit_key)
+
+            try:
+                with slots:
+                    response = self.session.request(
+                        method, url, params=params, headers=headers,
+                        timeout=max(min(timeout, remaining), 0.1), **kwargs
+                    )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+
+            if error is None and response.status_code not in self.RETRY_STATUSES:
+                return response
+
+            delay = self._retry_delay(attempt, response)
+            if attempt >= retries or time.monotonic() + delay >= deadline:
+                if error is not None:
+                    raise error
+                return response
+
+            reason = error or f"статус {response.status_code}"
+            logger.debug(f"Повтор {attempt + 1}/{retries} для {url} через {delay:.1f} сек ({reason})")
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def cached_get(self, url: str, params: Optional[Dict] = None, headers: Optional[Dict] = None,
+                   **kwargs) -> requests.Response:
+        """
+        GET через дисковый кэш ответов (см. utils.http_cache)
+
+        Ответы с ETag/Last-Modified перепроверяются условным запросом,
+        остальные берутся из кэша, пока не истек TTL. В режиме offline
+        сеть не используется: промах кэша — OfflineCacheMiss.
+        """
+        if self.cache is None:
+            return self.get(url, params=params, headers=headers, **kwargs)
+
+        key = self.cache.make_key(self.resolve_url(url), params)
+        entry = self.cache.load(key)
+
+        if self.cache.offline:
+            if entry is None:
+                raise OfflineCacheMiss(f"Нет в кэше: {url}")
+            return self.cache.to_response(entry)
+
+        if entry is not None:
+            if self.cache.has_validators(entry):
+                headers = {**(headers or {}), **self.cache.conditional_headers(entry)}
+            elif self.cache.is_fresh(entry):
+                return self.cache.to_response(entry)
+
+        response = self.get(url, params=params, headers=headers, **kwargs)
+
+        if response.status_code == 304 and entry is not None:
+            self.cache.revalidated(key, entry)
+            return self.cache.to_response(entry)
+
+        if response.status_code == 200:
+            self.cache.store(key, response)
+        return response
+
+    async def fetch(self, url: str, method: str = 'GET', cached: bool = False,
+                    **kwargs) -> requests.Response:
+        """Асинхронный запрос: выполняется в пуле потоков, пул соединений общий"""
+        if cached and method == 'GET':
+            return await asyncio.to_thread(self.cached_get, url, **kwargs)
+        return await asyncio.to_thread(self.request, method, url, **kwargs)
+
+    async def fetch_many(self, requests_kwargs: List[Dict]) -> List:
+        """
+        Несколько запросов одновременно (с учетом лимита на хост)
+
+        Args:
+            requests_kwargs: Аргументы fetch() для каждого запроса (обязателен url)
+
+        Returns:
+            Ответы в том же порядке; для неудачных запросов — исключение
+        """
+        return await asyncio.gather(
+            *(self.fetch(**kwargs) for kwargs in requests_kwargs),
+            return_exceptions=True
+        )
+
+    def run(self, coroutine):
+        """Выполняет корутину из синхронного кода (потоки сбора данных, views)"""
+        return asyncio.run(coroutine)
+
+
+# Глобальный экземпляр
+http_client = HttpClient(
+    pool_maxsize=_setting('HTTP_POOL_MAXSIZE', 10),
+    per_host_limit=_setting('HTTP_PER_HOST_CONCURRENCY', 4),
+    retries=_setting('HTTP_RETRIES', 2),
+    backoff=_setting('HTTP_RETRY_BACKOFF', 0.5),
+    timeout=_setting('HTTP_TIMEOUT', 15.0),
+    budget=_setting('HTTP_TIMEOUT_BUDGET', 60.0),
+    cache=HttpResponseCache(
+        directory=_setting('HTTP_CACHE_DIR', Path(__file__).resolve().parent.parent / 'cache' / 'http'),
+        ttl=_setting('HTTP_CACHE_TTL', 900),
+        max_bytes=_setting('HTTP_CACHE_MAX_BYTES', 200 * 1024 * 1024),
+        offline=_setting('HTTP_CACHE_OFFLINE', False),
+    ),
+    host_overrides=_setting('HTTP_HOST_OVERRIDES', {}),
+)
@@ -0,0 +1,397 @@
+"""
+Потоковый конвейер загрузки рыночных данных одного города
+
+fetch → parse → normalize → dedupe → geocode → persist → aggregate
+
+Каждый этап работает в своем потоке и обрабатывает пакеты предложений.
+Этапы связаны ограниченными очередями: если медленный этап не успевает,
+предыдущие ждут свободного места, поэтому в памяти одновременно находится
+не больше нескольких пакетов, каким бы большим ни было обновление.
+"""
+import time
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from analyzer.models import City, MarketOffer
+
+from .geocode_cache import geocode_cache
+from .geocoding_service import geocoding_service
+from .site_stats import site_stats
+
+logger = logging.getLogger(__name__)
+
+# Конец потока данных
+_END = object()
+
+
+class StageStats:
+    """Счетчики одного этапа: объем, занятость и задержка обработки пакета"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items_in = 0
+        self.items_out = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.max_batch_seconds = 0.0
+        # Время ожидания места в очереди следующего этапа (обратное давление)
+        self.blocked_seconds = 0.0
+
+    def record(self, items_in: int, items_out: int, seconds: float):
+        self.items_in += items_in
+        self.items_out += items_out
+        self.batches += 1
+        self.busy_seconds += seconds
+        self.max_batch_seconds = max(self.max_batch_seconds, seconds)
+
+    def as_dict(self) -> Dict:
+        return {
+            'name': self.name,
+            'items_in': self.items_in,
+            'items_out': self.items_out,
+            'batches': self.batches,
+            'busy_seconds': self.busy_seconds,
+            'blocked_seconds': self.blocked_seconds,
+            'throughput': self.items_in / self.busy_seconds if self.busy_seconds > 0 else 0.0,
+            'avg_batch_ms': self.busy_seconds / self.batches * 1000 if self.batches else 0.0,
+            'max_batch_ms': self.max_batch_seconds * 1000,
+        }
+
+
+class IngestionPipeline:
+    """
+    Конвейер обновления города поверх RealEstateDataCollector
+
+    Сборщик предоставляет источники (iter_source_batches), преобразование
+    в MarketOffer (_build_offer_instance), пакетный upsert (_upsert_offers_chunk)
+    и завершение обновления (finish_market_update).
+    """
+
+    STAGES = ('fetch', 'parse', 'normalize', 'dedupe', 'geocode', 'persist', 'aggregate')
+
+    # Сколько последних ключей помнят этапы dedupe и geocode: память конвейера
+    # не должна расти с размером обновления
+    MEMO_SIZE = 10000
+
+    def __init__(self, collector, city: City, limit_per_source: int = 30,
+                 batch_size: Optional[int] = None, queue_size: Optional[int] = None):
+        self.collector = collector
+        self.city = city
+        self.limit_per_source = limit_per_source
+        self.batch_size = batch_size or collector.SAVE_CHUNK_SIZE
+        self.queue_size = queue_size or getattr(settings, 'INGEST_QUEUE_SIZE', 4)
+
+        self.stats = {name: StageStats(name) for name in self.STAGES}
+        self.totals = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'failed': 0}
+        self.result = None
+
+        self._stop = threading.Event()
+        self._errors = []
+        self._totals_lock = threading.Lock()
+
+        # Состояние этапов (каждое используется только своим потоком)
+        self._baseline = None
+        self._price_sum = 0.0
+        self._area_sum = 0.0
+        self._offers_seen = 0
+        self._index = 0
+        self._seen_hashes = OrderedDict()
+        self._known_coords = OrderedDict()
+
+    def run(self) -> Dict:
+        """
+        Запускает все этапы и ждет завершения
+
+        Returns:
+            Счетчики inserted, updated, unchanged, failed, deactivated
+            и список stages со статистикой этапов
+
+        Raises:
+            Exception: первая ошибка, остановившая конвейер
+        """
+        started = time.monotonic()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.STAGES[1:]]
+
+        threads = [threading.Thread(target=self._run_source, args=(queues[0],), name='ingest-fetch')]
+        for position, name in enumerate(self.STAGES[1:]):
+            outbox = queues[position + 1] if position + 1 < len(queues) else None
+            threads.append(threading.Thread(
+                target=self._run_stage, args=(name, queues[position], outbox), name=f"ingest-{name}"
+            ))
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._errors:
+            raise self._errors[0]
+
+        stages = [self.stats[name].as_dict() for name in self.STAGES]
+        logger.info(
+            f"Конвейер {self.city.name} за {time.monotonic() - started:.1f} сек: " + ", ".join(
+                f"{stage['name']} {stage['items_in']} шт/{stage['busy_seconds']:.2f} сек" for stage in stages
+            )
+        )
+        return {**self.result, 'stages': stages}
+
+    # Управление потоками
+
+    def _fail(self, name: str, error: Exception):
+        logger.error(f"Этап {name} конвейера {self.city.name} остановлен: {error}")
+        self._errors.append(error)
+        self._stop.set()
+
+    def _put(self, name: str, outbox: queue.Queue, item):
+        started = time.monotonic()
+        outbox.put(item)
+        self.stats[name].blocked_seconds += time.monotonic() - started
+
+    def _run_source(self, outbox: queue.Queue):
+        stats = self.stats['fetch']
+        try:
+            batches = iter(self.collector.iter_source_batches(self.city, self.limit_per_source))
+            while not self._stop.is_set():
+                started = time.monotonic()
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                stats.record(len(batch), len(batch), time.monotonic() - started)
+                self._put('fetch', outbox, batch)
+        except Exception as e:
+            self._fail('fetch', e)
+        finally:
+            outbox.put(_END)
+            connections.close_all()
+
+    def _run_stage(self, name: str, inbox: queue.Queue, outbox: Optional[queue.Queue]):
+        """
+        Цикл этапа: обрабатывает пакеты до конца потока
+
+        После ошибки (своей или чужой) этап дочитывает очередь без обработки,
+        чтобы предыдущие этапы не зависли на заполненной очереди.
+        """
+        process = getattr(self, f"_{name}")
+        stats = self.stats[name]
+        try:
+            while True:
+                batch = inbox.get()
+                if batch is _END:
+                    break
+                if self._stop.is_set():
+                    continue
+
+                started = time.monotonic()
+                try:
+                    result = process(batch)
+                except Exception as e:
+                    self._fail(name, e)
+                    continue
+                stats.record(len(batch), len(result), time.monotonic() - started)
+
+                # Большие пакеты источников дальше идут частями по batch_size
+                if outbox is not None:
+                    for start in range(0, len(result), self.batch_size):
+                        self._put(name, outbox, result[start:start + self.batch_size])
+
+            if name == 'aggregate' and not self._stop.is_set():
+                started = time.monotonic()
+                try:
+                    self._finish()
+                except Exception as e:
+                    self._fail(name, e)
+                stats.busy_seconds += time.monotonic() - started
+        finally:
+            if outbox is not None:
+                outbox.put(_END)
+            connections.close_all()
+
+    def _count_failed(self, count: int):
+        if count:
+            with self._totals_lock:
+                self.totals['failed'] += count
+
+    # Этапы
+
+    def _parse(self, batch: List[Dict]) -> List[Dict]:
+        """Проверка и приведение типов полей источника"""
+        parsed = []
+        for offer in batch:
+            try:
+                offer['price'] = float(offer['price'])
+                offer['area'] = float(offer['area'])
+                rooms = offer.get('rooms')
+                # 0 — студия; без значения считаем однокомнатной
+                offer['rooms'] = int(rooms) if rooms not in (None, '') else 1
+            except (KeyError, TypeError, ValueError):
+                continue
+            if offer['price'] <= 0 or offer['area'] <= 0:
+                continue
+
+            # Источники отдают дату по-разному (datetime без пояса, строку, timestamp)
+            parsed_date = self._parse_date(offer.pop('parsed_date', None))
+            if parsed_date is not None:
+                offer['parsed_date'] = parsed_date
+
+            offer['city'] = self.city
+            offer.setdefault('source', 'unknown')
+            parsed.append(offer)
+
+        self._count_failed(len(batch) - len(parsed))
+        return parsed
+
+    @staticmethod
+    def _parse_date(value) -> Optional[datetime]:
+        """datetime, строка ISO 8601 или timestamp (сек) → datetime с поясом; None, если не разобрать"""
+        if isinstance(value, str):
+            try:
+                value = parse_datetime(value.strip())
+            except ValueError:
+                return None
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            try:
+                return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+            except (OverflowError, OSError, ValueError):
+                return None
+        if not isinstance(value, datetime):
+            return None
+        return timezone.make_aware(value) if timezone.is_naive(value) else value
+
+    def _remember(self, memo: OrderedDict, key, value):
+        """Запоминает значение, вытесняя самые старые ключи сверх MEMO_SIZE"""
+        memo[key] = value
+        memo.move_to_end(key)
+        while len(memo) > self.MEMO_SIZE:
+            memo.popitem(last=False)
+
+    def _normalize(self, batch: List[Dict]) -> List[MarketOffer]:
+        """Аналитика предложения и преобразование в несохраненный MarketOffer"""
+        self.collector._enrich_with_analytics(batch, self.city, baseline=self._market_baseline(batch))
+
+        offers = []
+        for offer_data in batch:
+            try:
+                offers.append(self.collector._build_offer_instance(offer_data, self.city, self._index))
+            except Exception as e:
+                logger.error(f"Ошибка подготовки предложения: {e}")
+                self._count_failed(1)
+            self._index += 1
+        return offers
+
+    def _market_baseline(self, batch: List[Dict]) -> Tuple[float, float]:
+        """
+        Средняя цена и цена за м² рынка для аналитики
+
+        Берется из последней сводки города; для города без сводок —
+        по всем предложениям, прошедшим конвейер к этому моменту.
+        """
+        if self._baseline is None:
+            from .market_overview import market_overview_builder
+
+            overview = market_overview_builder.get_city_overviews(self.city).get(0)
+            self._baseline = (
+                (float(overview.avg_price), float(overview.avg_price_per_sqm))
+                if overview and overview.offers_count else False
+            )
+        if self._baseline:
+            return self._baseline
+
+        self._price_sum += sum(offer['price'] for offer in batch)
+        self._area_sum += sum(offer['area'] for offer in batch)
+        self._offers_seen += len(batch)
+        avg_price = self._price_sum / self._offers_seen
+        avg_area = self._area_sum / self._offers_seen
+        return avg_price, avg_price / avg_area if avg_area > 0 else 0
+
+    def _dedupe(self, batch: List[MarketOffer]) -> List[MarketOffer]:
+        """
+        Повторы ключа (source, external_id)
+
+        Внутри пакета побеждает последнее значение (один upsert не может
+        изменить строку дважды), точные повторы из недавних пакетов (последние
+        MEMO_SIZE ключей) отбрасываются.
+        """
+        unique = {}
+        for offer in batch:
+            unique[(offer.source, offer.external_id)] = offer
+
+        result = []
+        for key, offer in unique.items():
+            seen = self._seen_hashes.get(key) == offer.content_hash
+            self._remember(self._seen_hashes, key, offer.content_hash)
+            if not seen:
+                result.append(offer)
+        return result
+
+    def _geocode(self, batch: List[MarketOffer]) -> List[MarketOffer]:
+        """
+        Координаты из локального газеттира, по уже известным адресам города
+        и из общего кэша геокодирования
+
+        Адреса, которых нет нигде, после сохранения уходят в очередь
+        геокодирования (см. RealEstateDataCollector._upsert_offers_chunk).
+        """
+        missing = {offer.address for offer in batch if offer.latitude is None and offer.address}
+        # Найденное для пакета; известные адреса — из последних MEMO_SIZE
+        coords = {address: self._known_coords[address] for address in missing if address in self._known_coords}
+        missing -= coords.keys()
+
+        for address in missing:
+            result = geocoding_service.lookup_local(address, self.city.name)
+            if result:
+                coords[address] = geocode_cache.location_fields(result)
+        missing -= coords.keys()
+
+        if missing:
+            rows = MarketOffer.objects.filter(
+                city=self.city, address__in=missing, latitude__isnull=False, longitude__isnull=False
+            ).values('address', *geocode_cache.LOCATION_FIELDS)
+            for row in rows:
+                coords[row.pop('address')] = row
+            missing -= coords.keys()
+
+        if missing:
+            cached = geocode_cache.get_many((address, self.city.name) for address in missing)
+            for address in missing:
+                result = cached.get(geocode_cache.make_key(address, self.city.name))
+                if result:
+                    coords[address] = geocode_cache.location_fields(result)
+
+        for address, location in coords.items():
+            self._remember(self._known_coords, address, location)
+
+        for offer in batch:
+            if offer.latitude is None and offer.address in coords:
+                for field, value in coords[offer.address].items():
+                    setattr(offer, field, value)
+        return batch
+
+    def _persist(self, batch: List[MarketOffer]) -> List[Dict[str, int]]:
+        """Пакетный upsert; запись в SQLite сериализуется между городами"""
+        with self.collector.write_lock():
+            with transaction.atomic():
+                return [self.collector._upsert_offers_chunk(batch)]
+
+    def _aggregate(self, batch: List[Dict[str, int]]) -> List:
+        with self._totals_lock:
+            for chunk_stats in batch:
+                for key, value in chunk_stats.items():
+                    self.totals[key] += value
+        return []
+
+    def _finish(self):
+        """Деактивация устаревших предложений и пересчет сводок города"""
+        # Пакетная запись не вызывает сигналов моделей: счетчики сайта сбрасываем сами
+        if self.totals['inserted'] or self.totals['updated']:
+            site_stats.invalidate()
+        with self.collector.write_lock():
+            self.result = self.collector.finish_market_update(self.city, dict(self.totals))
@@ -0,0 +1,382 @@
+"""
+Потоковое извлечение предложений со страниц поиска Яндекс.Недвижимости
+
+Страница читается кусками: HTML-токенизатор переходит от одного нужного
+тега к другому (карточки, ссылки, <script>), а состояние
+window.__INITIAL_STATE__ передается инкрементальному JSON-сканеру.
+Предложения отдаются по одному, как только найдены, без регулярных
+выражений по всей странице и без разбора всего состояния через json.loads.
+"""
+import re
+import json
+import html
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+STATE_PREFIX = 'window.__INITIAL_STATE__'
+
+
+def iter_chunks(text: str, size: int = 64 * 1024) -> Iterator[str]:
+    """Режет уже загруженную страницу на куски для потокового разбора"""
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+
+class JsonOfferScanner:
+    """
+    Инкрементальный JSON-сканер: находит объекты с ключами price, area и rooms
+
+    Разбирается только структура (скобки, строки, ключи), значения не
+    декодируются. Текст объекта хранится, пока он может оказаться
+    предложением; объекты длиннее MAX_OFFER_CHARS предложениями не считаются,
+    поэтому память ограничена размером одного предложения, а не всего состояния.
+    """
+
+    REQUIRED_KEYS = frozenset(('price', 'area', 'rooms'))
+    MAX_OFFER_CHARS = 64 * 1024
+
+    # Скобка или строка; у закрытой строки group(1) — кавычка, group(2) — двоеточие ключа
+    _token = re.compile(r'[{}\[\]]|"[^"\\]*(?:\\.[^"\\]*)*(?:(")\s*(:)?)?')
+    # Продолжение строки, начатой в прошлом куске
+    _string_rest = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*(?:(")\s*(:)?)?')
+
+    def __init__(self):
+        self._buffer = ''
+        self._base = 0  # абсолютная позиция начала буфера
+        self._pos = 0  # позиция разбора внутри буфера
+        self._stack = []  # [скобка, абсолютная позиция начала, найденные ключи]
+        self._pending_string = None  # абсолютное начало незакрытой строки
+
+    def feed(self, chunk: str) -> List[Dict]:
+        self._buffer += chunk
+        offers = self._scan(final=False)
+        self._trim()
+        return offers
+
+    def close(self) -> List[Dict]:
+        return self._scan(final=True)
+
+    def _scan(self, final: bool) -> List[Dict]:
+        offers = []
+        buffer, pos, stack = self._buffer, self._pos, self._stack
+        size = len(buffer)
+
+        if self._pending_string is not None:
+            # Продолжаем строку, начатую в прошлом куске, а не сканируем ее заново
+            rest = self._string_rest.match(buffer, pos)
+            if rest.group(1) is None:
+                self._pos = rest.end()
+                return offers
+            if rest.end() == size and not final:
+                return offers
+
+            start = self._pending_string - self._base
+            self._pending_string = None
+            # Начало строки отброшено только вне возможных предложений — тогда ключ не важен
+            if rest.group(2) and start >= 0:
+                self._add_key(buffer[start + 1:rest.start(1)])
+            pos = rest.end()
+
+        for match in self._token.finditer(buffer, pos):
+            index = match.start()
+            char = buffer[index]
+
+            if char == '"':
+                if match.group(1) is None:
+                    # Строка продолжается в следующем куске
+                    self._pending_string = self._base + index
+                    pos = match.end()
+                    break
+                if match.end() == size and not final:
+                    # Пока неизвестно, ключ это или значение
+                    pos = index
+                    break
+
+                if match.group(2):
+                    self._add_key(buffer[index + 1:match.start(1)])
+
+            elif char == '{' or char == '[':
+                stack.append([char, self._base + index, set() if char == '{' else None])
+
+            elif stack:
+                bracket, start, keys = stack.pop()
+                start -= self._base
+                # start < 0: текст объекта уже отброшен как слишком длинный
+                if char == '}' and bracket == '{' and start >= 0 and len(keys) == len(self.REQUIRED_KEYS):
+                    try:
+                        offers.append(json.loads(buffer[start:index + 1]))
+                    except ValueError:
+                        pass
+
+            pos = match.end()
+        else:
+            pos = size
+
+        self._pos = pos
+        return offers
+
+    def _add_key(self, key: str):
+        if key in self.REQUIRED_KEYS and self._stack and self._stack[-1][0] == '{':
+            self._stack[-1][2].add(key)
+
+    def _trim(self):
+        """Отбрасывает разобранный текст, не нужный ни одному возможному предложению"""
+        current = self._base + self._pos
+        keep_from = current
+
+        # Стек упорядочен по началу объектов: первый подходящий — самый ранний
+        for bracket, start, keys in self._stack:
+            if bracket == '{' and current - start <= self.MAX_OFFER_CHARS:
+                keep_from = start
+                break
+
+        cut = keep_from - self._base
+        if cut > 0:
+            self._buffer = self._buffer[cut:]
+            self._base = keep_from
+            self._pos -= cut
+
+
+class ListingPageExtractor:
+    """
+    Инкрементальный HTML-токенизатор страницы поиска
+
+    feed() принимает очередной кусок страницы и возвращает элементы, найденные
+    к этому моменту:
+        ('state', dict) — объект-предложение из window.__INITIAL_STATE__
+        ('card', (url, title, price_text)) — карточка offer-card из разметки
+    """
+
+    RAW_TEXT_TAGS = ('script', 'style')
+    # Незакрытый тег длиннее этого считается текстом, а не ждет следующего куска
+    MAX_TAG_CHARS = 8 * 1024
+
+    # Столько хвоста куска оставляем до следующего, если маркер не найден
+    TAIL_CHARS = 64
+
+    # Вне карточки интересны только комментарии, скрипты и начало карточки
+    IDLE_MARKERS = ('<!--', '<script', '<SCRIPT', '<style', '<STYLE', 'data-testid')
+    # Внутри карточки — еще ссылки (и все размеченные элементы)
+    CARD_MARKERS = IDLE_MARKERS + ('<a', '<A')
+    RAW_END_MARKERS = {tag: (f'</{tag}', f'</{tag.upper()}') for tag in RAW_TEXT_TAGS}
+
+    _card_testid = re.compile(r'data-testid\s*=\s*["\']?offer-card\b')
+    _tag = re.compile(r'<(/?)([a-zA-Z][\w:-]*)((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>')
+    _attr = re.compile(r'([\w:-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))')
+
+    def __init__(self):
+        self._buffer = ''
+        self._raw_tag = None  # script/style, содержимое которого читаем
+        self._script_head = None  # начало <script>, пока не ясно, состояние ли это
+        self._state_scanner = None
+        self._card = None
+        self._capture = None  # 'title' или 'price'
+        self._captured = []
+
+    def feed(self, chunk: str) -> List[Tuple[str, object]]:
+        self._buffer += chunk
+        return self._parse(final=False)
+
+    def close(self) -> List[Tuple[str, object]]:
+        items = self._parse(final=True)
+        if self._state_scanner is not None:
+            items.extend(('state', offer) for offer in self._state_scanner.close())
+            self._state_scanner = None
+        return items
+
+    def _parse(self, final: bool) -> List[Tuple[str, object]]:
+        items = []
+        buffer = self._buffer
+        size = len(buffer)
+        pos = 0
+        # Ближайшие позиции маркеров: str.find быстрее любого регулярного выражения
+        found = {}
+
+        while pos < size:
+            if self._raw_tag:
+                end = self._find_marker(buffer, pos, self.RAW_END_MARKERS[self._raw_tag], found)
+                close = buffer.find('>', end) if end >= 0 else -1
+                if close < 0 and not final:
+                    # Хвост может оказаться началом закрывающего тега
+                    safe = end if end >= 0 else max(pos, size - len(self._raw_tag) - 3)
+                    self._raw_data(buffer[pos:safe], items)
+                    pos = safe
+                    break
+
+                self._raw_data(buffer[pos:end if end >= 0 else size], items)
+                if self._raw_tag == 'script':
+                    self._end_script(items)
+                self._raw_tag = None
+                pos = close + 1 if close >= 0 else size
+                continue
+
+            if self._capture:
+                # Текст заголовка или цены — до первого тега
+                index = buffer.find('<', pos)
+                if index < 0:
+                    self._text(buffer[pos:])
+                    pos = size
+                    break
+                self._text(buffer[pos:index])
+            else:
+                # Остальной текст и теги не нужны: сразу переходим к нужным маркерам
+                markers = self.CARD_MARKERS if self._card is not None else self.IDLE_MARKERS
+                index = self._find_marker(buffer, pos, markers, found)
+                if index < 0:
+                    if final:
+                        pos = size
+                    else:
+                        # Хвост куска может оказаться началом нужного тега
+                        last_tag = buffer.rfind('<', max(pos, size - self.MAX_TAG_CHARS))
+                        pos = last_tag if last_tag >= 0 else max(pos, size - self.TAIL_CHARS)
+                    break
+
+                if buffer[index] != '<':
+                    # Совпал атрибут data-testid: вне карточки нужна только сама карточка
+                    if self._card is None and not self._card_testid.match(buffer, index):
+                        if not final and size - index < self.TAIL_CHARS:
+                            # Значение атрибута может продолжиться в следующем куске
+                            tag_start = buffer.rfind('<', pos, index)
+                            pos = tag_start if tag_start >= 0 else index
+                            break
+                        pos = index + 1
+                        continue
+                    # Разбираем тег, в котором стоит атрибут
+                    attr_index = index
+                    index = buffer.rfind('<', pos, attr_index)
+                    if index < 0:
+                        pos = attr_index + 1
+                        continue
+            pos = index
+
+            if buffer.startswith('<!--', index):
+                end = buffer.find('-->', index + 4)
+                if end < 0:
+                    if final:
+                        pos = size
+                    break
+                pos = end + 3
+                continue
+
+            tag = self._tag.match(buffer, index)
+            if not tag:
+                following = buffer[index + 1:index + 2]
+                if not final and size - index < self.MAX_TAG_CHARS and (not following or following.isalpha() or following == '/'):
+                    # Тег (или кавычка атрибута) может закончиться в следующем куске
+                    break
+                self._text('<')
+                pos = index + 1
+                continue
+
+            pos = tag.end()
+            closing, name, attrs_text = tag.group(1), tag.group(2).lower(), tag.group(3)
+            self._finish_capture(items)
+            if closing:
+                continue
+
+            self._start_tag(name, attrs_text)
+            if name in self.RAW_TEXT_TAGS and not attrs_text.rstrip().endswith('/'):
+                self._raw_tag = name
+                if name == 'script':
+                    self._script_head = ''
+
+        self._buffer = buffer[pos:]
+        return items
+
+    @staticmethod
+    def _find_marker(buffer: str, pos: int, markers: Tuple[str, ...], found: Dict[str, int]) -> int:
+        """Ближайшее вхождение любого из маркеров начиная с pos (-1, если нет)"""
+        nearest = -1
+        for marker in markers:
+            index = found.get(marker)
+            if index is None or 0 <= index < pos:
+                index = found[marker] = buffer.find(marker, pos)
+            if index >= 0 and (nearest < 0 or index < nearest):
+                nearest = index
+        return nearest
+
+    def _attrs(self, attrs_text: str) -> Dict[str, str]:
+        attrs = {}
+        for match in self._attr.finditer(attrs_text):
+            value = next((group for group in match.groups()[1:] if group is not None), '')
+            attrs[match.group(1).lower()] = html.unescape(value) if '&' in value else value
+        return attrs
+
+    def _start_tag(self, name: str, attrs_text: str):
+        if 'data-testid' not in attrs_text and not (self._card is not None and name == 'a'):
+            return
+
+        attrs = self._attrs(attrs_text)
+        testid = attrs.get('data-testid')
+
+        if testid == 'offer-card':
+            self._card = {}
+            return
+        if self._card is None:
+            return
+
+        if name == 'a' and 'url' not in self._card and 'href' in attrs:
+            self._card['url'] = attrs['href']
+        elif name == 'span' and testid == 'offer-card__title' and 'url' in self._card and 'title' not in self._card:
+            self._capture = 'title'
+        elif name == 'span' and testid == 'offer-card__price' and 'title' in self._card:
+            self._capture = 'price'
+
+    def _text(self, text: str):
+        if self._capture:
+            self._captured.append(text)
+
+    def _finish_capture(self, items: List):
+        if not self._capture:
+            return
+
+        text = html.unescape(''.join(self._captured)).strip()
+        self._card[self._capture] = text
+        if self._capture == 'price':
+            items.append(('card', (self._card['url'], self._card['title'], text)))
+            self._card = None
+
+        self._capture = None
+        self._captured = []
+
+    def _raw_data(self, data: str, items: List):
+        if not data or self._raw_tag != 'script':
+            return
+
+        if self._state_scanner is not None:
+            items.extend(('state', offer) for offer in self._state_scanner.feed(data))
+            return
+        if self._script_head is None:
+            return
+
+        # Решаем по началу скрипта, содержит ли он состояние страницы
+        self._script_head += data
+        head = self._script_head.lstrip()
+        if len(head) < len(STATE_PREFIX) and STATE_PREFIX.startswith(head):
+            return
+        if not head.startswith(STATE_PREFIX):
+            self._script_head = None
+            return
+
+        assignment = head[len(STATE_PREFIX):].lstrip()
+        if not assignment:
+            return
+        self._script_head = None
+        if assignment[0] != '=':
+            return
+
+        self._state_scanner = JsonOfferScanner()
+        items.extend(('state', offer) for offer in self._state_scanner.feed(assignment[1:]))
+
+    def _end_script(self, items: List):
+        if self._state_scanner is not None:
+            items.extend(('state', offer) for offer in self._state_scanner.close())
+        self._state_scanner = None
+        self._script_head = None
+
+
+def extract_listing_items(chunks: Iterable[str]) -> Iterator[Tuple[str, object]]:
+    """Потоково извлекает предложения из кусков страницы (см. ListingPageExtractor)"""
+    extractor = ListingPageExtractor()
+    for chunk in chunks:
+        yield from extractor.feed(chunk)
+    yield from extractor.close()
@@ -0,0 +1,129 @@
+"""
+Модуль для предрассчета сводных графиков и статистики рынка по городам
+"""
+import logging
+import threading
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F
+
+from analyzer.models import City, MarketOffer, MarketOverview
+from .charts import chart_generator
+
+logger = logging.getLogger(__name__)
+
+# pyplot хранит глобальное состояние, поэтому графики из разных потоков строим по очереди
+_chart_lock = threading.Lock()
+
+
+class MarketOverviewBuilder:
+    """Строит и сохраняет сводки рынка после каждого обновления данных"""
+
+    def bump_data_version(self, city: City) -> int:
+        """Увеличивает версию рыночных данных города и возвращает новое значение"""
+        City.objects.filter(pk=city.pk).update(market_data_version=F('market_data_version') + 1)
+        city.refresh_from_db(fields=['market_data_version'])
+        return city.market_data_version
+
+    def build_for_city(self, city: City, data_version: Optional[int] = None) -> List[MarketOverview]:
+        """
+        Рассчитывает сводки по всем квартирам города и по каждому количеству комнат
+
+        Args:
+            city: Город
+            data_version: Версия данных (по умолчанию текущая версия города)
+
+        Returns:
+            Список сохраненных сводок
+        """
+        if data_version is None:
+            data_version = city.market_data_version
+
+        # Загружаем только нужные поля одним запросом (дубли из других источников не учитываем)
+        offers = list(
+            MarketOffer.objects.filter(city=city, is_active=True, duplicate_of__isnull=True).only(
+                'price', 'area', 'rooms'
+            )
+        )
+
+        # Ключ 0 — все квартиры (копия списка: его нельзя пополнять во время обхода);
+        # студии (rooms=0) входят только в него, отдельного сегмента у них нет
+        segments = {0: list(offers)}
+        for offer in offers:
+            if offer.rooms > 0:
+                segments.setdefault(offer.rooms, []).append(offer)
+
+        overviews = []
+        for rooms, segment_offers in sorted(segments.items()):
+            if not segment_offers:
+                continue
+            overviews.append(self._build_overview(city, rooms, data_version, segment_offers))
+
+        # Заменяем старые версии атомарно, чтобы страницы не видели пустой город
+        with transaction.atomic():
+            MarketOverview.objects.filter(city=city, data_version=data_version).delete()
+            MarketOverview.objects.bulk_create(overviews)
+            MarketOverview.objects.filter(city=city, data_version__lt=data_version).delete()
+
+        logger.info(f"Сводки рынка для {city.name} (v{data_version}): {len(overviews)} сегментов")
+        return overviews
+
+    def _build_overview(self, city: City, rooms: int, data_version: int,
+                        offers: List[MarketOffer]) -> MarketOverview:
+        """Статистика и график для одного сегмента рынка"""
+        prices = [float(offer.price) for offer in offers]
+        prices_per_sqm = [float(offer.price) / float(offer.area) for offer in offers if offer.area > 0]
+
+        rooms_title = f"{rooms}-к квартиры" if rooms else "все квартиры"
+        with _chart_lock:
+            chart = chart_generator.create_price_distribution_chart(
+                offers,
+                title=f"Распределение цен в {city.name}: {rooms_title}"
+            )
+
+        return MarketOverview(
+            city=city,
+            rooms=rooms,
+            data_version=data_version,
+            offers_count=len(prices),
+            avg_price=self._to_decimal(np.mean(prices)),
+            median_price=self._to_decimal(np.median(prices)),
+            min_price=self._to_decimal(min(prices)),
+            max_price=self._to_decimal(max(prices)),
+            avg_price_per_sqm=self._to_decimal(np.mean(prices_per_sqm)) if prices_per_sqm else Decimal('0'),
+            chart_image_base64=chart or None,
+        )
+
+    @staticmethod
+    def _to_decimal(value) -> Decimal:
+        return Decimal(str(round(float(value), 2)))
+
+    def get_city_overviews(self, city: City) -> Dict[int, MarketOverview]:
+        """Последние сводки города: {количество комнат: сводка}, 0 — все квартиры"""
+        latest = MarketOverview.objects.filter(city=city).order_by('-data_version').first()
+        if not latest:
+            return {}
+
+        overviews = MarketOverview.objects.filter(city=city, data_version=latest.data_version)
+        return {overview.rooms: overview for overview in overviews}
+
+    def get_latest_overviews(self, rooms: int = 0, city_ids=None) -> Dict[int, MarketOverview]:
+        """Последние сводки заданного сегмента по всем городам: {id города: сводка}"""
+        overviews = MarketOverview.objects.filter(rooms=rooms).select_related('city').order_by(
+            'city_id', '-data_version'
+        )
+        if city_ids is not None:
+            overviews = overviews.filter(city_id__in=city_ids)
+
+        result = {}
+        for overview in overviews:
+            # Первая запись для города — самая свежая версия
+            result.setdefault(overview.city_id, overview)
+        return result
+
+
+# Глобальный экземпляр
+market_overview_builder = MarketOverviewBuilder()
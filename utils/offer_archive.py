@@ -0,0 +1,127 @@
+"""
+Архивация неактивных предложений
+
+Предложения, неактивные дольше срока хранения, переносятся из MarketOffer
+в ArchivedMarketOffer: рабочая таблица остается небольшой (анализ, списки
+и админка работают с актуальными данными), а история цен и трендов
+доступна через history(), которая читает обе таблицы.
+"""
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BooleanField, F, Value
+from django.utils import timezone
+
+from analyzer.models import ArchivedMarketOffer, City, GeocodingTask, MarketOffer
+
+from .site_stats import site_stats
+
+logger = logging.getLogger(__name__)
+
+
+class OfferArchiver:
+    """Перенос неактивных предложений в архив и чтение обеих таблиц"""
+
+    # Колонки, общие для рабочей таблицы и архива
+    FIELDS = (
+        'city_id', 'source', 'external_id', 'address', 'area', 'rooms', 'floor',
+        'price', 'latitude', 'longitude', 'parsed_date',
+    )
+
+    def retention_days(self) -> int:
+        return getattr(settings, 'OFFER_ARCHIVE_RETENTION_DAYS', 90)
+
+    def archivable(self, retention_days: Optional[int] = None, city: Optional[City] = None):
+        """Неактивные предложения, не получавшиеся из источников дольше срока хранения"""
+        if retention_days is None:
+            retention_days = self.retention_days()
+        cutoff = timezone.now() - timezone.timedelta(days=retention_days)
+
+        offers = MarketOffer.objects.filter(is_active=False, parsed_date__lt=cutoff)
+        if city is not None:
+            offers = offers.filter(city=city)
+        return offers
+
+    def archive(self, retention_days: Optional[int] = None, city: Optional[City] = None,
+                batch_size: int = 1000, max_batches: int = 0) -> Dict[str, int]:
+        """
+        Переносит предложения в архив пакетами (каждый пакет — одна транзакция)
+
+        Returns:
+            Словарь со счетчиками archived и batches
+        """
+        stats = {'archived': 0, 'batches': 0}
+        offers = self.archivable(retention_days, city)
+
+        while not max_batches or stats['batches'] < max_batches:
+            with transaction.atomic():
+                rows = list(offers.order_by('id').values('id', *self.FIELDS)[:batch_size])
+                if not rows:
+                    break
+                ids = [row['id'] for row in rows]
+
+                ArchivedMarketOffer.objects.bulk_create(
+                    [ArchivedMarketOffer(offer_id=row.pop('id'), **row) for row in rows],
+                    ignore_conflicts=True,
+                )
+
+                # Дубли, ссылавшиеся на архивируемые предложения, снова считаются самостоятельными
+                MarketOffer.objects.filter(duplicate_of_id__in=ids).update(duplicate_of=None)
+                GeocodingTask.objects.filter(kind=GeocodingTask.KIND_MARKET_OFFER, object_id__in=ids).delete()
+                MarketOffer.objects.filter(id__in=ids).delete()
+
+            stats['archived'] += len(ids)
+            stats['batches'] += 1
+
+        # Массовое удаление не вызывает сигналов моделей: счетчики сайта сбрасываем сами
+        if stats['archived']:
+            site_stats.invalidate()
+        logger.info(f"Архивировано предложений: {stats['archived']} ({stats['batches']} пакетов)")
+        return stats
+
+    def history(self, city: Optional[City] = None, rooms: Optional[int] = None,
+                since: Optional[datetime] = None, until: Optional[datetime] = None,
+                include_active: bool = True):
+        """
+        Предложения из рабочей таблицы и архива одним запросом (UNION ALL)
+
+        Args:
+            city: Город
+            rooms: Количество комнат
+            since: Дата последнего получения не раньше
+            until: Дата последнего получения раньше
+            include_active: Включать ли активные предложения
+
+        Returns:
+            QuerySet словарей с полями FIELDS, offer_pk (id предложения) и archived
+        """
+        filters = {}
+        if city is not None:
+            filters['city'] = city
+        if rooms is not None:
+            filters['rooms'] = rooms
+        if since is not None:
+            filters['parsed_date__gte'] = since
+        if until is not None:
+            filters['parsed_date__lt'] = until
+
+        live = MarketOffer.objects.filter(**filters)
+        if not include_active:
+            live = live.filter(is_active=False)
+
+        # Одинаковый порядок колонок: поля модели, затем вычисляемые offer_pk и archived
+        live = live.annotate(
+            offer_pk=F('id'), archived=Value(False, output_field=BooleanField())
+        ).values(*self.FIELDS, 'offer_pk', 'archived')
+        archived = ArchivedMarketOffer.objects.filter(**filters).annotate(
+            offer_pk=F('offer_id'), archived=Value(True, output_field=BooleanField())
+        ).values(*self.FIELDS, 'offer_pk', 'archived')
+
+        return live.order_by().union(archived.order_by(), all=True)
+
+
+# Глобальный экземпляр
+offer_archiver = OfferArchiver()
@@ -0,0 +1,265 @@
+"""
+Поиск одного и того же объявления в разных источниках
+
+Кандидаты в дубли сравниваются только внутри блоков: город, количество
+комнат, округленная площадь и ячейка geohash (для негеокодированных
+предложений — улица). Предложения читаются потоком, отсортированными по
+площади, и в памяти держатся только два соседних диапазона площади,
+поэтому время и память растут линейно с количеством предложений.
+
+Похожие пары (адрес + цена) объединяются в кластеры; у каждого кластера
+одно основное предложение, остальные ссылаются на него через duplicate_of
+и не учитываются в анализе и сводках.
+"""
+import logging
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+from django.db import transaction
+
+from analyzer.models import City, MarketOffer
+
+from .address_normalizer import address_normalizer
+
+logger = logging.getLogger(__name__)
+
+_GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash(lat: float, lon: float, precision: int = 6) -> str:
+    """Geohash точки (6 символов — ячейка около 1,2 × 0,6 км)"""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        value_range, value = (lon_range, lon) if even else (lat_range, lat)
+        middle = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            value_range[0] = middle
+        else:
+            value_range[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+class OfferDeduplicator:
+    """Кластеризация дублей предложений по городам"""
+
+    # Ширина диапазона площади блока (м²); сравниваются соседние диапазоны
+    AREA_BUCKET = 2
+    GEOHASH_PRECISION = 6
+    # Максимальная разница цен дублей (доля от большей цены)
+    PRICE_TOLERANCE = 0.1
+    # Порог оценки похожести пары (0..1)
+    MATCH_THRESHOLD = 0.75
+    ADDRESS_WEIGHT = 0.6
+
+    # Основным в кластере становится предложение самого надежного источника
+    SOURCE_PRIORITY = {'yandex_real': 0, 'yandex': 0, 'avito': 1, 'cian': 1, 'html_parsed': 2, 'import': 2}
+    DEFAULT_PRIORITY = 3
+    ANALYTIC_PRIORITY = 4
+
+    VALUES = ('id', 'source', 'address', 'area', 'rooms', 'floor', 'price', 'latitude', 'longitude', 'parsed_date')
+
+    def address_tokens(self, address: str, city_name: str = '') -> frozenset:
+        """Значимые слова и номера домов адреса"""
+        return address_normalizer.tokens(address or '', city_name or '')
+
+    def _street_key(self, tokens: frozenset) -> str:
+        words = sorted(token for token in tokens if not token[0].isdigit())
+        return words[0] if words else ''
+
+    def _prepare(self, row: Tuple, city_name: str) -> Dict:
+        offer = dict(zip(self.VALUES, row))
+        offer['area'] = float(offer['area'])
+        offer['price'] = float(offer['price'])
+        offer['tokens'] = self.address_tokens(offer['address'], city_name)
+        if offer['latitude'] and offer['longitude']:
+            offer['cell'] = geohash(float(offer['latitude']), float(offer['longitude']), self.GEOHASH_PRECISION)
+        else:
+            offer['cell'] = 'street:' + self._street_key(offer['tokens'])
+        return offer
+
+    def score(self, first: Dict, second: Dict) -> float:
+        """Оценка похожести пары: 0 — точно разные, 1 — одно и то же"""
+        if first['floor'] and second['floor'] and first['floor'] != second['floor']:
+            return 0.0
+
+        high = max(first['price'], second['price'])
+        price_diff = abs(first['price'] - second['price']) / high if high else 1.0
+        if price_diff > self.PRICE_TOLERANCE:
+            return 0.0
+        price_score = 1.0 - price_diff / self.PRICE_TOLERANCE
+
+        tokens_a, tokens_b = first['tokens'], second['tokens']
+        if tokens_a and tokens_b:
+            address_score = len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+            # Разные номера домов на одной улице — разные квартиры
+            numbers_a = {token for token in tokens_a if token[0].isdigit()}
+            numbers_b = {token for token in tokens_b if token[0].isdigit()}
+            if numbers_a and numbers_b and not numbers_a & numbers_b:
+                address_score = 0.0
+        else:
+            address_score = 0.0
+
+        return self.ADDRESS_WEIGHT * address_score + (1 - self.ADDRESS_WEIGHT) * price_score
+
+    def _compare(self, offers: List[Dict], others: List[Dict], parents: Dict[int, int], same: bool):
+        """
+        Пары предложений ячейки (списки отсортированы по цене)
+
+        Для каждого предложения смотрим только окно цен в пределах допуска.
+        """
+        other_prices = [other['price'] for other in others]
+        for position, offer in enumerate(offers):
+            low = offer['price'] * (1 - self.PRICE_TOLERANCE)
+            high = offer['price'] / (1 - self.PRICE_TOLERANCE)
+            start = position + 1 if same else bisect_left(other_prices, low)
+            for index in range(start, len(others)):
+                other = others[index]
+                if other['price'] > high:
+                    break
+                # Внутри одного источника дубли уже исключены ключом external_id
+                if offer['source'] == other['source']:
+                    continue
+                if self.score(offer, other) >= self.MATCH_THRESHOLD:
+                    self._union(parents, offer['id'], other['id'])
+
+    @staticmethod
+    def _find(parents: Dict[int, int], item: int) -> int:
+        root = item
+        while parents.get(root, root) != root:
+            root = parents[root]
+        while parents.get(item, item) != root:
+            parents[item], item = root, parents[item]
+        return root
+
+    def _union(self, parents: Dict[int, int], first: int, second: int):
+        parents.setdefault(first, first)
+        parents.setdefault(second, second)
+        root_a, root_b = self._find(parents, first), self._find(parents, second)
+        if root_a != root_b:
+            parents[max(root_a, root_b)] = min(root_a, root_b)
+
+    def _compare_buckets(self, current: Dict[str, List[Dict]], previous: Optional[Dict[str, List[Dict]]],
+                         parents: Dict[int, int]):
+        for cell, offers in current.items():
+            offers.sort(key=lambda offer: offer['price'])
+            self._compare(offers, offers, parents, same=True)
+            if previous and cell in previous:
+                self._compare(offers, previous[cell], parents, same=False)
+
+    def find_clusters(self, city: City, rooms: int, rows) -> Tuple[Dict[int, int], Dict[int, Dict]]:
+        """
+        Кластеры дублей одного сегмента
+
+        Args:
+            rows: Кортежи VALUES, отсортированные по площади
+
+        Returns:
+            (id предложения → id корня кластера, сведения о предложениях из кластеров)
+        """
+        parents = {}
+        members = {}
+        previous, current = None, {}
+        previous_bucket, current_bucket = None, None
+
+        def flush():
+            self._compare_buckets(current, previous if previous_bucket == current_bucket - 1 else None, parents)
+            for offers in current.values():
+                for offer in offers:
+                    if offer['id'] in parents:
+                        members[offer['id']] = offer
+            if previous:
+                for offers in previous.values():
+                    for offer in offers:
+                        if offer['id'] in parents:
+                            members[offer['id']] = offer
+
+        for row in rows:
+            offer = self._prepare(row, city.name)
+            bucket = int(offer['area'] // self.AREA_BUCKET)
+            if bucket != current_bucket:
+                if current_bucket is not None:
+                    flush()
+                    previous, previous_bucket = current, current_bucket
+                current, current_bucket = {}, bucket
+            current.setdefault(offer['cell'], []).append(offer)
+
+        if current_bucket is not None:
+            flush()
+
+        return parents, members
+
+    def _canonical(self, offers: List[Dict]) -> Dict:
+        def rank(offer):
+            if offer['source'] == 'analytic':
+                priority = self.ANALYTIC_PRIORITY
+            else:
+                priority = self.SOURCE_PRIORITY.get(offer['source'], self.DEFAULT_PRIORITY)
+            return priority, -offer['parsed_date'].timestamp(), offer['id']
+        return min(offers, key=rank)
+
+    def cluster_city(self, city: City) -> Dict[str, int]:
+        """
+        Пересчитывает кластеры дублей активных предложений города
+
+        Returns:
+            Словарь со счетчиками offers, clusters, duplicates
+        """
+        stats = {'offers': 0, 'clusters': 0, 'duplicates': 0}
+        links = {}
+
+        rooms_values = (
+            MarketOffer.objects.filter(city=city, is_active=True)
+            .values_list('rooms', flat=True).distinct().order_by()
+        )
+        for rooms in list(rooms_values):
+            rows = (
+                MarketOffer.objects.filter(city=city, rooms=rooms, is_active=True)
+                .order_by('area', 'id')
+                .values_list(*self.VALUES)
+                .iterator(chunk_size=2000)
+            )
+            parents, members = self.find_clusters(city, rooms, rows)
+
+            clusters = {}
+            for offer_id, offer in members.items():
+                clusters.setdefault(self._find(parents, offer_id), []).append(offer)
+
+            for offers in clusters.values():
+                canonical = self._canonical(offers)
+                stats['clusters'] += 1
+                for offer in offers:
+                    if offer['id'] != canonical['id']:
+                        links[offer['id']] = canonical['id']
+
+        stats['offers'] = MarketOffer.objects.filter(city=city, is_active=True).count()
+        stats['duplicates'] = len(links)
+
+        with transaction.atomic():
+            MarketOffer.objects.filter(city=city, duplicate_of__isnull=False).update(duplicate_of=None)
+            MarketOffer.objects.bulk_update(
+                [MarketOffer(pk=offer_id, duplicate_of_id=canonical_id) for offer_id, canonical_id in links.items()],
+                ['duplicate_of'],
+                batch_size=500,
+            )
+
+        logger.info(
+            f"Дубли {city.name}: предложений {stats['offers']}, кластеров {stats['clusters']}, "
+            f"дублей {stats['duplicates']}"
+        )
+        return stats
+
+
+# Глобальный экземпляр
+offer_deduplicator = OfferDeduplicator()
@@ -0,0 +1,275 @@
+"""
+Загрузка предложений из файлов выгрузок (CSV, JSONL, Parquet)
+
+Файл читается потоково пакетами фиксированного размера: строки проверяются,
+приводятся к полям MarketOffer и записываются пакетным upsert'ом сборщика
+данных, поэтому память не зависит от размера файла. Геокодирование
+откладывается — новые адреса уходят в очередь геокодирования.
+"""
+import csv
+import gzip
+import json
+import hashlib
+import logging
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from analyzer.models import LOCATION_PRECISION_CHOICES, City
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+
+class OfferFileLoader:
+    """Чтение, проверка и пакетная запись предложений из файла"""
+
+    FORMATS = ('csv', 'jsonl', 'parquet')
+
+    # Ограничения полей MarketOffer (max_digits)
+    MAX_AREA = Decimal('9999.99')
+    MAX_PRICE = Decimal('99999999.99')
+
+    def __init__(self):
+        self._cities = None
+
+    @property
+    def parquet_available(self) -> bool:
+        return pq is not None
+
+    def detect_format(self, path: Path) -> str:
+        """Формат по расширению файла (.gz допускается для CSV и JSONL)"""
+        suffixes = [suffix.lower() for suffix in path.suffixes if suffix.lower() != '.gz']
+        extension = suffixes[-1].lstrip('.') if suffixes else ''
+        if extension in ('json', 'ndjson'):
+            extension = 'jsonl'
+        if extension not in self.FORMATS:
+            raise ValueError(f"Не удалось определить формат файла {path.name}, укажите его явно")
+        return extension
+
+    def iter_rows(self, path: Path, file_format: str, delimiter: str = ',',
+                  batch_size: int = 2000) -> Iterator[Tuple[int, Dict]]:
+        """Строки файла по одной: (номер строки, словарь полей)"""
+        if file_format == 'parquet':
+            if pq is None:
+                raise ValueError("Для загрузки Parquet установите pyarrow")
+            line_number = 0
+            for record_batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+                for row in record_batch.to_pylist():
+                    line_number += 1
+                    yield line_number, row
+            return
+
+        opener = gzip.open if path.suffix.lower() == '.gz' else open
+        with opener(path, 'rt', encoding='utf-8-sig', newline='') as file:
+            if file_format == 'csv':
+                reader = csv.DictReader(file, delimiter=delimiter)
+                for row in reader:
+                    yield reader.line_num, row
+            else:
+                for line_number, line in enumerate(file, start=1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        row = None
+                    yield line_number, row if isinstance(row, dict) else {'_invalid': 'не JSON-объект'}
+
+    def iter_chunks(self, rows: Iterator[Tuple[int, Dict]], size: int) -> Iterator[List[Tuple[int, Dict]]]:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _city_by_name(self, name: str) -> City:
+        if self._cities is None:
+            self._cities = {city.name.lower(): city for city in City.objects.all()}
+        city = self._cities.get(name.strip().lower())
+        if city is None:
+            raise ValueError(f"неизвестный город «{name}»")
+        return city
+
+    @staticmethod
+    def _decimal(value, field: str) -> Decimal:
+        if isinstance(value, (int, float, Decimal)):
+            text = str(value)
+        else:
+            # «45 000», «52,5» — в выгрузках встречается русская запись чисел
+            text = str(value or '').replace('\xa0', '').replace(' ', '').replace(',', '.')
+        try:
+            number = Decimal(text)
+        except InvalidOperation:
+            raise ValueError(f"некорректное значение {field}: {value!r}")
+        if not number.is_finite():
+            raise ValueError(f"некорректное значение {field}: {value!r}")
+        return number
+
+    @staticmethod
+    def _int(value, field: str, default: Optional[int] = None) -> Optional[int]:
+        if value in (None, ''):
+            return default
+        try:
+            return int(float(str(value).replace(',', '.')))
+        except ValueError:
+            raise ValueError(f"некорректное значение {field}: {value!r}")
+
+    @staticmethod
+    def _bool(value) -> bool:
+        """Пустое значение — по умолчанию (True), как и отсутствующее"""
+        if isinstance(value, str):
+            return value.strip().lower() not in ('0', 'false', 'no', 'нет')
+        return True if value is None else bool(value)
+
+    def _coordinate(self, value, field: str, limit: int) -> Optional[Decimal]:
+        """Широта или долгота в пределах ±limit; None, если не указана"""
+        if value is None or (isinstance(value, str) and not value.strip()):
+            return None
+        number = self._decimal(value, field).quantize(Decimal('0.000001'))
+        if not -limit <= number <= limit:
+            raise ValueError(f"{field} вне допустимого диапазона: {number}")
+        return number
+
+    def normalize_row(self, row: Dict, default_city: Optional[City] = None,
+                      default_source: str = 'import') -> Tuple[City, Dict]:
+        """
+        Проверка строки и приведение к данным предложения
+
+        Returns:
+            (город, словарь для RealEstateDataCollector._build_offer_instance)
+
+        Raises:
+            ValueError: строка некорректна (текст ошибки — причина)
+        """
+        if '_invalid' in row:
+            raise ValueError(row['_invalid'])
+
+        city_name = str(row.get('city') or '').strip()
+        if city_name:
+            city = self._city_by_name(city_name)
+        elif default_city is not None:
+            city = default_city
+        else:
+            raise ValueError("не указан город")
+
+        address = str(row.get('address') or '').strip()
+        if not address:
+            raise ValueError("не указан адрес")
+
+        price = self._decimal(row.get('price'), 'price').quantize(Decimal('0.01'))
+        area = self._decimal(row.get('area'), 'area').quantize(Decimal('0.01'))
+        if not 0 < price <= self.MAX_PRICE:
+            raise ValueError(f"цена вне допустимого диапазона: {price}")
+        if not 0 < area <= self.MAX_AREA:
+            raise ValueError(f"площадь вне допустимого диапазона: {area}")
+
+        rooms = self._int(row.get('rooms'), 'rooms', default=1)
+        if rooms < 0:
+            raise ValueError(f"некорректное количество комнат: {rooms}")
+        floor = self._int(row.get('floor'), 'floor')
+
+        source = str(row.get('source') or default_source).strip()[:20]
+
+        additional_info = row.get('additional_info') or {}
+        if isinstance(additional_info, str):
+            try:
+                additional_info = json.loads(additional_info)
+            except ValueError:
+                raise ValueError("additional_info не является JSON")
+        if not isinstance(additional_info, dict):
+            raise ValueError("additional_info должен быть объектом")
+
+        parsed_date = row.get('parsed_date') or None
+        if isinstance(parsed_date, str):
+            parsed_date = parse_datetime(parsed_date.strip())
+            if parsed_date is None:
+                raise ValueError(f"некорректная дата: {row.get('parsed_date')!r}")
+        if parsed_date is not None and timezone.is_naive(parsed_date):
+            parsed_date = timezone.make_aware(parsed_date)
+
+        latitude = self._coordinate(row.get('latitude'), 'latitude', 90)
+        longitude = self._coordinate(row.get('longitude'), 'longitude', 180)
+        if (latitude is None) != (longitude is None):
+            raise ValueError("координаты указаны не полностью")
+
+        # Точность координат из файла (если указана), иначе неизвестна — их уточнит regeocode_imprecise
+        location_precision = str(row.get('location_precision') or 'unknown').strip().lower()
+        if location_precision not in dict(LOCATION_PRECISION_CHOICES):
+            raise ValueError(f"некорректная точность координат: {row.get('location_precision')!r}")
+
+        external_id = str(row.get('external_id') or '').strip()
+        if not external_id:
+            # Стабильный идентификатор: повторная загрузка того же файла не создает дублей
+            fingerprint = f"{city.pk}|{address.lower()}|{rooms}|{area}|{floor}"
+            external_id = f"{source}_{hashlib.blake2b(fingerprint.encode('utf-8'), digest_size=8).hexdigest()}"
+
+        offer_data = {
+            'source': source,
+            'external_id': external_id,
+            'address': address,
+            'area': area,
+            'rooms': rooms,
+            'floor': floor,
+            'price': price,
+            'url': str(row.get('url') or '')[:200],
+            'is_active': self._bool(row.get('is_active')),
+            'parsed_date': parsed_date or timezone.now(),
+            'additional_info': additional_info,
+            'latitude': latitude,
+            'longitude': longitude,
+            'location_precision': location_precision,
+            'location_source': 'import',
+        }
+        return city, offer_data
+
+    def load_chunk(self, collector, rows: List[Tuple[int, Dict]], default_city: Optional[City] = None,
+                   default_source: str = 'import', dry_run: bool = False) -> Dict:
+        """
+        Проверка и запись одного пакета строк
+
+        Returns:
+            Счетчики rows, inserted, updated, unchanged, invalid,
+            errors (список (номер строки, причина)) и city_ids затронутых городов
+        """
+        stats = {'rows': len(rows), 'inserted': 0, 'updated': 0, 'unchanged': 0, 'invalid': 0,
+                 'errors': [], 'city_ids': set()}
+
+        # Повторы ключа внутри пакета: последнее значение побеждает
+        prepared = {}
+        for line_number, row in rows:
+            try:
+                city, offer_data = self.normalize_row(row, default_city, default_source)
+                offer = collector._build_offer_instance(offer_data, city, line_number)
+            except (ValueError, TypeError, ArithmeticError) as e:
+                stats['invalid'] += 1
+                stats['errors'].append((line_number, str(e)))
+                continue
+            prepared[(offer.source, offer.external_id)] = offer
+            stats['city_ids'].add(city.pk)
+
+        if dry_run or not prepared:
+            return stats
+
+        with collector.write_lock():
+            with transaction.atomic():
+                chunk_stats = collector._upsert_offers_chunk(list(prepared.values()))
+        for key, value in chunk_stats.items():
+            stats[key] += value
+        return stats
+
+
+# Глобальный экземпляр
+offer_file_loader = OfferFileLoader()
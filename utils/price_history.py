@@ -0,0 +1,104 @@
+"""
+История цен предложений
+
+Журнал OfferPriceHistory только дополняется: сборщик данных пишет строку
+при первой загрузке предложения и при каждом изменении его цены, поэтому
+объем журнала растет с числом изменений, а не с числом обновлений.
+Ряды по предложению, сегменту (город + комнаты) и городу читаются по
+индексам (offer_id, recorded_at) и (city, rooms, recorded_at).
+"""
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from analyzer.models import City, OfferPriceHistory
+
+logger = logging.getLogger(__name__)
+
+
+class PriceHistory:
+    """Запись и чтение истории цен"""
+
+    BUCKETS = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
+
+    def record_many(self, entries: Iterable[Tuple[int, int, int, object]],
+                    recorded_at: Optional[datetime] = None) -> int:
+        """
+        Добавляет записи журнала одним запросом
+
+        Args:
+            entries: Кортежи (id предложения, id города, комнаты, цена)
+            recorded_at: Время изменения (по умолчанию текущее)
+
+        Returns:
+            Количество добавленных записей
+        """
+        recorded_at = recorded_at or timezone.now()
+        rows = [
+            OfferPriceHistory(offer_id=offer_id, city_id=city_id, rooms=rooms, price=price, recorded_at=recorded_at)
+            for offer_id, city_id, rooms, price in entries
+        ]
+        if rows:
+            OfferPriceHistory.objects.bulk_create(rows, batch_size=1000)
+        return len(rows)
+
+    def _window(self, queryset, since: Optional[datetime], until: Optional[datetime]):
+        if since is not None:
+            queryset = queryset.filter(recorded_at__gte=since)
+        if until is not None:
+            queryset = queryset.filter(recorded_at__lt=until)
+        return queryset
+
+    def offer_series(self, offer_id: int, since: Optional[datetime] = None,
+                     until: Optional[datetime] = None) -> List[Dict]:
+        """Изменения цены одного предложения: список {recorded_at, price}"""
+        history = self._window(OfferPriceHistory.objects.filter(offer_id=offer_id), since, until)
+        return list(history.order_by('recorded_at').values('recorded_at', 'price'))
+
+    def segment_series(self, city: City, rooms: Optional[int] = None, since: Optional[datetime] = None,
+                       until: Optional[datetime] = None, bucket: str = 'day') -> List[Dict]:
+        """
+        Цены сегмента, агрегированные по периодам
+
+        Args:
+            city: Город
+            rooms: Количество комнат (None — весь город)
+            since: Начало окна (включительно)
+            until: Конец окна (не включительно)
+            bucket: Период агрегации: day, week или month
+
+        Returns:
+            Список {period, avg_price, min_price, max_price, changes} по возрастанию периода
+        """
+        if bucket not in self.BUCKETS:
+            raise ValueError(f"Неизвестный период агрегации: {bucket}")
+
+        history = OfferPriceHistory.objects.filter(city=city)
+        if rooms is not None:
+            history = history.filter(rooms=rooms)
+        history = self._window(history, since, until)
+
+        return list(
+            history.annotate(period=self.BUCKETS[bucket]('recorded_at'))
+            .values('period')
+            .annotate(
+                avg_price=Avg('price'),
+                min_price=Min('price'),
+                max_price=Max('price'),
+                changes=Count('id'),
+            )
+            .order_by('period')
+        )
+
+    def city_series(self, city: City, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                    bucket: str = 'day') -> List[Dict]:
+        """Цены всего города по периодам (см. segment_series)"""
+        return self.segment_series(city, None, since, until, bucket)
+
+
+# Глобальный экземпляр
+price_history = PriceHistory()
@@ -0,0 +1,134 @@
+"""
+Ограничение частоты запросов к внешним источникам
+
+Лимит общий для всех потоков процесса; для источников из
+SOURCE_SHARED_RATE_LIMITS (геокодер Nominatim) — и для всех процессов:
+команд, воркеров очереди и веб-запросов (token bucket в файле).
+"""
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка только внутри процесса
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class FileTokenBucket:
+    """
+    Token bucket, общий для процессов: состояние (токены, время) хранится
+    в файле и меняется под блокировкой flock
+
+    Как и SourceRateLimiter, acquire() резервирует токен заранее (счет может
+    уйти в минус) и ждет, пока он «накопится», поэтому одновременные
+    вызывающие выстраиваются в очередь без всплесков, а поток запросов
+    держится ровно на лимите.
+    """
+
+    def __init__(self, path: Path, capacity: float = 1.0):
+        self.path = Path(path)
+        # Сколько запросов можно сделать сразу после простоя
+        self.capacity = capacity
+        self._lock = threading.Lock()
+
+    def acquire(self, rate: float) -> float:
+        """Резервирует один запрос при лимите rate запросов в секунду, возвращает время ожидания (сек)"""
+        if rate <= 0:
+            return 0.0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(self.path, 'a+') as file:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                file.seek(0)
+                now = time.time()
+                try:
+                    tokens, updated = (float(value) for value in file.read().split())
+                    tokens = min(self.capacity, tokens + (now - updated) * rate)
+                except ValueError:
+                    tokens = self.capacity
+                tokens -= 1
+
+                file.seek(0)
+                file.truncate()
+                file.write(f"{tokens} {now}")
+                file.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(file, fcntl.LOCK_UN)
+
+        delay = -tokens / rate if tokens < 0 else 0.0
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+class SourceRateLimiter:
+    """
+    Потокобезопасный лимитер: не чаще N запросов в секунду для каждого источника
+
+    Каждый вызов wait() резервирует следующий свободный слот источника,
+    поэтому параллельные потоки выстраиваются в очередь без всплесков.
+    """
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None, default_rate: float = 1.0,
+                 shared: Iterable[str] = (), state_dir: Optional[Path] = None):
+        self.rates = rates or {}
+        self.default_rate = default_rate
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+        # Источники с лимитом, общим для всех процессов
+        self.shared = set(shared)
+        self.state_dir = Path(state_dir) if state_dir else None
+        self._buckets = {}
+
+    def interval_for(self, source: str) -> float:
+        rate = self.rates.get(source, self.default_rate)
+        return 1.0 / rate if rate > 0 else 0.0
+
+    def wait(self, source: str) -> float:
+        """Ждет своей очереди на запрос к источнику, возвращает время ожидания (сек)"""
+        interval = self.interval_for(source)
+        if interval <= 0:
+            return 0.0
+
+        if source in self.shared and self.state_dir is not None:
+            delay = self.bucket_for(source).acquire(1.0 / interval)
+            if delay > 0:
+                logger.debug(f"Общий rate limit {source}: ждали {delay:.2f} сек")
+            return delay
+
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(source, now))
+            self._next_slot[source] = slot + interval
+
+        delay = slot - now
+        if delay > 0:
+            logger.debug(f"Rate limit {source}: ждем {delay:.2f} сек")
+            time.sleep(delay)
+        return delay
+
+    def bucket_for(self, source: str) -> FileTokenBucket:
+        with self._lock:
+            if source not in self._buckets:
+                self._buckets[source] = FileTokenBucket(self.state_dir / f"{source}.bucket")
+            return self._buckets[source]
+
+
+# Глобальный экземпляр (запросов в секунду по источникам из настроек)
+source_rate_limiter = SourceRateLimiter(
+    rates=getattr(settings, 'SOURCE_RATE_LIMITS', {}),
+    default_rate=getattr(settings, 'SOURCE_DEFAULT_RATE_LIMIT', 1.0),
+    shared=getattr(settings, 'SOURCE_SHARED_RATE_LIMITS', ()),
+    state_dir=getattr(settings, 'RATE_LIMIT_STATE_DIR', None),
+)
@@ -4,15 +4,26 @@
 import requests
 import time
 import logging
-from typing import List, Dict, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Dict, Iterator, List, Optional, Tuple
 from decimal import Decimal
+from django.conf import settings
+from django.db import connection, connections, transaction
 from django.utils import timezone
 from datetime import datetime, timedelta
-from analyzer.models import City, MarketOffer
+from analyzer.models import City, GeocodingTask, MarketOffer
 
 # Импортируем реальные парсеры
 from .yandex_realty_parser import yandex_realty_parser
-from .charts import chart_generator
+from .market_overview import market_overview_builder
+from .buildings import building_registry
+from .geocoding_queue import geocoding_queue
+from .ingestion_pipeline import IngestionPipeline
+from .offer_dedup import offer_deduplicator
+from .price_history import price_history
+from .site_stats import site_stats
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +35,7 @@ class RealEstateDataCollector:
         self.sources = {
             'yandex_real': yandex_realty_parser,
         }
+        self._sqlite_write_lock = threading.Lock()
         self.test_connection()
 
     def test_connection(self):
@@ -44,40 +56,50 @@ class RealEstateDataCollector:
         Получение данных из реальных источников
         """
         all_offers = []
+        for batch in self.iter_source_batches(city, limit_per_source):
+            all_offers.extend(batch)
+
+        # 3. Обогащаем данные аналитикой
+        enriched_offers = self._enrich_with_analytics(all_offers, city)
+
+        return enriched_offers
+
+    def iter_source_batches(self, city: City, limit_per_source: int = 20) -> Iterator[List[Dict]]:
+        """
+        Предложения источников по мере получения: один пакет на источник
+
+        Аналитические данные добавляются, если реальных предложений мало.
+        """
         city_name = city.name
+        real_count = 0
 
-        # 1. Яндекс.Недвижимость (реальный парсинг)
-        if yandex_realty_parser.is_available:
+        # 1. Реальные источники (по умолчанию Яндекс.Недвижимость)
+        for source_name, parser in self.sources.items():
+            if not getattr(parser, 'is_available', True):
+                continue
             try:
-                logger.info(f"Парсинг реальных данных из Яндекс для {city_name}")
-                yandex_offers = yandex_realty_parser.get_rent_offers(
+                logger.info(f"Парсинг реальных данных из {source_name} для {city_name}")
+                source_offers = parser.get_rent_offers(
                     city_name=city_name,
                     limit=limit_per_source
                 )
 
-                for offer in yandex_offers:
+                for offer in source_offers:
                     offer['city'] = city
-                    offer['source'] = 'yandex_real'
-                    all_offers.append(offer)
-
-                logger.info(f"Получено {len(yandex_offers)} реальных предложений из Яндекс")
+                    offer['source'] = source_name
+                real_count += len(source_offers)
 
-                # Пауза между запросами
-                time.sleep(2)
+                logger.info(f"Получено {len(source_offers)} реальных предложений из {source_name}")
+                if source_offers:
+                    yield source_offers
 
             except Exception as e:
-                logger.error(f"Ошибка при парсинге Яндекс: {e}")
+                logger.error(f"Ошибка при парсинге {source_name}: {e}")
 
         # 2. Если реальных данных мало, добавляем реалистичные данные на основе статистики
-        if len(all_offers) < limit_per_source // 2:
+        if real_count < limit_per_source // 2:
             logger.info(f"Мало реальных данных для {city_name}, добавляем аналитические данные")
-            analytic_offers = self._generate_analytic_data(city, limit_per_source)
-            all_offers.extend(analytic_offers)
-
-        # 3. Обогащаем данные аналитикой
-        enriched_offers = self._enrich_with_analytics(all_offers, city)
-
-        return enriched_offers
+            yield self._generate_analytic_data(city, limit_per_source)
 
     def _generate_analytic_data(self, city: City, limit: int = 20) -> List[Dict]:
         """
@@ -250,38 +272,45 @@ class RealEstateDataCollector:
 
         return districts_map.get(city_name, ['Центральный', 'Северный', 'Южный', 'Западный', 'Восточный'])
 
-    def _enrich_with_analytics(self, offers: List[Dict], city: City) -> List[Dict]:
-        """Обогащение данных аналитической информацией"""
+    def _enrich_with_analytics(self, offers: List[Dict], city: City,
+                               baseline: Optional[Tuple[float, float]] = None) -> List[Dict]:
+        """
+        Обогащение данных аналитической информацией
+
+        baseline — средняя цена и средняя цена за м² рынка; по умолчанию
+        рассчитываются по самим предложениям.
+        """
         if not offers:
             return offers
 
-        # Рассчитываем статистику по предложениям
-        prices = [offer['price'] for offer in offers]
-        areas = [offer['area'] for offer in offers]
-
-        if prices and areas:
+        if baseline is None:
+            # Рассчитываем статистику по предложениям
+            prices = [offer['price'] for offer in offers]
+            areas = [offer['area'] for offer in offers]
             avg_price = sum(prices) / len(prices)
             avg_area = sum(areas) / len(areas)
-            avg_price_per_sqm = avg_price / avg_area if avg_area > 0 else 0
+            baseline = (avg_price, avg_price / avg_area if avg_area > 0 else 0)
+
+        avg_price, avg_price_per_sqm = baseline
 
-            # Добавляем аналитическую информацию к каждому предложению
-            for offer in offers:
-                if 'additional_info' not in offer:
-                    offer['additional_info'] = {}
+        # Добавляем аналитическую информацию к каждому предложению
+        for offer in offers:
+            if 'additional_info' not in offer:
+                offer['additional_info'] = {}
 
-                # Отклонение от средней цены
-                price_deviation = ((offer['price'] - avg_price) / avg_price * 100) if avg_price > 0 else 0
+            # Отклонение от средней цены
+            price_deviation = ((offer['price'] - avg_price) / avg_price * 100) if avg_price > 0 else 0
 
-                # Оценка привлекательности предложения
-                attractiveness = self._calculate_attractiveness_score(offer, avg_price_per_sqm)
+            # Оценка привлекательности предложения
+            attractiveness = self._calculate_attractiveness_score(offer, avg_price_per_sqm)
 
-                offer['additional_info'].update({
-                    'market_avg_price': round(avg_price, 2),
-                    'market_avg_price_per_sqm': round(avg_price_per_sqm, 2),
-                    'price_deviation_percent': round(price_deviation, 1),
-                    'attractiveness_score': round(attractiveness, 2),
-                    'data_quality': 'high' if offer['source'] == 'yandex_real' else 'analytic',
-                })
+            offer['additional_info'].update({
+                'market_avg_price': round(avg_price, 2),
+                'market_avg_price_per_sqm': round(avg_price_per_sqm, 2),
+                'price_deviation_percent': round(price_deviation, 1),
+                'attractiveness_score': round(attractiveness, 2),
+                'data_quality': 'high' if offer['source'] == 'yandex_real' else 'analytic',
+            })
 
         return offers
 
@@ -322,64 +351,253 @@ class RealEstateDataCollector:
 
         return max(0.1, min(1.0, score))  # Ограничиваем от 0.1 до 1.0
 
-    def save_offers_to_db(self, offers_data: List[Dict], city: City):
-        """Сохранение полученных предложений в базу данных"""
-        saved_count = 0
+    # Размер пакета для массовой записи предложений
+    SAVE_CHUNK_SIZE = 500
 
-        for offer_data in offers_data:
-            try:
-                # Генерируем external_id если его нет
-                if 'external_id' not in offer_data or not offer_data['external_id']:
-                    offer_data['external_id'] = f"{offer_data.get('source', 'unknown')}_{int(time.time())}_{saved_count}"
-
-                # Проверяем, не существует ли уже такое предложение
-                existing = MarketOffer.objects.filter(
-                    external_id=offer_data.get('external_id'),
-                    source=offer_data.get('source', 'unknown')
-                ).first()
-
-                if existing:
-                    # Обновляем существующее
-                    existing.price = Decimal(str(offer_data.get('price', 0)))
-                    existing.area = Decimal(str(offer_data.get('area', 0)))
-                    existing.is_active = offer_data.get('is_active', True)
-                    existing.parsed_date = offer_data.get('parsed_date', timezone.now())
-                    existing.additional_info = offer_data.get('additional_info', {})
-                    existing.save()
-                else:
-                    # Создаем новое
-                    MarketOffer.objects.create(
-                        city=city,
-                        source=offer_data.get('source', 'unknown'),
-                        external_id=offer_data.get('external_id', ''),
-                        address=offer_data.get('address', '')[:255],
-                        area=Decimal(str(offer_data.get('area', 0))),
-                        rooms=offer_data.get('rooms', 1),
-                        floor=offer_data.get('floor'),
-                        price=Decimal(str(offer_data.get('price', 0))),
-                        url=offer_data.get('url', ''),
-                        is_active=offer_data.get('is_active', True),
-                        parsed_date=offer_data.get('parsed_date', timezone.now()),
-                        additional_info=offer_data.get('additional_info', {})
-                    )
-                    saved_count += 1
+    # Поля, которые обновляются у изменившегося предложения (см. MarketOffer.CONTENT_HASH_FIELDS)
+    UPSERT_UPDATE_FIELDS = ['price', 'area', 'is_active', 'parsed_date', 'additional_info', 'content_hash', 'building']
 
+    def save_offers_to_db(self, offers_data: List[Dict], city: City) -> Dict[str, int]:
+        """
+        Сохранение полученных предложений в базу данных пакетными upsert-запросами
+
+        Returns:
+            Словарь со счетчиками inserted, updated, unchanged и failed
+        """
+        stats = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'failed': 0}
+
+        # Нормализуем данные и убираем повторы ключа внутри партии (последнее значение побеждает)
+        prepared = {}
+        for index, offer_data in enumerate(offers_data):
+            try:
+                offer = self._build_offer_instance(offer_data, city, index)
+                prepared[(offer.source, offer.external_id)] = offer
             except Exception as e:
-                logger.error(f"Ошибка сохранения предложения в БД: {e}")
+                logger.error(f"Ошибка подготовки предложения: {e}")
+                stats['failed'] += 1
+
+        offers = list(prepared.values())
+
+        with transaction.atomic():
+            for start in range(0, len(offers), self.SAVE_CHUNK_SIZE):
+                chunk_stats = self._upsert_offers_chunk(offers[start:start + self.SAVE_CHUNK_SIZE])
+                for key, value in chunk_stats.items():
+                    stats[key] += value
+
+        # Пакетная запись не вызывает сигналов моделей: счетчики сайта сбрасываем сами
+        if stats['inserted'] or stats['updated']:
+            site_stats.invalidate()
+
+        return stats
+
+    def _build_offer_instance(self, offer_data: Dict, city: City, index: int) -> MarketOffer:
+        """Преобразование словаря предложения в несохраненный экземпляр MarketOffer"""
+        source = offer_data.get('source', 'unknown')
+
+        # Генерируем external_id если его нет
+        external_id = offer_data.get('external_id')
+        if not external_id:
+            external_id = f"{source}_{int(time.time())}_{index}"
+
+        offer = MarketOffer(
+            city=city,
+            source=source,
+            external_id=str(external_id)[:100],
+            address=offer_data.get('address', '')[:255],
+            area=Decimal(str(offer_data.get('area', 0))).quantize(Decimal('0.01')),
+            rooms=offer_data.get('rooms', 1),
+            floor=offer_data.get('floor'),
+            price=Decimal(str(offer_data.get('price', 0))).quantize(Decimal('0.01')),
+            url=offer_data.get('url', ''),
+            is_active=offer_data.get('is_active', True),
+            parsed_date=offer_data.get('parsed_date', timezone.now()),
+            additional_info=offer_data.get('additional_info', {}),
+        )
+        # Координаты, если источник их отдает (иначе — очередь геокодирования);
+        # площадки ставят метку на дом, поэтому по умолчанию точность — дом
+        if offer_data.get('latitude') and offer_data.get('longitude'):
+            offer.latitude = Decimal(str(offer_data['latitude'])).quantize(Decimal('0.000001'))
+            offer.longitude = Decimal(str(offer_data['longitude'])).quantize(Decimal('0.000001'))
+            offer.location_precision = offer_data.get('location_precision', 'house')
+            offer.location_source = offer_data.get('location_source', 'listing')
+
+        offer.content_hash = offer.compute_content_hash()
+        return offer
+
+    def _upsert_offers_chunk(self, offers: List[MarketOffer]) -> Dict[str, int]:
+        """Один пакет: сверка хэшей с существующими записями и один upsert-запрос"""
+        stats = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+
+        # Существующие записи пакета одним запросом на каждый источник
+        keys_by_source = {}
+        for offer in offers:
+            keys_by_source.setdefault(offer.source, []).append(offer.external_id)
+
+        existing = {}
+        for source, external_ids in keys_by_source.items():
+            # Сравниваем только хэши, сами поля (в том числе JSON) не загружаем;
+            # is_active — отдельно: массовая деактивация не пересчитывает хэш
+            rows = MarketOffer.objects.filter(source=source, external_id__in=external_ids).values(
+                'id', 'external_id', 'content_hash', 'price', 'is_active'
+            )
+            for row in rows:
+                existing[(source, row['external_id'])] = row
+
+        # Дома пакета одним запросом; новое предложение сразу получает координаты
+        # уже геокодированного дома, а координаты из объявления уточняют дом
+        buildings = building_registry.resolve_many((offer.city_id, offer.address) for offer in offers)
+        buildings_by_id = {building.pk: building for building in buildings.values()}
+        listed = []
+        for offer in offers:
+            building = buildings.get((offer.city_id, offer.address))
+            offer.building = building
+            if building is None:
                 continue
+            if building_registry.more_precise(building, offer):
+                building_registry.copy_location(building, offer)
+            elif building_registry.more_precise(offer, building):
+                listed.append((building, offer))
+        refined = building_registry.adopt_locations(listed)
+
+        to_write = []
+        unchanged_ids = []
+        inserted_keys = {}
+        price_changes = []
+        for offer in offers:
+            row = existing.get((offer.source, offer.external_id))
+            if row is None:
+                stats['inserted'] += 1
+                to_write.append(offer)
+                inserted_keys.setdefault(offer.source, []).append(offer.external_id)
+            elif row['content_hash'] == offer.content_hash and row['is_active'] == offer.is_active:
+                stats['unchanged'] += 1
+                unchanged_ids.append(row['id'])
+            else:
+                stats['updated'] += 1
+                to_write.append(offer)
+                if row['price'] != offer.price:
+                    price_changes.append((row['id'], offer.city_id, offer.rooms, offer.price))
+
+        if to_write:
+            MarketOffer.objects.bulk_create(
+                to_write,
+                update_conflicts=True,
+                unique_fields=['source', 'external_id'],
+                update_fields=self.UPSERT_UPDATE_FIELDS,
+            )
+
+        # Уточненные по объявлениям дома делятся координатами с остальными предложениями
+        building_registry.propagate(refined)
+
+        # Новые предложения геокодируются воркером очереди (одно задание на дом),
+        # а не при сохранении; их начальная цена открывает историю цен
+        to_geocode_buildings = {}
+        for source, external_ids in inserted_keys.items():
+            to_geocode = []
+            for offer_id, city_id, rooms, price, address, latitude, building_id in MarketOffer.objects.filter(
+                source=source, external_id__in=external_ids
+            ).values_list('id', 'city_id', 'rooms', 'price', 'address', 'latitude', 'building_id'):
+                price_changes.append((offer_id, city_id, rooms, price))
+                if latitude is not None:
+                    continue
+                if building_id:
+                    to_geocode_buildings[building_id] = (building_id, city_id, buildings_by_id[building_id].address)
+                else:
+                    to_geocode.append((offer_id, city_id, address))
+            geocoding_queue.enqueue_many(GeocodingTask.KIND_MARKET_OFFER, to_geocode)
+        geocoding_queue.enqueue_many(GeocodingTask.KIND_BUILDING, to_geocode_buildings.values())
 
-        return saved_count
+        price_history.record_many(price_changes)
+
+        # Неизменившиеся предложения не перезаписываем, а одним запросом отмечаем как актуальные
+        if unchanged_ids:
+            MarketOffer.objects.filter(id__in=unchanged_ids).update(parsed_date=timezone.now())
+
+        return stats
 
     def update_market_data(self, city: City, limit_per_city: int = 30):
-        """Основной метод обновления рыночных данных для города"""
+        """
+        Основной метод обновления рыночных данных для города
+
+        Данные проходят потоковый конвейер (см. utils.ingestion_pipeline),
+        в статистике возвращаются и счетчики его этапов.
+        """
         logger.info(f"Обновление рыночных данных для {city.name}")
 
-        # 1. Получаем данные из реальных источников
-        offers = self.fetch_from_real_sources(city, limit_per_source=limit_per_city)
+        return IngestionPipeline(self, city, limit_per_source=limit_per_city).run()
+
+    def update_all_cities(self, cities, limit_per_city: int = 30, max_workers: int = None) -> List[Dict]:
+        """
+        Параллельное обновление рыночных данных по нескольким городам
+
+        Каждый город получает, нормализует и сохраняет данные независимо,
+        частота запросов к источникам ограничивается общим source_rate_limiter.
 
-        # 2. Сохраняем в базу
-        saved_count = self.save_offers_to_db(offers, city)
+        Args:
+            cities: Города для обновления
+            limit_per_city: Количество предложений на город
+            max_workers: Количество параллельных потоков (по умолчанию из настроек)
 
+        Returns:
+            Список результатов по городам: city, stats, error, fetch_seconds, store_seconds, total_seconds
+        """
+        cities = list(cities)
+        if max_workers is None:
+            max_workers = getattr(settings, 'MARKET_REFRESH_MAX_WORKERS', 4)
+        max_workers = max(1, min(max_workers, len(cities) or 1))
+
+        if max_workers == 1:
+            return [self._refresh_city(city, limit_per_city) for city in cities]
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='market-refresh') as executor:
+            futures = [executor.submit(self._refresh_city_in_thread, city, limit_per_city) for city in cities]
+            return [future.result() for future in futures]
+
+    def _refresh_city_in_thread(self, city: City, limit_per_city: int) -> Dict:
+        try:
+            return self._refresh_city(city, limit_per_city)
+        finally:
+            # У каждого потока свое подключение к БД, закрываем его по завершении
+            connections.close_all()
+
+    def _refresh_city(self, city: City, limit_per_city: int) -> Dict:
+        """Обновление одного города с замером времени этапов"""
+        result = {'city': city, 'stats': None, 'error': None, 'fetch_seconds': 0.0, 'store_seconds': 0.0}
+        started = time.monotonic()
+
+        try:
+            result['stats'] = self.update_market_data(city, limit_per_city)
+
+            # Этапы конвейера идут одновременно, поэтому время считаем по занятости этапов
+            stages = {stage['name']: stage for stage in result['stats']['stages']}
+            result['fetch_seconds'] = stages['fetch']['busy_seconds']
+            result['store_seconds'] = stages['persist']['busy_seconds'] + stages['aggregate']['busy_seconds']
+
+        except Exception as e:
+            logger.error(f"Ошибка обновления {city.name}: {e}")
+            result['error'] = str(e)
+
+        result['total_seconds'] = time.monotonic() - started
+        logger.info(
+            f"{city.name}: получение {result['fetch_seconds']:.1f} сек, "
+            f"сохранение {result['store_seconds']:.1f} сек, всего {result['total_seconds']:.1f} сек"
+        )
+        return result
+
+    def write_lock(self):
+        """Блокировка записи: SQLite допускает только одного писателя"""
+        if connection.vendor == 'sqlite':
+            return self._sqlite_write_lock
+        return nullcontext()
+
+    def store_market_data(self, city: City, offers: List[Dict]) -> Dict[str, int]:
+        """Сохранение, деактивация устаревших и пересчет сводок для одного города"""
+        with self.write_lock():
+            save_stats = self.save_offers_to_db(offers, city)
+            return self.finish_market_update(city, save_stats)
+
+    def finish_market_update(self, city: City, save_stats: Dict[str, int]) -> Dict[str, int]:
+        """Деактивация устаревших предложений и пересчет сводок после сохранения"""
         # 3. Деактивируем старые предложения (старше 14 дней для аналитических, 30 для реальных)
         old_date_analytic = timezone.now() - timezone.timedelta(days=14)
         old_date_real = timezone.now() - timezone.timedelta(days=30)
@@ -397,28 +615,36 @@ class RealEstateDataCollector:
             source='yandex_real',
             is_active=True
         ).update(is_active=False)
+        if deactivated:
+            site_stats.invalidate()
 
-        # 4. Генерируем аналитический отчет по обновлению
-        self._generate_update_report(city, saved_count, deactivated)
+        # 4. Связываем дубли одного объявления из разных источников
+        duplicates = 0
+        try:
+            duplicates = offer_deduplicator.cluster_city(city)['duplicates']
+        except Exception as e:
+            logger.error(f"Ошибка поиска дублей {city.name}: {e}")
+
+        # 5. Генерируем аналитический отчет по обновлению
+        self._generate_update_report(city, save_stats['inserted'], deactivated)
 
-        logger.info(f"Обновлено {city.name}: сохранено {saved_count} новых, деактивировано {deactivated} старых предложений")
-        return saved_count
+        logger.info(
+            f"Обновлено {city.name}: добавлено {save_stats['inserted']}, обновлено {save_stats['updated']}, "
+            f"без изменений {save_stats['unchanged']}, ошибок {save_stats['failed']}, "
+            f"деактивировано {deactivated} старых предложений, дублей {duplicates}"
+        )
+        return {**save_stats, 'deactivated': deactivated, 'duplicates': duplicates}
 
     def _generate_update_report(self, city: City, saved_count: int, deactivated_count: int):
-        """Генерация аналитического отчета по обновлению"""
+        """Предрассчет сводок рынка по городу после обновления"""
         try:
-            # Получаем текущую статистику
-            active_offers = MarketOffer.objects.filter(city=city, is_active=True)
-
-            if active_offers.exists():
-                # Создаем график распределения цен
-                chart_data = chart_generator.create_price_distribution_chart(
-                    active_offers,
-                    title=f"Распределение цен в {city.name} после обновления"
-                )
+            data_version = market_overview_builder.bump_data_version(city)
+            overviews = market_overview_builder.build_for_city(city, data_version)
 
-                # Можно сохранить chart_data в лог или временное хранилище
-                logger.info(f"Создан график распределения для {city.name}")
+            logger.info(
+                f"Сводки рынка для {city.name} обновлены до версии {data_version}: "
+                f"{len(overviews)} сегментов (добавлено {saved_count}, деактивировано {deactivated_count})"
+            )
 
         except Exception as e:
             logger.error(f"Ошибка генерации отчета: {e}")
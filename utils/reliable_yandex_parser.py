@@ -1,5 +1,5 @@
 
-import requests
+import hashlib
 import logging
 import time
 import json
@@ -7,20 +7,22 @@ from typing import List, Dict, Optional
 from datetime import datetime
 import re
 
+from .http_client import http_client
+from .listing_extractor import extract_listing_items, iter_chunks
+
 logger = logging.getLogger(__name__)
 
 
 class ReliableYandexRealtyParser:
 
     def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
+        self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Accept': 'application/json, text/plain, */*',
             'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
             'Referer': 'https://realty.yandex.ru/',
             'Origin': 'https://realty.yandex.ru',
-        })
+        }
 
     def get_rent_offers(self, city_name: str, rooms: str = "1,2,3", limit: int = 20) -> List[Dict]:
         """
@@ -68,22 +70,26 @@ class ReliableYandexRealtyParser:
             if not city_mapping:
                 return []
 
+            params = {
+                'type': 'RENT',
+                'category': 'APARTMENT',
+                'rgid': city_mapping['rgid'],
+                'roomsTotal': '1,2,3',
+                'page': 1,
+                'pageSize': min(limit, 50),
+            }
+
+            # Эндпоинты по очереди до первого рабочего, в пределах лимита частоты источника
             for endpoint in endpoints:
                 try:
-                    params = {
-                        'type': 'RENT',
-                        'category': 'APARTMENT',
-                        'rgid': city_mapping['rgid'],
-                        'roomsTotal': '1,2,3',
-                        'page': 1,
-                        'pageSize': min(limit, 50),
-                    }
-
                     logger.info(f"Пробуем API: {endpoint}")
-                    response = self.session.get(
+                    response = http_client.cached_get(
                         endpoint.format(city_mapping['rgid']) if '{}' in endpoint else endpoint,
                         params=params,
-                        timeout=10
+                        headers=self.headers,
+                        timeout=10,
+                        retries=0,
+                        rate_limit_key='yandex_real',
                     )
 
                     if response.status_code == 200:
@@ -109,7 +115,7 @@ class ReliableYandexRealtyParser:
             url = f"https://realty.yandex.ru/{city_mapping['slug']}/snyat/kvartira/"
 
             logger.info(f"Парсинг HTML: {url}")
-            response = self.session.get(url, timeout=10)
+            response = http_client.cached_get(url, headers=self.headers, timeout=10, rate_limit_key='yandex_real')
 
             if response.status_code == 200:
                 return self._parse_html_response(response.text, city_name, limit)
@@ -261,104 +267,94 @@ class ReliableYandexRealtyParser:
 
         return offers
 
-    def _parse_html_response(self, html: str, city_name: str, limit: int) -> List[Dict]:
-        """Парсинг HTML страницы"""
-        import re
+    def _parse_html_response(self, html, city_name: str, limit: int) -> List[Dict]:
+        """
+        Потоковый разбор HTML страницы (см. utils.listing_extractor)
 
+        Args:
+            html: Текст страницы или итератор ее кусков
+            city_name: Название города
+            limit: Максимальное количество предложений
+        """
         offers = []
+        cards = []
 
         try:
-            # Ищем JSON данные в скриптах
-            script_pattern = r'<script[^>]*>window\.__INITIAL_STATE__\s*=\s*({.*?})</script>'
-            match = re.search(script_pattern, html, re.DOTALL)
+            chunks = iter_chunks(html) if isinstance(html, str) else html
 
-            if match:
-                json_data = json.loads(match.group(1))
-                # Пытаемся извлечь предложения
-                offers = self._extract_from_json_state(json_data, city_name, limit)
+            for kind, item in extract_listing_items(chunks):
+                if kind == 'state':
+                    # Предложения из JSON состояния страницы приоритетнее карточек
+                    offer = self._extract_offer_data(item, city_name)
+                    if offer:
+                        offers.append(offer)
+                        if len(offers) >= limit:
+                            break
+                elif not offers and len(cards) < limit:
+                    cards.append(item)
 
-            # Если не нашли в JSON, пытаемся парсить HTML структуру
+            # Если не нашли в JSON, используем карточки из HTML структуры
             if not offers:
-                # Упрощенный парсинг HTML (для образовательных целей)
-                offer_pattern = r'data-testid="offer-card"[^>]*>.*?<a[^>]*href="([^"]*)"[^>]*>.*?<span[^>]*data-testid="offer-card__title"[^>]*>([^<]*)</span>.*?<span[^>]*data-testid="offer-card__price"[^>]*>([^<]*)</span>'
-                matches = re.findall(offer_pattern, html, re.DOTALL)
-
-                for match in matches[:limit]:
-                    try:
-                        url, title, price_text = match
-                        # Извлекаем цену
-                        price_match = re.search(r'(\d[\d\s]*)₽', price_text)
-                        if price_match:
-                            price = int(price_match.group(1).replace(' ', ''))
-
-                            # Пытаемся извлечить площадь и комнаты из заголовка
-                            rooms = 1
-                            area = 0
-
-                            if '1-к' in title:
-                                rooms = 1
-                            elif '2-к' in title:
-                                rooms = 2
-                            elif '3-к' in title:
-                                rooms = 3
-
-                            area_match = re.search(r'(\d+[,.]?\d*)\s*м²', title)
-                            if area_match:
-                                area = float(area_match.group(1).replace(',', '.'))
-
-                            if price > 0 and area > 0:
-                                offer = {
-                                    'source': 'html_parsed',
-                                    'external_id': f"html_{hash(url)}",
-                                    'city_name': city_name,
-                                    'address': title[:100],
-                                    'area': area,
-                                    'rooms': rooms,
-                                    'price': price,
-                                    'price_per_sqm': round(price / area, 2),
-                                    'url': f"https://realty.yandex.ru{url}" if url.startswith('/') else url,
-                                    'parsed_date': datetime.now(),
-                                    'additional_info': {
-                                        'parsing_method': 'html_regex',
-                                        'title': title[:200],
-                                    }
-                                }
-                                offers.append(offer)
-                    except:
-                        continue
+                for url, title, price_text in cards:
+                    offer = self._parse_html_card(url, title, price_text, city_name)
+                    if offer:
+                        offers.append(offer)
 
         except Exception as e:
             logger.error(f"Ошибка парсинга HTML: {e}")
 
         return offers
 
-    def _extract_from_json_state(self, data: dict, city_name: str, limit: int) -> List[Dict]:
-        """Извлечение данных из JSON состояния"""
-        offers = []
-
-        def search_in_dict(obj, path=""):
-            if isinstance(obj, dict):
-                # Ищем объекты, похожие на предложения
-                if all(key in obj for key in ['price', 'area', 'rooms']):
-                    try:
-                        offer = self._extract_offer_data(obj, city_name)
-                        if offer:
-                            offers.append(offer)
-                    except:
-                        pass
-
-                # Рекурсивно ищем в значениях
-                for key, value in obj.items():
-                    search_in_dict(value, f"{path}.{key}")
-
-            elif isinstance(obj, list):
-                for item in obj:
-                    search_in_dict(item, path)
+    def _parse_html_card(self, url: str, title: str, price_text: str, city_name: str) -> Optional[Dict]:
+        """Предложение из карточки offer-card (упрощенный разбор для образовательных целей)"""
+        try:
+            # Извлекаем цену
+            price_match = re.search(r'(\d[\d\s]*)₽', price_text)
+            if not price_match:
+                return None
+            price = int(re.sub(r'\s', '', price_match.group(1)))
+
+            # Пытаемся извлечить площадь и комнаты из заголовка
+            rooms = 1
+            area = 0
+
+            if '1-к' in title:
+                rooms = 1
+            elif '2-к' in title:
+                rooms = 2
+            elif '3-к' in title:
+                rooms = 3
+
+            area_match = re.search(r'(\d+[,.]?\d*)\s*м²', title)
+            if area_match:
+                area = float(area_match.group(1).replace(',', '.'))
+
+            if price > 0 and area > 0:
+                return {
+                    'source': 'html_parsed',
+                    'external_id': f"html_{self._stable_id(url)}",
+                    'city_name': city_name,
+                    'address': title[:100],
+                    'area': area,
+                    'rooms': rooms,
+                    'price': price,
+                    'price_per_sqm': round(price / area, 2),
+                    'url': f"https://realty.yandex.ru{url}" if url.startswith('/') else url,
+                    'parsed_date': datetime.now(),
+                    'additional_info': {
+                        'parsing_method': 'html_stream',
+                        'title': title[:200],
+                    }
+                }
+        except ValueError:
+            pass
 
-        # Начинаем поиск
-        search_in_dict(data)
+        return None
 
-        return offers[:limit]
+    @staticmethod
+    def _stable_id(text: str) -> str:
+        """Идентификатор, одинаковый между запусками (hash() строк случаен в каждом процессе)"""
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()
 
     def _extract_offer_data(self, item: dict, city_name: str) -> Optional[Dict]:
         """Извлечение данных предложения из объекта"""
@@ -389,7 +385,7 @@ class ReliableYandexRealtyParser:
             if price and area and address:
                 return {
                     'source': 'yandex_api',
-                    'external_id': f"yandex_{offer_id}" if offer_id else f"yandex_{hash(str(item))}",
+                    'external_id': f"yandex_{offer_id}" if offer_id else f"yandex_{self._stable_id(json.dumps(item, sort_keys=True, default=str))}",
                     'city_name': city_name,
                     'address': str(address)[:200],
                     'area': float(area),
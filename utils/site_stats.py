@@ -0,0 +1,58 @@
+"""
+Счетчики сайта для главной страницы: города, квартиры, активные предложения
+
+Считаются одним запросом (скалярные подзапросы COUNT в одном SELECT) и
+хранятся в кэше Django. Кэш сбрасывается при сохранении и удалении
+городов и квартир (analyzer.signals), после пакетной записи предложений
+(сборщик, архивация, загрузка из файлов) и при правке предложений в
+админке; TIMEOUT — страховка от изменений в обход всего этого.
+"""
+import logging
+from typing import Dict
+
+from django.core.cache import cache
+from django.db import connection
+
+from analyzer.models import Apartment, City, MarketOffer
+
+logger = logging.getLogger(__name__)
+
+
+class SiteStats:
+    """Кэшированные счетчики сайта"""
+
+    CACHE_KEY = 'analyzer:site_stats'
+    TIMEOUT = 10 * 60
+
+    def get(self) -> Dict[str, int]:
+        """Словарь cities, apartments, active_offers"""
+        stats = cache.get(self.CACHE_KEY)
+        if stats is None:
+            stats = self._count()
+            cache.set(self.CACHE_KEY, stats, self.TIMEOUT)
+        return stats
+
+    def invalidate(self):
+        cache.delete(self.CACHE_KEY)
+
+    def _count(self) -> Dict[str, int]:
+        """Все счетчики одним запросом"""
+        counters = {
+            'cities': City.objects.all(),
+            'apartments': Apartment.objects.all(),
+            'active_offers': MarketOffer.objects.filter(is_active=True),
+        }
+        parts, params = [], []
+        for name, queryset in counters.items():
+            sql, query_params = queryset.order_by().values('pk').query.sql_with_params()
+            parts.append(f"(SELECT COUNT(*) FROM ({sql}) AS {name}_rows) AS {name}")
+            params.extend(query_params)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT {', '.join(parts)}", params)
+            row = cursor.fetchone()
+        return dict(zip(counters, row))
+
+
+# Глобальный экземпляр
+site_stats = SiteStats()
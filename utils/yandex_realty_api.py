@@ -1,13 +1,14 @@
 """
 Модуль для получения реальных данных из Яндекс.Недвижимость
 """
-import requests
 import json
 import logging
 from typing import List, Dict, Optional
 from datetime import datetime
 import time
 
+from .http_client import http_client
+
 logger = logging.getLogger(__name__)
 
 
@@ -27,13 +28,12 @@ class YandexRealtyAPI:
     }
 
     def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
+        self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
             'Accept': 'application/json',
             'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
             'Referer': 'https://realty.yandex.ru/',
-        })
+        }
 
     def get_rent_offers(self, city_name: str, rooms: str = "1,2,3", limit: int = 20) -> List[Dict]:
         """
@@ -67,7 +67,7 @@ class YandexRealtyAPI:
 
             logger.info(f"Запрос Яндекс.Недвижимость для {city_name} (rgid: {region_id})")
 
-            response = self.session.get(self.BASE_URL, params=params, timeout=15)
+            response = http_client.cached_get(self.BASE_URL, params=params, headers=self.headers, timeout=15)
 
             if response.status_code == 200:
                 return self._parse_yandex_response(response.json(), city_name, limit)
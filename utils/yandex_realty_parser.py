@@ -3,6 +3,7 @@ import time
 from typing import List, Dict, Optional
 from datetime import datetime, timedelta
 from decimal import Decimal
+from .rate_limiter import source_rate_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -76,6 +77,8 @@ class YandexRealtyParser:
                 params['page'] = page
 
                 try:
+                    # Общий для всех потоков лимит запросов к Яндексу
+                    source_rate_limiter.wait('yandex_real')
                     logger.info(f"Парсинг страницы {page} для {city_name}")
 
                     # Используем библиотеку для парсинга
@@ -96,9 +99,6 @@ class YandexRealtyParser:
                             logger.debug(f"Ошибка конвертации предложения: {e}")
                             continue
 
-                    # Пауза между запросами
-                    time.sleep(1)
-
                 except Exception as e:
                     logger.error(f"Ошибка парсинга страницы {page}: {e}")
                     break